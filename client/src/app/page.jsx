@@ -17,6 +17,19 @@ const LOADING_STATES = [
   { message: "Finding matches...", icon: <span className="w-8 h-8">🔍</span> }
 ]
 
+// Snippet text with the query terms highlighted; highlights are [start, end) character offsets
+const renderSnippet = (snippet) => {
+  const parts = []
+  let position = 0
+  snippet.highlights.forEach(([start, end]) => {
+    parts.push(snippet.text.slice(position, start))
+    parts.push(<mark key={start} className="bg-yellow-300 bg-opacity-40 text-white">{snippet.text.slice(start, end)}</mark>)
+    position = end
+  })
+  parts.push(snippet.text.slice(position))
+  return parts
+}
+
 const BASIC_QUESTIONS = [
   "Who directed the film?",
   "What is the main plot?",
@@ -100,13 +113,15 @@ export default function FilmSearch() {
     currentPage: 1,
     isSearched: false,
     isLoading: false,
-    pageFilmIdObject: {}, // Stores film objects by page
+    searchCursor: null, // Cursor of the ranked results kept by the search service
     totalPages: 0 // Tracks total number of pages
   });
   
   
   const [chatState, setChatState] = useState({
     selectedFilm: null,
+    isFilmLoaded: false, // The selected film is the full film object, not just its result card
+    filmLoadFailed: false,
     history: [],
     message: '',
     isTyping: false,
@@ -188,7 +203,7 @@ export default function FilmSearch() {
       const filmList = response.data.filmList
       setSearchState(prev => ({
         ...prev,
-        pageFilmIdObject: response.data.filmobjects, // Stores the film objects by page
+        searchCursor: response.data.cursor, // Other pages are fetched with this cursor
         results: filmList,
         totalResults: Object.keys(response.data.filmList).reduce((acc, page) => acc + response.data.filmList[page].length, 0),
         currentPage: 1,
@@ -208,15 +223,15 @@ export default function FilmSearch() {
     setSearchState(prev => ({ ...prev, isLoading: true }));
     
     try {
-      // Access pageFilmIdObject from the current searchState
-      const { pageFilmIdObject } = searchState;
+      // Access the search cursor from the current searchState
+      const { searchCursor } = searchState;
   
       // Fetch data for the selected page from the backend
       const response = await axios.post(
         process.env.NEXT_PUBLIC_PAGEQUERY_API,
         {
           pageNumber: page,
-          filmobjectlist: pageFilmIdObject
+          cursor: searchCursor
         }
       );
   
@@ -231,13 +246,26 @@ export default function FilmSearch() {
       setSearchState(prev => ({ ...prev, isLoading: false }));
     }
   };
+
+  // Open a film: the result card only has a few fields, so the full film object is loaded now.
+  // Chat stays disabled until it has loaded, so questions are never answered from the card alone
+  const handleOpenFilm = async (film) => {
+    setChatState(prev => ({ ...prev, selectedFilm: film, isFilmLoaded: false, filmLoadFailed: false }))
+    try {
+      const response = await axios.post(process.env.NEXT_PUBLIC_FILMDETAILS_API, { filmid: film.id })
+      setChatState(prev => (prev.selectedFilm && prev.selectedFilm.id === film.id ? { ...prev, selectedFilm: response.data, isFilmLoaded: true } : prev))
+    } catch (error) {
+      console.error("Error loading film details:", error)
+      setChatState(prev => (prev.selectedFilm && prev.selectedFilm.id === film.id ? { ...prev, filmLoadFailed: true } : prev))
+    }
+  }
   
   
 
   // Chat handler
   const handleChat = async (e) => {
     e.preventDefault();
-    if (!chatState.message.trim()) return;
+    if (!chatState.message.trim() || !chatState.isFilmLoaded) return;
     
     const newMessage = { sender: 'user', text: chatState.message };
     setChatState(prev => ({
@@ -400,7 +428,7 @@ export default function FilmSearch() {
           >
             <div className="grid gap-8 grid-cols-1 md:grid-cols-2 lg:grid-cols-3">
             {searchState.results.map((film) => (
-            <motion.div key={film.id} className="bg-white bg-opacity-10 rounded-lg overflow-hidden shadow-lg cursor-pointer hover:scale-105 transition-transform duration-300" onClick={() => setChatState(prev => ({ ...prev, selectedFilm: film }))}>
+            <motion.div key={film.id} className="bg-white bg-opacity-10 rounded-lg overflow-hidden shadow-lg cursor-pointer hover:scale-105 transition-transform duration-300" onClick={() => handleOpenFilm(film)}>
              <div className="relative aspect-[2/3] w-full">
               <Image src={film.poster || "/film.jpg"} alt={film.title} layout="fill" objectFit="cover" />
             </div>
@@ -409,6 +437,7 @@ export default function FilmSearch() {
              <p className="text-gray-300 text-sm">Director: {film.film_details["directed_by"]}</p>
              <p className="text-gray-300 text-sm">Language: {film.film_details['language']}</p>
              <p className="text-gray-300 text-sm">Country: {film.film_details['country']}</p>
+             {film.snippet && <p className="text-gray-400 text-sm mt-2">{renderSnippet(film.snippet)}</p>}
             </div>
             </motion.div>
               ))}
@@ -597,14 +626,19 @@ export default function FilmSearch() {
                             handleChat(e)
                           }
                         }}
-                        placeholder="Ask me about this film..."
+                        disabled={!chatState.isFilmLoaded}
+                        placeholder={
+                          chatState.isFilmLoaded ? "Ask me about this film..."
+                            : chatState.filmLoadFailed ? "Could not load this film's details. Close it and try again."
+                            : "Loading film details..."
+                        }
                       />
                       <motion.button
                         className="absolute right-2 top-2 bg-white text-black rounded-lg p-2 focus:outline-none hover:bg-gray-300 transition-colors duration-300"
                         whileHover={{ scale: 1.05 }}
                         whileTap={{ scale: 0.95 }}
                         type="submit"
-                        disabled={chatState.isTyping}
+                        disabled={chatState.isTyping || !chatState.isFilmLoaded}
                       >
                         <Search className="w-6 h-6" />
                       </motion.button>
@@ -0,0 +1,57 @@
+import os
+import sys
+import time
+import resource
+import argparse
+
+# Run from anywhere: the search engine modules live one directory up
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sentenceencoder import ONNX_MODEL_DIR, PARITY_TEXTS, load_encoder, read_parity_texts
+
+
+def max_rss_mb():
+    # ru_maxrss is in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def throughput(model, texts, batch_size, repeats):
+    """Best texts/second over `repeats` passes of encoding `texts` in batches of `batch_size`."""
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for i in range(0, len(texts), batch_size):
+            model.encode(texts[i:i + batch_size], batch_size=batch_size)
+        best = min(best, time.perf_counter() - start)
+    return len(texts) / best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare PyTorch and int8 ONNX sentence encoder throughput.")
+    parser.add_argument('--backends', nargs='+', default=['torch', 'onnx'], choices=['torch', 'onnx'])
+    parser.add_argument('--onnx-directory', default=ONNX_MODEL_DIR)
+    parser.add_argument('--input-file', help="JSONL films whose field texts are encoded (short built-in queries by default)")
+    parser.add_argument('--samples', type=int, default=256)
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 8, 32])
+    parser.add_argument('--repeats', type=int, default=3)
+    args = parser.parse_args()
+
+    if args.input_file:
+        texts = read_parity_texts(args.input_file, args.samples)
+    else:
+        texts = (PARITY_TEXTS * (args.samples // len(PARITY_TEXTS) + 1))[:args.samples]
+
+    # Run one backend per process for a fair memory figure: max RSS only ever grows
+    print(f"{len(texts)} texts")
+    print(f"{'backend':8} {'load s':>7} {'RSS MB':>7} " + " ".join(f"{'batch ' + str(b):>10}" for b in args.batch_sizes) + "  (texts/s)")
+    for backend in args.backends:
+        start = time.perf_counter()
+        model = load_encoder(backend, args.onnx_directory)
+        load_seconds = time.perf_counter() - start
+        model.encode(texts[:8])  # Warm up
+        rates = [throughput(model, texts, batch_size, args.repeats) for batch_size in args.batch_sizes]
+        print(f"{backend:8} {load_seconds:7.2f} {max_rss_mb():7.0f} " + " ".join(f"{rate:10.1f}" for rate in rates))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+import json
+import time
+import argparse
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+# A mix of cheap and expensive (high-df) queries
+DEFAULT_QUERIES = [
+    "tamil film",
+    "tamil comedy film",
+    "film directed by tamil director",
+    "tamil films with songs and action",
+    "heist thriller",
+    "romantic comedy wedding",
+]
+
+
+def post(url, payload, timeout):
+    """(HTTP status, seconds) of one POST; status 0 for connection errors and timeouts."""
+    request = urllib.request.Request(url, data=json.dumps(payload).encode('utf-8'),
+                                     headers={'Content-Type': 'application/json'})
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            response.read()
+            status = response.status
+    except urllib.error.HTTPError as e:
+        status = e.code
+    except (urllib.error.URLError, TimeoutError):
+        status = 0
+    return status, time.perf_counter() - start
+
+
+def run_level(url, payloads, concurrency, timeout):
+    """Send every payload with `concurrency` clients; returns (wall seconds, [(status, seconds)])."""
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as clients:
+        results = list(clients.map(lambda payload: post(url, payload, timeout), payloads))
+    return time.perf_counter() - start, results
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))] if values else float('nan')
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure /search throughput and latency as concurrent clients increase.")
+    parser.add_argument('--url', default='http://localhost:8000/search')
+    parser.add_argument('--queries', nargs='+', default=DEFAULT_QUERIES)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument('--requests', type=int, default=200, help="requests sent at each concurrency level")
+    parser.add_argument('--k', type=int, default=18)
+    parser.add_argument('--timeout', type=float, default=30)
+    args = parser.parse_args()
+
+    payloads = [{'query': args.queries[i % len(args.queries)], 'k': args.k} for i in range(args.requests)]
+    # Warm up the index, the caches and the encoder
+    run_level(args.url, payloads[:len(args.queries)], 1, args.timeout)
+
+    print(f"{'clients':>7} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7}")
+    for concurrency in args.concurrency:
+        wall, results = run_level(args.url, payloads, concurrency, args.timeout)
+        latencies = [seconds * 1000 for status, seconds in results if status == 200]
+        errors = sum(1 for status, _ in results if status != 200)
+        print(f"{concurrency:7} {len(latencies) / wall:8.1f} {percentile(latencies, 0.5):8.1f} "
+              f"{percentile(latencies, 0.95):8.1f} {percentile(latencies, 0.99):8.1f} {errors:7}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+import os
+import sys
+import json
+import time
+import random
+import argparse
+
+# Run from anywhere: the search engine modules live one directory up
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from docstore import DOCSTORE_DIR, DocStore, film_object
+from snippets import CARD_FIELDS, film_card, query_terms
+
+
+def timed(build, repeats):
+    """Best seconds over `repeats` runs of building and serializing a page, and the payload size."""
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        payload = json.dumps(build()).encode('utf-8')
+        best = min(best, time.perf_counter() - start)
+    return best, len(payload)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare result pages of full film objects with projected cards and snippets.")
+    parser.add_argument('--directory', default=DOCSTORE_DIR)
+    parser.add_argument('--query', default="tamil comedy film")
+    parser.add_argument('--page-size', type=int, default=18)
+    parser.add_argument('--pages', type=int, default=50)
+    parser.add_argument('--repeats', type=int, default=5)
+    args = parser.parse_args()
+
+    store = DocStore(args.directory)
+    doc_ids = [doc_id for doc_id in range(store.manifest['max_doc_id'] + 1) if store.get(doc_id, fields=['title']) is not None]
+    terms = query_terms(args.query)
+    rng = random.Random(0)
+    pages = [rng.sample(doc_ids, min(args.page_size, len(doc_ids))) for _ in range(args.pages)]
+
+    def full_page(page):
+        return [film_object(doc_id, document) for doc_id, document in zip(page, store.get_many(page))]
+
+    def card_page(page):
+        return [film_card(doc_id, document, CARD_FIELDS, terms) for doc_id, document in zip(page, store.get_many(page))]
+
+    print(f"{args.pages} pages of {args.page_size} films, query {args.query!r}")
+    print(f"{'response':24} {'avg bytes':>10} {'avg ms':>8}")
+    for name, build in [("full film objects", full_page), ("cards + snippets", card_page)]:
+        results = [timed(lambda: build(page), args.repeats) for page in pages]
+        seconds = sum(s for s, _ in results) / len(results)
+        size = sum(b for _, b in results) / len(results)
+        print(f"{name:24} {size:10.0f} {seconds * 1000:8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+import os
+import sys
+import io
+import time
+import resource
+import argparse
+import importlib
+import contextlib
+
+# Run from anywhere: the search engine modules live one directory up
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def rss_mb():
+    """Current resident set size; peak RSS where /proc is not available."""
+    try:
+        with open('/proc/self/status', 'r') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Time each stage of a cold start and report RSS after it. Run in a fresh process."
+    )
+    parser.add_argument('--query', default="tamil comedy film")
+    args = parser.parse_args()
+
+    stages = [
+        ("import numpy", lambda: importlib.import_module('numpy')),
+        ("import search_engine (index, catalog)", lambda: importlib.import_module('search_engine')),
+        ("import filmchat_engine (zone matrix)", lambda: importlib.import_module('filmchat_engine')),
+        ("import main (app, no model)", lambda: importlib.import_module('main')),
+        ("load encoder", lambda: importlib.import_module('sentenceencoder').get_encoder()),
+        ("first encode", lambda: importlib.import_module('main').query_encoder.encode(args.query)),
+        ("first search", lambda: importlib.import_module('search_engine').search(args.query, None, 18)),
+        ("second search", lambda: importlib.import_module('search_engine').search(args.query, None, 18)),
+    ]
+
+    print(f"{'stage':40} {'seconds':>8} {'total s':>8} {'RSS MB':>8}")
+    print(f"{'(interpreter)':40} {'':8} {'':8} {rss_mb():8.0f}")
+    total = 0.0
+    for name, stage in stages:
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):  # The engines log to stdout
+            stage()
+        seconds = time.perf_counter() - start
+        total += seconds
+        print(f"{name:40} {seconds:8.3f} {total:8.3f} {rss_mb():8.0f}")
+
+
+if __name__ == "__main__":
+    main()
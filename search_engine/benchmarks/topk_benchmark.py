@@ -0,0 +1,55 @@
+import os
+import sys
+import io
+import time
+import contextlib
+import argparse
+
+# Run from anywhere: the search engine modules live one directory up
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from search_engine import queryprocessor, get_search_results
+
+# High-df terms dominate scoring cost, so the default queries are built around them
+DEFAULT_QUERIES = [
+    "tamil film",
+    "tamil comedy film",
+    "film directed by tamil director",
+    "tamil films with songs and action",
+]
+
+
+def time_query(word_list, k, repeats):
+    """Median wall time in ms of get_search_results, with the engine's logging silenced."""
+    timings = []
+    results = []
+    for _ in range(repeats):
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            results = get_search_results(word_list, None, k)
+            timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return timings[len(timings) // 2], results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare full ranking against top-k (MaxScore) retrieval.")
+    parser.add_argument('queries', nargs='*', default=DEFAULT_QUERIES)
+    parser.add_argument('--k', type=int, default=18, help="page size to retrieve (18 films per page on the client)")
+    parser.add_argument('--repeats', type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{'query':45} {'full ms':>9} {'top-k ms':>9} {'speedup':>8}  same top-k")
+    for query in args.queries:
+        with contextlib.redirect_stdout(io.StringIO()):
+            word_list = queryprocessor(query)
+        # Warm the postings cache so both modes measure scoring, not fetching
+        time_query(word_list, None, 1)
+        full_ms, full_results = time_query(word_list, None, args.repeats)
+        top_ms, top_results = time_query(word_list, args.k, args.repeats)
+        speedup = full_ms / top_ms if top_ms else float('inf')
+        print(f"{query[:45]:45} {full_ms:9.2f} {top_ms:9.2f} {speedup:7.1f}x  {full_results[:args.k] == top_results}")
+
+
+if __name__ == "__main__":
+    main()
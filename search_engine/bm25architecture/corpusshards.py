@@ -0,0 +1,59 @@
+import os
+
+# Bytes read at a time when counting lines
+CHUNK_SIZE = 1 << 24
+
+
+def count_lines(file_path, start, end):
+    """Number of newlines in file_path[start:end]."""
+    count = 0
+    with open(file_path, 'rb') as f:
+        f.seek(start)
+        remaining = end - start
+        while remaining > 0:
+            chunk = f.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            count += chunk.count(b'\n')
+            remaining -= len(chunk)
+    return count
+
+
+def shard_corpus(file_path, num_shards):
+    """
+    Split a JSONL file into at most num_shards byte ranges that start and end on line
+    boundaries. Returns [(start, end, line number of the first line)], line numbers 1-based
+    like the docIDs the index builders assign.
+    """
+    size = os.path.getsize(file_path)
+    boundaries = [0]
+    with open(file_path, 'rb') as f:
+        for i in range(1, num_shards):
+            position = max(size * i // num_shards, boundaries[-1])
+            if position > 0:
+                # Move to the start of the first line beginning at or after position
+                f.seek(position - 1)
+                f.readline()
+                position = f.tell()
+            boundaries.append(min(position, size))
+    boundaries.append(size)
+
+    shards = []
+    first_line = 1
+    for start, end in zip(boundaries, boundaries[1:]):
+        if start < end:
+            shards.append((start, end, first_line))
+            first_line += count_lines(file_path, start, end)
+    return shards or [(0, size, 1)]
+
+
+def read_lines(file_path, start=0, end=None, first_line=1):
+    """Yield (line number, line bytes) for every line that starts in file_path[start:end]."""
+    with open(file_path, 'rb') as f:
+        f.seek(start)
+        position = start
+        for line_number, line in enumerate(f, first_line):
+            if end is not None and position >= end:
+                break
+            yield line_number, line
+            position += len(line)
@@ -1,12 +1,30 @@
 import json
 from bm25config import supabase
-from sklearn.metrics.pairwise import cosine_similarity
 import numpy as np
-from vectormodel import model
+from vectormodel import get_encoder
 import ast
 from collections import defaultdict
 import math
 import re
+import os
+import sys
+
+# statscatalog.py lives one level up, next to the search engine
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from statscatalog import load_stats_catalog
+from zonevectors import cosine_similarity, load_zone_matrix
+from docstore import DOCSTORE_DIR, load_doc_store
+
+# Zone importances, zone lengths and idf from the catalog tfidfindexcreator.py writes, loaded
+# once; without it they are fetched with RPCs
+catalog = load_stats_catalog(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'statscatalog'))
+
+# Row-normalized zone embeddings written by zonedetailscreate.py; without them each zone
+# vector is fetched with get_zone_vector
+zone_matrix = load_zone_matrix(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'zone_embeddings'))
+
+# Compressed local copy of allfilms.jsonl (docstore.py); without it each title is fetched with get_film_title
+doc_store = load_doc_store(DOCSTORE_DIR)
 
 # BM25 Hyperparameters
 k1 = 1.5  # Term frequency saturation
@@ -23,12 +41,12 @@ def queryprocessor(query):
 
 # Function to compare 2 vectors and return similarity score
 def similarity_score(raw_vector1, raw_vector2):
-    vector1 = np.array(raw_vector1)
-    vector2 = np.array(raw_vector2)
-    return round(float(cosine_similarity([vector1], [vector2])[0][0]), 4)
+    return cosine_similarity(raw_vector1, raw_vector2)
 
 # Function to get avg_doc_length for a specific zone
 def get_avg_doc_length(zone_name):
+    if catalog is not None:
+        return catalog.avg_doc_length(zone_name)
     response = supabase.rpc('get_zone_avglength', {'zone_name': zone_name}).execute()
     if response.data:
         return float(response.data)
@@ -91,6 +109,12 @@ def get_top_idf_terms(word_list, overall_zone_score_dict):
     # Calculate cumulative IDF score for each term across zones
     for word, zone_boosts in overall_zone_score_dict.items():
         cumulative_idf = 0
+        if catalog is not None:
+            # No need to fetch the postings just for their idf
+            for zone_name, boost_score in zone_boosts.items():
+                cumulative_idf += catalog.idf(word, zone_name) * boost_score
+            term_idf_scores[word] = cumulative_idf
+            continue
         for zone_name, boost_score in zone_boosts.items():
             tfidf_response = supabase.rpc('get_tf_idf', params={
                 't_name': zone_name,
@@ -120,12 +144,17 @@ def get_top_idf_terms(word_list, overall_zone_score_dict):
 
 # Main search function with adaptive ratio and iterative filtering
 def get_search_results(word_list, user_query):
-    query_vector = model.encode(user_query)
+    query_vector = get_encoder().encode(user_query)
     overall_zone_score_dict = {}
+    # Similarity of the query to every zone, one matrix-vector product for the whole query
+    zone_similarities = zone_matrix.similarities(query_vector) if zone_matrix is not None else None
 
     for word in word_list:
-        zone_importance_response = supabase.rpc('get_zonei_score', params={'search_term': word}).execute()
-        zone_importance_dict = zone_importance_response.data
+        if catalog is not None:
+            zone_importance_dict = catalog.zone_importance(word)
+        else:
+            zone_importance_response = supabase.rpc('get_zonei_score', params={'search_term': word}).execute()
+            zone_importance_dict = zone_importance_response.data
         
         # Check if zone_importance_dict is None
         if not zone_importance_dict:
@@ -138,6 +167,12 @@ def get_search_results(word_list, user_query):
 
         zone_vector_dict = {}
         for zone_name in sorted_zone_importance:
+            if zone_similarities is not None:
+                if zone_name in zone_similarities:
+                    zone_vector_dict[zone_name] = zone_similarities[zone_name]
+                else:
+                    print(f"Skipping zone '{zone_name}' due to missing vector data.")
+                continue
             zone_vector_response = supabase.rpc('get_zone_vector', params={'zone_name': zone_name}).execute()
             
             if zone_vector_response.data:
@@ -182,6 +217,9 @@ def get_search_results(word_list, user_query):
         final_film_dict_withscores = initial_filtered_scores
 
     final_film_list = list(final_film_dict_withscores.keys())
+    if doc_store is not None:
+        # One batched local read for all the titles
+        return [document and document.get('title') for document in doc_store.get_many(final_film_list, fields=['title'])]
     film_titles = []
     for film_id in final_film_list:
         title_response = supabase.rpc('get_film_title', params={'filmid': film_id}).execute()
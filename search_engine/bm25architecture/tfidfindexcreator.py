@@ -1,10 +1,23 @@
 import json
 from collections import defaultdict, Counter
+import heapq
 import math
 import re
 import os
 import csv
+import sys
+import argparse
+import tempfile
+import time
 import logging
+from multiprocessing import Pool
+import numpy as np
+from corpusshards import shard_corpus, read_lines
+
+# indexsegment.py and statscatalog.py live one level up, next to the search engine
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from indexsegment import SegmentWriter, zone_impact_scale, IMPACT_DTYPES
+from statscatalog import write_stats_catalog, zone_importance_scores, ZONE_IMPORTANCE_EPSILON, ZONE_IMPORTANCE_MAX_SCORE
 
 # Configure logging
 logging.basicConfig(
@@ -17,104 +30,338 @@ logging.basicConfig(
 k1 = 1.5  # Term frequency saturation
 b = 0.75  # Length normalization factor
 
-def get_unique_fields(file_path):
-    """Extract all unique field names from the JSONL input."""
-    fields_set = set()
-    with open(file_path, 'r') as f_r:
-        for line_num, line in enumerate(f_r, 1):
-            try:
-                item = json.loads(line)
-                fields_set.update(item.keys())
-            except json.JSONDecodeError as e:
-                logging.error(f"JSON Decode Error on line {line_num}: {str(e)}")
-                print(f"Error on line {line_num}. Check jsonl_errors.log for details.")
-                continue
-    return list(fields_set)
-
-def process_field(zone, input_file, output_file):
-    """
-    Process each field (zone) to create a BM25-based index stored as CSV.
-    Format: term, {filmid: tf, ...}, idf
-    """
-    field_dict_list = []  # Store documents containing the zone
-    total_zone_length = 0  # Track total length for avg_doc_length
-
-    # Step 1: Collect all relevant documents and their zone content
-    with open(input_file, 'r') as f:
-        docID = 0
-        for line_num, line in enumerate(f, 1):
-            try:
-                docID += 1
-                document = json.loads(line)
-                if zone in document and document[zone] is not None:
-                    zone_content = document[zone].lower().split()
-                    field_dict_list.append({
-                        "docID": docID,
-                        "zone_content": zone_content
-                    })
-                    total_zone_length += len(zone_content)  # Accumulate zone length
-            except json.JSONDecodeError as e:
-                logging.error(f"JSON Decode Error on line {line_num}: {str(e)}")
-                print(f"Error on line {line_num}. Check jsonl_errors.log for details.")
-                continue
-
-    # Step 2: Calculate the average document length for the zone
-    avg_doc_length = total_zone_length / len(field_dict_list)
-
-    # Step 3: Create a term dictionary to store TF and IDF values
-    term_dict = defaultdict(lambda: defaultdict(float))
-    N = len(field_dict_list)  # Total number of documents in this zone
-
-    # Step 4: Calculate BM25-based TF values for each term in each document
-    for field_dict in field_dict_list:
-        docID = field_dict["docID"]
-        zone_content = field_dict["zone_content"]
-        L_d = len(zone_content)  # Length of the current zone's content
-
-        tf_counter = Counter(zone_content)  # Term frequencies for the current zone
-
-        for term, freq in tf_counter.items():
-            # Calculate BM25-based TF
-            tf = round((freq * (k1 + 1)) / (freq + k1 * (1 - b + b * (L_d / avg_doc_length))),6)
-            term_dict[term][docID] = tf  # Store TF for this docID
-
-    # Step 5: Calculate IDF for each term and store the final results in CSV
-    with open(output_file, 'w', newline='') as f_w:
+# Postings buffered in memory before a run is spilled to disk
+MAX_RUN_POSTINGS = 2_000_000
+
+# Width of the quantized BM25 impacts stored in the segments (localindex.py --impact-bits)
+IMPACT_BITS = 16
+
+
+def clean_zone_name(zone):
+    """Clean a field name for use as its CSV/segment filename."""
+    return "_".join(re.split('[ /]', zone.lower()))
+
+def document_zones(document):
+    """
+    {cleaned zone: tokens} for one document. Fields whose cleaned names collide ("Box office",
+    "box office") keep the last one in sorted order, as indexwriter.tokenize_document does.
+    """
+    zones = {}
+    for field, value in sorted(document.items()):
+        if value is not None:
+            zones[clean_zone_name(field)] = value.lower().split()
+    return zones
+
+def read_documents(file_path, start=0, end=None, first_docID=1):
+    """
+    Yield (docID, document) for every line of the JSONL input that starts in [start, end);
+    docIDs are 1-based line numbers.
+    """
+    for docID, line in read_lines(file_path, start, end, first_docID):
+        try:
+            yield docID, json.loads(line)
+        except json.JSONDecodeError as e:
+            logging.error(f"JSON Decode Error on line {docID}: {str(e)}")
+            print(f"Error on line {docID}. Check jsonl_errors.log for details.")
+
+def sorted_run(postings):
+    """Yield an in-memory run as (zone, term, [(docID, freq, length), ...]) in (zone, term) order."""
+    for zone in sorted(postings):
+        for term in sorted(postings[zone]):
+            yield zone, term, postings[zone][term]
+
+def sorted_doc_lengths(doc_lengths):
+    """Yield in-memory zone lengths as (zone, docID, length) in (zone, docID) order."""
+    for zone in sorted(doc_lengths):
+        for docID, length in doc_lengths[zone]:
+            yield zone, docID, length
+
+def write_run(run_path, postings, doc_lengths):
+    """
+    Spill one in-memory run to disk, sorted so runs can be merged by (zone, term):
+    <run_path>.terms.csv holds zone, term, number of postings
+    <run_path>.postings.npy holds the (docID, freq, zone length) rows of every term in that order
+    <run_path>.lengths.csv holds zone, docID, zone length
+    """
+    rows = []
+    with open(f'{run_path}.terms.csv', 'w', newline='') as f_w:
         writer = csv.writer(f_w)
-        for term, doc_dict in term_dict.items():
-            n_t = len(doc_dict)  # Number of documents containing the term
-            idf = round(math.log2((N - n_t + 0.5) / (n_t + 0.5) + 1),6)  # BM25 IDF formula
+        for zone, term, term_postings in sorted_run(postings):
+            writer.writerow([zone, term, len(term_postings)])
+            rows.extend(term_postings)
+    np.save(f'{run_path}.postings.npy', np.array(rows, dtype=np.int64).reshape(-1, 3))
+    with open(f'{run_path}.lengths.csv', 'w', newline='') as f_w:
+        csv.writer(f_w).writerows(sorted_doc_lengths(doc_lengths))
+
+def build_runs(input_file, run_directory, max_run_postings=MAX_RUN_POSTINGS, shard=(0, None, 1), run_name='run'):
+    """
+    Step 1: One streaming pass over the corpus (SPIMI). Every zone of a document is
+    tokenized and counted together; postings go into a per-run dictionary which is
+    written to disk as a sorted run once it holds max_run_postings postings. The last
+    run stays in memory and is merged with the spilled ones directly.
+    shard is the (start byte, end byte, first docID) range of the corpus to index.
+    Zones are keyed by their cleaned names (see document_zones).
+    Returns (run paths, last run's postings, last run's zone lengths,
+    {zone: [documents, total length]}, largest docID).
+    """
+    run_paths = []
+    zone_stats = defaultdict(lambda: [0, 0])
+    postings = defaultdict(lambda: defaultdict(list))
+    doc_lengths = defaultdict(list)
+    run_size = 0
+    total_docs = 0
 
-            # Convert the doc_dict to a JSON string for storage
-            tf_dict_str = json.dumps(doc_dict)  # Store {filmid: tf, ...} as JSON string
+    def spill():
+        run_path = os.path.join(run_directory, f'{run_name}{len(run_paths):05d}')
+        write_run(run_path, postings, doc_lengths)
+        run_paths.append(run_path)
+        postings.clear()
+        doc_lengths.clear()
 
-            # Write the term, its TF dictionary, and the IDF value to the CSV
-            writer.writerow([term, tf_dict_str, round(idf, 3)])
+    for docID, document in read_documents(input_file, *shard):
+        total_docs = docID
+        for zone, zone_content in document_zones(document).items():
+            L_d = len(zone_content)
+            zone_stats[zone][0] += 1
+            zone_stats[zone][1] += L_d
+            doc_lengths[zone].append((docID, L_d))
+            tf_counter = Counter(zone_content)  # Term frequencies for the current zone
+            for term, freq in tf_counter.items():
+                postings[zone][term].append((docID, freq, L_d))
+            run_size += len(tf_counter)
+        if run_size >= max_run_postings:
+            spill()
+            run_size = 0
 
-    print(f'Created BM25 index for {zone}.')
+    return run_paths, postings, doc_lengths, dict(zone_stats), total_docs
 
-# Main execution
-input_file = './filmdata/allfilms.jsonl'
+def build_shard_runs(task):
+    """Worker: index one corpus shard and spill all of its runs, including the last one."""
+    input_file, run_directory, max_run_postings, shard_number, shard = task
+    run_name = f'shard{shard_number:03d}_run'
+    run_paths, postings, doc_lengths, zone_stats, total_docs = build_runs(
+        input_file, run_directory, max_run_postings, shard, run_name
+    )
+    if postings or doc_lengths:
+        run_path = os.path.join(run_directory, f'{run_name}{len(run_paths):05d}')
+        write_run(run_path, postings, doc_lengths)
+        run_paths.append(run_path)
+    return run_paths, zone_stats, total_docs
+
+def read_run(run_path, zones=None):
+    """Yield a spilled run's postings in the same shape as sorted_run, optionally only for `zones`."""
+    # Plain ndarray view of the memory map: slicing a np.memmap per term is much slower
+    rows = np.asarray(np.load(f'{run_path}.postings.npy', mmap_mode='r'))
+    position = 0
+    with open(f'{run_path}.terms.csv', 'r', newline='') as f:
+        for zone, term, num_postings in csv.reader(f):
+            end = position + int(num_postings)
+            if zones is None or zone in zones:
+                yield zone, term, rows[position:end]
+            position = end
+
+def read_run_doc_lengths(run_path):
+    with open(f'{run_path}.lengths.csv', 'r', newline='') as f:
+        for zone, docID, length in csv.reader(f):
+            yield zone, int(docID), length
+
+def merge_doc_lengths(doc_length_runs, doclength_directory):
+    """Step 2: Merge the runs' zone lengths into bm25doclengths/<zone>.csv (docID, length)."""
+    f_w, current_zone = None, None
+    for zone, docID, length in heapq.merge(*doc_length_runs, key=lambda row: (row[0], row[1])):
+        if zone != current_zone:
+            if f_w is not None:
+                f_w.close()
+            f_w = open(os.path.join(doclength_directory, f'{zone}.csv'), 'w', newline='')
+            writer = csv.writer(f_w)
+            current_zone = zone
+        writer.writerow([docID, length])
+    if f_w is not None:
+        f_w.close()
+
+def merged_term_postings(runs):
+    """
+    Yield (zone, term, docIDs, freqs, lengths) in (zone, term) order across all runs,
+    with the three posting columns as int64 arrays.
+    """
+    # heapq.merge is stable, and runs hold consecutive docID ranges, so docIDs stay ascending
+    merged = heapq.merge(*runs, key=lambda row: (row[0], row[1]))
+    current_key, parts = None, []
 
-# Step 6: Get unique fields from the input file
-fields_list = get_unique_fields(input_file)
+    def merged_columns():
+        rows = np.concatenate([np.asarray(part, dtype=np.int64).reshape(-1, 3) for part in parts])
+        return rows[:, 0], rows[:, 1], rows[:, 2]
 
-# Step 7: Create the directory for storing indexes
-directory = os.path.join(os.path.dirname(__file__), 'bm25indexdata')
+    for zone, term, term_postings in merged:
+        if (zone, term) != current_key:
+            if parts:
+                yield (*current_key, *merged_columns())
+            current_key, parts = (zone, term), []
+        parts.append(term_postings)
+    if parts:
+        yield (*current_key, *merged_columns())
 
-# Create the directory if it doesn't exist
-if not os.path.exists(directory):
-    os.makedirs(directory)
+def read_zone_doc_lengths(doclength_file):
+    """The (docID, length) rows merge_doc_lengths wrote for one zone, as arrays."""
+    with open(doclength_file, 'r', newline='') as f:
+        rows = np.array([(int(docID), int(length)) for docID, length in csv.reader(f)], dtype=np.int64).reshape(-1, 2)
+    return rows[:, 0], rows[:, 1]
 
-# Step 8: List all existing files in the directory to avoid reprocessing
-file_names = [file.replace('.csv', '') for file in os.listdir(directory) if file.endswith('.csv')]
+def write_zone_indexes(runs, zone_stats, directory, doclength_directory, segment_directory, impact_bits=IMPACT_BITS):
+    """
+    Step 3: Merge the runs term by term and write every zone's BM25 index.
+    CSV format: term, {filmid: tf, ...}, idf
+    The raw term frequencies go to bm25segments/<zone>.seg (see indexsegment.py) together
+    with the zone lengths and the quantized impact (idf x saturated tf) of every posting.
+    Returns {zone: (terms, document frequencies, occurrences)} for the stats catalog.
+    """
+    f_w, segment_writer, current_zone = None, None, None
+    zone_terms = {}
+    # One impact scale for all zones, from the largest one, as the local index reads them
+    impact_scale = zone_impact_scale(max((N for N, _ in zone_stats.values()), default=0), impact_bits)
+
+    def close_zone():
+        if f_w is not None:
+            f_w.close()
+            segment_writer.close()
+            print(f'Created BM25 index for {current_zone}.')
+
+    for zone, term, doc_ids, freqs, lengths in merged_term_postings(runs):
+        N, total_zone_length = zone_stats[zone]  # Documents in this zone and their total length
+        avg_doc_length = total_zone_length / N
+        if zone != current_zone:
+            close_zone()
+            f_w = open(os.path.join(directory, f'{zone}.csv'), 'w', newline='')
+            writer = csv.writer(f_w)
+            segment_writer = SegmentWriter(os.path.join(segment_directory, f'{zone}.seg'),
+                                           *read_zone_doc_lengths(os.path.join(doclength_directory, f'{zone}.csv')),
+                                           impact_scale, impact_bits)
+            terms, dfs, occurrences = [], [], []
+            zone_terms[zone] = terms, dfs, occurrences
+            current_zone = zone
 
-# Step 9: Find zones that haven't been processed yet
-missing_items = [item for item in fields_list if item not in file_names]
-missing_items.sort()
+        # BM25-based TF for each document, saturated with the document's zone length
+        tfs = (freqs * (k1 + 1)) / (freqs + k1 * (1 - b + b * (lengths / avg_doc_length)))
+        tfs = [round(tf, 6) for tf in tfs.tolist()]
+        doc_dict = dict(zip(doc_ids.tolist(), tfs))
 
-# Step 10: Process each missing zone and generate its BM25 index
-for zone in missing_items:
-    zone_cleaned = "_".join(re.split('[ /]', zone.lower()))  # Clean zone name for filename
-    output_file = os.path.join(directory, f'{zone_cleaned}.csv')
-    process_field(zone, input_file, output_file)
+        n_t = len(doc_dict)  # Number of documents containing the term
+        idf = round(math.log2((N - n_t + 0.5) / (n_t + 0.5) + 1),6)  # BM25 IDF formula
+
+        # Write the term, its {filmid: tf, ...} JSON and the IDF value to the CSV
+        writer.writerow([term, json.dumps(doc_dict), round(idf, 3)])
+        segment_writer.add(term, doc_ids, freqs)
+        terms.append(term)
+        dfs.append(n_t)
+        occurrences.append(int(freqs.sum()))
+    close_zone()
+    return zone_terms
+
+def write_stats(zone_terms, zone_stats, directory,
+                epsilon=ZONE_IMPORTANCE_EPSILON, max_score=ZONE_IMPORTANCE_MAX_SCORE):
+    """
+    Step 4: Score every (term, zone) pair from the document frequencies and occurrence
+    counts gathered while the zones were written, and store the scores, dfs and zone
+    statistics as the stats catalog (see statscatalog.py) query planning loads at startup.
+    Zone importance: see statscatalog.zone_importance_scores (indexwriter.py rescores the
+    terms of every commit with it).
+    """
+    word_counts = Counter()
+    for terms, _, occurrences in zone_terms.values():
+        word_counts.update(dict(zip(terms, occurrences)))
+
+    zone_names = sorted(zone_terms)
+    term_rows = defaultdict(list)
+    for zone_id, zone in enumerate(zone_names):
+        terms, dfs, _ = zone_terms[zone]
+        scores = zone_importance_scores(dfs, [word_counts[term] for term in terms], len(terms), epsilon, max_score)
+        for term, score, df in zip(terms, scores, dfs):
+            term_rows[term].append((zone_id, score, df))
+    rows = sorted(((term.encode('utf-8'), entries) for term, entries in term_rows.items()), key=lambda row: row[0])
+    write_stats_catalog(directory, int(time.time()),
+                        [(zone, *zone_stats[zone]) for zone in zone_names], rows)
+    print(f'Created the stats catalog for {len(rows)} terms in {len(zone_names)} zones.')
+
+def write_zone_group(task):
+    """Worker: merge the runs of one group of zones and write their indexes."""
+    run_paths, zones, zone_stats, directory, doclength_directory, segment_directory, impact_bits = task
+    runs = [read_run(run_path, zones) for run_path in run_paths]
+    return write_zone_indexes(runs, zone_stats, directory, doclength_directory, segment_directory, impact_bits)
+
+def build_index_parallel(input_file, base_directory, run_directory, max_run_postings, workers, impact_bits=IMPACT_BITS):
+    """
+    Parallel build: the corpus is split into one shard per worker, shards are indexed into
+    runs in a process pool, and the zones are then merged and written in the pool as well.
+    Runs are merged in shard order, so docIDs stay ascending and every output file is
+    byte-identical to the serial build.
+    """
+    shards = shard_corpus(input_file, workers)
+    tasks = [(input_file, run_directory, max_run_postings, i, shard) for i, shard in enumerate(shards)]
+
+    with Pool(workers) as pool:
+        run_paths = []
+        zone_stats = defaultdict(lambda: [0, 0])
+        total_docs = 0
+        for shard_run_paths, shard_zone_stats, shard_total_docs in pool.map(build_shard_runs, tasks):
+            run_paths.extend(shard_run_paths)
+            for zone, (num_docs, total_length) in shard_zone_stats.items():
+                zone_stats[zone][0] += num_docs
+                zone_stats[zone][1] += total_length
+            total_docs = max(total_docs, shard_total_docs)
+        zone_stats = dict(zone_stats)
+        print(f'Indexed {total_docs} documents into {len(run_paths)} runs from {len(shards)} shards.')
+
+        merge_doc_lengths([read_run_doc_lengths(run_path) for run_path in run_paths],
+                          os.path.join(base_directory, 'bm25doclengths'))
+
+        # One zone per task, the largest first to keep the workers busy
+        zones = sorted(zone_stats, key=lambda zone: -zone_stats[zone][1])
+        group_tasks = [
+            (run_paths, {zone}, zone_stats, os.path.join(base_directory, 'bm25indexdata'),
+             os.path.join(base_directory, 'bm25doclengths'), os.path.join(base_directory, 'bm25segments'), impact_bits)
+            for zone in zones
+        ]
+        zone_terms = {}
+        for group_zone_terms in pool.imap_unordered(write_zone_group, group_tasks):
+            zone_terms.update(group_zone_terms)
+
+    write_stats(zone_terms, zone_stats, os.path.join(base_directory, 'statscatalog'))
+
+def build_index(input_file, base_directory, max_run_postings=MAX_RUN_POSTINGS, workers=1, impact_bits=IMPACT_BITS):
+    """Build bm25indexdata, bm25doclengths, bm25segments and the stats catalog for input_file."""
+    directory = os.path.join(base_directory, 'bm25indexdata')
+    doclength_directory = os.path.join(base_directory, 'bm25doclengths')
+    segment_directory = os.path.join(base_directory, 'bm25segments')
+    for path in (directory, doclength_directory, segment_directory):
+        os.makedirs(path, exist_ok=True)
+
+    # Runs are spilled next to the output so they land on the same disk
+    with tempfile.TemporaryDirectory(dir=base_directory, prefix='bm25runs') as run_directory:
+        if workers > 1:
+            build_index_parallel(input_file, base_directory, run_directory, max_run_postings, workers, impact_bits)
+            return
+
+        run_paths, postings, doc_lengths, zone_stats, total_docs = build_runs(input_file, run_directory, max_run_postings)
+        print(f'Indexed {total_docs} documents into {len(run_paths) + 1} runs.')
+        merge_doc_lengths([read_run_doc_lengths(run_path) for run_path in run_paths] + [sorted_doc_lengths(doc_lengths)],
+                          doclength_directory)
+
+        runs = [read_run(run_path) for run_path in run_paths] + [sorted_run(postings)]
+        zone_terms = write_zone_indexes(runs, zone_stats, directory, doclength_directory, segment_directory, impact_bits)
+
+    write_stats(zone_terms, zone_stats, os.path.join(base_directory, 'statscatalog'))
+
+
+# Main execution
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the BM25 index for every zone in one pass over the corpus.")
+    parser.add_argument('--input-file', default='./filmdata/allfilms.jsonl')
+    parser.add_argument('--max-run-postings', type=int, default=MAX_RUN_POSTINGS,
+                        help="postings held in memory (per worker) before a sorted run is spilled to disk")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="processes used to index corpus shards and write zones in parallel")
+    parser.add_argument('--impact-bits', type=int, choices=sorted(IMPACT_DTYPES), default=IMPACT_BITS,
+                        help="width of the quantized impacts stored in bm25segments")
+    args = parser.parse_args()
+    build_index(args.input_file, os.path.dirname(os.path.abspath(__file__)), args.max_run_postings, args.workers,
+                args.impact_bits)
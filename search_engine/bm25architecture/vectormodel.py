@@ -1,4 +1,9 @@
-from sentence_transformers import SentenceTransformer
+import os
+import sys
 
-# Load a small, fast SBERT model
-model = SentenceTransformer('all-MiniLM-L6-v2')
\ No newline at end of file
+# sentenceencoder.py lives one level up, next to the search engine
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from sentenceencoder import MODEL_NAME, get_encoder
+
+# The shared sentence encoder (PyTorch, or the int8 ONNX export with ENCODER_BACKEND=onnx).
+# Call get_encoder() where it is needed: importing this module does not load the model.
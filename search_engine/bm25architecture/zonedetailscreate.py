@@ -1,49 +1,96 @@
 import os
+import sys
 import csv
 import json
+import argparse
 from collections import defaultdict
-from vectormodel import model
+from vectormodel import get_encoder, MODEL_NAME
 
-# Path to the JSONL file with all films
-allfilms_path = os.path.join(os.path.dirname(__file__), 'allfilms.jsonl')
+# embeddingstore.py and zonevectors.py live one level up, next to the search engine
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from embeddingstore import ENCODE_BATCH_SIZE, encode_batched, encode_embedding_store
+from zonevectors import write_zone_matrix
 
-# Output CSV path
-output_csv = os.path.join(os.path.dirname(__file__), 'zone_embeddings_with_avg_doc_length.csv')
+script_directory = os.path.dirname(os.path.abspath(__file__))
 
-# Step 1: Collect all unique fields and calculate avg_doc_length for each field
-field_lengths = defaultdict(list)  # Dictionary to store lengths for each field
 
-# Read through all films and aggregate lengths for each field
-with open(allfilms_path, 'r') as f:
-    for line in f:
-        film = json.loads(line)
-        
+def read_films(allfilms_path):
+    """Yield (docID, film) for every line of the JSONL file; docIDs are 1-based line numbers like the index uses."""
+    with open(allfilms_path, 'r') as f:
+        for docID, line in enumerate(f, start=1):
+            yield docID, json.loads(line)
+
+
+def zone_avg_doc_lengths(allfilms_path):
+    # Step 1: Collect all unique fields and calculate avg_doc_length for each field
+    field_lengths = defaultdict(list)  # Dictionary to store lengths for each field
+
+    # Read through all films and aggregate lengths for each field
+    for _, film in read_films(allfilms_path):
         # Iterate over each field and calculate its length in words
         for field, content in film.items():
             if content:  # Ensure the field has content
                 word_count = len(content.split())  # Word count for the field
                 field_lengths[field].append(word_count)  # Append length to the field list
 
-# Calculate avg_doc_length for each field
-avg_doc_lengths = {field: sum(lengths) / len(lengths) for field, lengths in field_lengths.items()}
+    # Calculate avg_doc_length for each field
+    return {field: sum(lengths) / len(lengths) for field, lengths in field_lengths.items()}
+
+
+def write_zone_details(avg_doc_lengths, output_csv, batch_size):
+    # Step 2: Generate vector embeddings for every field name in batches, then write results to CSV
+    zone_names = [field.replace("/", "_") for field in avg_doc_lengths]  # Replace slashes in field name with underscores
+    print(f"Encoding {len(zone_names)} field names")
+    zone_embeddings = [vector for batch in encode_batched(get_encoder(), zone_names, batch_size) for vector in batch]
+
+    with open(output_csv, mode='w', newline='') as file:
+        writer = csv.writer(file)
+        # Write the header
+        writer.writerow(['id', 'zone_name', 'zone_vector', 'avg_doc_length'])
 
-# Step 2: Generate vector embeddings and write results to CSV
-with open(output_csv, mode='w', newline='') as file:
-    writer = csv.writer(file)
-    # Write the header
-    writer.writerow(['id', 'zone_name', 'zone_vector', 'avg_doc_length'])
+        # Write the ID, cleaned field name, its embedding (as a list for the Supabase table), and avg_doc_length
+        for idx, (zone_name, embedding, avg_length) in enumerate(zip(zone_names, zone_embeddings, avg_doc_lengths.values()), start=1):
+            writer.writerow([idx, zone_name, embedding.tolist(), avg_length])
+
+    print(f'CSV file with embeddings and avg_doc_length created at {output_csv}')
+
+    # Step 3: The same embeddings as a memory-mapped, row-normalized store keyed by zone name, so
+    # the search and film chat engines score every zone against a query with one matrix-vector product
+    zone_directory = os.path.join(script_directory, 'zone_embeddings')
+    write_zone_matrix(zone_directory, zone_names, zone_embeddings, MODEL_NAME)
+    print(f'Zone embedding store written to {zone_directory}')
+
+
+def film_field_texts(allfilms_path):
+    """Yield ('<docID>/<zone name>', text) for every non-empty field of every film."""
+    for docID, film in read_films(allfilms_path):
+        for field, content in film.items():
+            if content:
+                yield f'{docID}/{field.replace("/", "_")}', content
 
-    # Iterate through each unique field, calculate its embedding, and retrieve avg_doc_length
-    for idx, (field, avg_length) in enumerate(avg_doc_lengths.items(), start=1):
-        print(f"Processing field: {field}")  # Logging the field being processed
 
-        # Replace slashes in field name with underscores
-        zone_name_cleaned = field.replace("/", "_")
+def write_film_field_embeddings(allfilms_path, batch_size):
+    # Optional: embed the text of every film field, streamed in batches into a memory-mapped store
+    film_directory = os.path.join(script_directory, 'film_embeddings')
+    ids = [id_ for id_, _ in film_field_texts(allfilms_path)]
+    print(f"Encoding {len(ids)} film fields")
+    texts = (text for _, text in film_field_texts(allfilms_path))
+    encode_embedding_store(film_directory, ids, texts, get_encoder(), MODEL_NAME, batch_size)
+    print(f'Film field embedding store written to {film_directory}')
 
-        # Generate the vector embedding for the field name
-        embedding = model.encode(zone_name_cleaned).tolist()  # Convert to list for CSV storage
 
-        # Write the ID, cleaned field name, its embedding, and avg_doc_length to the CSV
-        writer.writerow([idx, zone_name_cleaned, embedding, avg_length])
+# Execution
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compute zone lengths and embeddings for the search and film chat engines.")
+    # Path to the JSONL file with all films
+    parser.add_argument('--input-file', default=os.path.join(script_directory, 'allfilms.jsonl'))
+    # Output CSV path
+    parser.add_argument('--output-file', default=os.path.join(script_directory, 'zone_embeddings_with_avg_doc_length.csv'))
+    parser.add_argument('--batch-size', type=int, default=ENCODE_BATCH_SIZE, help="texts per model.encode call")
+    parser.add_argument('--film-fields', action='store_true',
+                        help="also embed every film's field texts into film_embeddings/")
+    args = parser.parse_args()
 
-print(f'CSV file with embeddings and avg_doc_length created at {output_csv}')
+    write_zone_details(zone_avg_doc_lengths(args.input_file), args.output_file, args.batch_size)
+    if args.film_fields:
+        write_film_field_embeddings(args.input_file, args.batch_size)
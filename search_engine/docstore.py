@@ -0,0 +1,281 @@
+"""
+Local document store: every film of allfilms.jsonl, compressed, readable by docID without
+touching the database.
+
+Directory layout:
+    manifest.json      version, codec, documents per block, document count, largest docID
+    dictionary.bin     zstd dictionary trained on the documents (absent if training failed)
+    blocks.bin         zstd-compressed blocks, concatenated
+    block_offsets.npy  int64[num_blocks + 1]  block i is blocks.bin[block_offsets[i]:block_offsets[i + 1]]
+    doc_index.npy      int32[max_doc_id + 1, 2]  (block, slot) of each docID, (-1, -1) if absent
+
+A block decompresses to
+    uint32 count | uint32 offsets[count + 1] | count compact JSON documents
+so a docID is found with two array lookups and one block decompression. Documents are
+flat: 'title', 'poster' and every other field under its cleaned zone name, plus the token
+offsets of each field under '_token_offsets' for snippets (snippets.py).
+
+    python docstore.py build bm25architecture/allfilms.jsonl docstore [--posters posters.jsonl]
+"""
+
+import os
+import sys
+import json
+import mmap
+import struct
+import base64
+import re
+import argparse
+import threading
+import numpy as np
+from localindex import clean_zone_name
+
+MANIFEST_FILE = 'manifest.json'
+DOCSTORE_VERSION = 1
+
+# Documents per compressed block: small blocks keep a random lookup to a few KB of decompression
+BLOCK_DOCS = 16
+COMPRESSION_LEVEL = 10
+DICTIONARY_SIZE = 64 * 1024
+# Documents sampled to train the dictionary
+DICTIONARY_SAMPLES = 5000
+
+# Tokens as the search engine splits them (re.split(r'\W+', text.lower()))
+TOKEN_RE = re.compile(r'\w+')
+TOKEN_OFFSETS_KEY = '_token_offsets'
+
+# Where `python docstore.py build ...` writes the store by default
+DOCSTORE_DIR = os.environ.get('FILMSEARCH_DOCSTORE_DIR', os.path.join(os.path.dirname(__file__), 'docstore'))
+
+
+def encode_token_offsets(text):
+    """
+    Token spans of `text`, stored as (gap since the previous token's end, token length) pairs:
+    uint16 when every value fits, uint32 otherwise, base64 after a one-letter dtype code.
+    """
+    pairs = []
+    previous_end = 0
+    for match in TOKEN_RE.finditer(text):
+        pairs.extend((match.start() - previous_end, match.end() - match.start()))
+        previous_end = match.end()
+    dtype = np.uint16 if not pairs or max(pairs) < 1 << 16 else np.uint32
+    return np.dtype(dtype).char + base64.b64encode(np.array(pairs, dtype=dtype).tobytes()).decode('ascii')
+
+
+def decode_token_offsets(encoded):
+    """(num_tokens, 2) int64 array of [start, end) character offsets."""
+    pairs = np.frombuffer(base64.b64decode(encoded[1:]), dtype=np.dtype(encoded[0])).astype(np.int64).reshape(-1, 2)
+    ends = np.cumsum(pairs[:, 0] + pairs[:, 1])
+    return np.stack([ends - pairs[:, 1], ends], axis=1)
+
+
+def film_document(film, poster=None):
+    """The stored form of one allfilms.jsonl record."""
+    document = {'title': film.get('title'), 'poster': poster}
+    offsets = {}
+    for field, content in film.items():
+        if field != 'title' and content:
+            zone = clean_zone_name(field)
+            document[zone] = content
+            if isinstance(content, str):
+                offsets[zone] = encode_token_offsets(content)
+    document[TOKEN_OFFSETS_KEY] = offsets
+    return document
+
+
+def film_object(doc_id, document):
+    """The shape the client renders (as get_film_object returns it): id, title, poster, film_details."""
+    return {
+        'id': doc_id,
+        'title': document.get('title'),
+        'poster': document.get('poster'),
+        'film_details': {
+            field: content for field, content in document.items() if field not in ('title', 'poster', TOKEN_OFFSETS_KEY)
+        }
+    }
+
+
+def read_posters(posters_path):
+    """{film title: poster url} from a JSONL file of {"filmname", "poster_url"} records (postersurl.py's input)."""
+    posters = {}
+    with open(posters_path, 'r') as f:
+        for line in f:
+            record = json.loads(line)
+            if 'noposter' not in record['poster_url']:
+                posters[record['filmname']] = record['poster_url']
+    return posters
+
+
+def encode_block(documents):
+    payloads = [json.dumps(document, separators=(',', ':'), ensure_ascii=False).encode('utf-8') for document in documents]
+    offsets = [0]
+    for payload in payloads:
+        offsets.append(offsets[-1] + len(payload))
+    return struct.pack(f'<I{len(offsets)}I', len(payloads), *offsets) + b''.join(payloads)
+
+
+def build_doc_store(input_file, directory, posters=None, first_doc_id=1, block_docs=BLOCK_DOCS, level=COMPRESSION_LEVEL):
+    """Write a document store for a JSONL file; docIDs are line numbers starting at first_doc_id, like the index."""
+    import zstandard
+
+    posters = posters or {}
+    doc_ids, documents = [], []
+    with open(input_file, 'r') as f:
+        for doc_id, line in enumerate(f, start=first_doc_id):
+            try:
+                film = json.loads(line)
+            except json.JSONDecodeError:
+                print(f"Skipping line {doc_id}: invalid JSON")
+                continue
+            doc_ids.append(doc_id)
+            documents.append(film_document(film, posters.get(film.get('title'))))
+
+    os.makedirs(directory, exist_ok=True)
+    dictionary = None
+    samples = [encode_block(documents[i:i + 1]) for i in range(0, len(documents), max(1, len(documents) // DICTIONARY_SAMPLES))]
+    try:
+        dictionary = zstandard.train_dictionary(DICTIONARY_SIZE, samples, level=level)
+    except zstandard.ZstdError:
+        # Too few or too small samples; blocks are compressed without a dictionary
+        pass
+    dictionary_path = os.path.join(directory, 'dictionary.bin')
+    if dictionary is not None:
+        with open(dictionary_path, 'wb') as f_w:
+            f_w.write(dictionary.as_bytes())
+    elif os.path.exists(dictionary_path):
+        os.remove(dictionary_path)
+    compressor = zstandard.ZstdCompressor(level=level, dict_data=dictionary)
+
+    max_doc_id = doc_ids[-1] if doc_ids else 0
+    doc_index = np.full((max_doc_id + 1, 2), -1, dtype=np.int32)
+    block_offsets = [0]
+    with open(os.path.join(directory, 'blocks.bin'), 'wb') as f_w:
+        for block, start in enumerate(range(0, len(documents), block_docs)):
+            block_ids = doc_ids[start:start + block_docs]
+            doc_index[block_ids, 0] = block
+            doc_index[block_ids, 1] = np.arange(len(block_ids))
+            compressed = compressor.compress(encode_block(documents[start:start + block_docs]))
+            f_w.write(compressed)
+            block_offsets.append(block_offsets[-1] + len(compressed))
+    np.save(os.path.join(directory, 'block_offsets.npy'), np.array(block_offsets, dtype=np.int64))
+    np.save(os.path.join(directory, 'doc_index.npy'), doc_index)
+
+    manifest = {
+        'version': DOCSTORE_VERSION,
+        'codec': 'zstd',
+        'dictionary': dictionary is not None,
+        'block_docs': block_docs,
+        'num_docs': len(documents),
+        'max_doc_id': max_doc_id,
+        'uncompressed_bytes': sum(len(encode_block([document])) for document in documents),
+        'compressed_bytes': block_offsets[-1]
+    }
+    path = os.path.join(directory, MANIFEST_FILE)
+    with open(path + '.tmp', 'w') as f_w:
+        json.dump(manifest, f_w)
+    os.replace(path + '.tmp', path)
+    return manifest
+
+
+class DocStore:
+    """Memory-mapped reader; get_many() decompresses each needed block once."""
+
+    def __init__(self, directory):
+        import zstandard
+
+        self.directory = directory
+        with open(os.path.join(directory, MANIFEST_FILE), 'r') as f:
+            self.manifest = json.load(f)
+        if self.manifest['version'] != DOCSTORE_VERSION or self.manifest['codec'] != 'zstd':
+            raise ValueError(f"Unsupported document store in {directory}: {self.manifest}")
+        self.block_offsets = np.load(os.path.join(directory, 'block_offsets.npy'))
+        self.doc_index = np.load(os.path.join(directory, 'doc_index.npy'), mmap_mode='r')
+        self.dictionary = None
+        if self.manifest['dictionary']:
+            with open(os.path.join(directory, 'dictionary.bin'), 'rb') as f:
+                self.dictionary = zstandard.ZstdCompressionDict(f.read())
+        self._zstandard = zstandard
+        self._local = threading.local()  # zstd decompressors are not thread-safe
+        with open(os.path.join(directory, 'blocks.bin'), 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if self.block_offsets[-1] else b''
+
+    def __len__(self):
+        return self.manifest['num_docs']
+
+    def _decompressor(self):
+        decompressor = getattr(self._local, 'decompressor', None)
+        if decompressor is None:
+            decompressor = self._zstandard.ZstdDecompressor(dict_data=self.dictionary)
+            self._local.decompressor = decompressor
+        return decompressor
+
+    def _location(self, doc_id):
+        if not 0 <= doc_id <= self.manifest['max_doc_id']:
+            return None
+        block, slot = self.doc_index[doc_id].tolist()
+        return None if block < 0 else (block, slot)
+
+    def get_many(self, doc_ids, fields=None):
+        """
+        Documents of `doc_ids` in the order given (None for unknown docIDs), restricted to
+        `fields` when given. Each block is read and decompressed once however many of the
+        documents it holds.
+        """
+        by_block = {}
+        for i, doc_id in enumerate(doc_ids):
+            location = self._location(int(doc_id))
+            if location is not None:
+                by_block.setdefault(location[0], []).append((i, location[1]))
+
+        documents = [None] * len(doc_ids)
+        decompressor = self._decompressor()
+        for block, wanted in by_block.items():
+            start, end = int(self.block_offsets[block]), int(self.block_offsets[block + 1])
+            data = decompressor.decompress(self._mmap[start:end])
+            count = struct.unpack_from('<I', data)[0]
+            offsets = struct.unpack_from(f'<{count + 1}I', data, 4)
+            base = 4 * (count + 2)
+            for i, slot in wanted:
+                document = json.loads(data[base + offsets[slot]:base + offsets[slot + 1]])
+                if fields is not None:
+                    document = {field: document[field] for field in fields if field in document}
+                documents[i] = document
+        return documents
+
+    def get(self, doc_id, fields=None):
+        return self.get_many([doc_id], fields)[0]
+
+
+def load_doc_store(directory=DOCSTORE_DIR):
+    """The document store at `directory`, or None if it has not been built."""
+    if not os.path.exists(os.path.join(directory, MANIFEST_FILE)):
+        return None
+    return DocStore(directory)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build or read the compressed local document store.")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    build = commands.add_parser('build', help="build the store from allfilms.jsonl")
+    build.add_argument('input_file')
+    build.add_argument('directory', nargs='?', default=DOCSTORE_DIR)
+    build.add_argument('--posters', help="JSONL of {filmname, poster_url} records")
+    build.add_argument('--first-doc-id', type=int, default=1)
+    build.add_argument('--block-docs', type=int, default=BLOCK_DOCS)
+
+    get = commands.add_parser('get', help="print documents by docID")
+    get.add_argument('directory')
+    get.add_argument('doc_ids', type=int, nargs='+')
+    get.add_argument('--fields', nargs='+')
+
+    args = parser.parse_args()
+    if args.command == 'build':
+        posters = read_posters(args.posters) if args.posters else None
+        manifest = build_doc_store(args.input_file, args.directory, posters, args.first_doc_id, args.block_docs)
+        print(f"Stored {manifest['num_docs']} documents in {args.directory}: "
+              f"{manifest['uncompressed_bytes']} -> {manifest['compressed_bytes']} bytes")
+    else:
+        for doc_id, document in zip(args.doc_ids, DocStore(args.directory).get_many(args.doc_ids, args.fields)):
+            json.dump({'id': doc_id, 'document': document}, sys.stdout, ensure_ascii=False)
+            sys.stdout.write('\n')
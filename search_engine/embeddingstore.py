@@ -0,0 +1,146 @@
+"""
+Embedding store: a directory of float32 vectors that readers memory-map instead of parsing.
+
+Directory layout:
+    manifest.json  model name, dimension, row count, whether rows are L2-normalized
+    vectors.npy    float32[count, dimension], row i is the embedding of ids[i]
+    ids.json       the id of every row, in row order
+"""
+
+import os
+import json
+import numpy as np
+
+MANIFEST_FILE = 'manifest.json'
+VECTORS_FILE = 'vectors.npy'
+IDS_FILE = 'ids.json'
+
+# Texts per model.encode call when building a store
+ENCODE_BATCH_SIZE = 256
+
+
+def normalize_rows(vectors):
+    """L2-normalize every row (float32); all-zero rows stay zero."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return np.divide(vectors, norms, out=np.zeros_like(vectors), where=norms > 0)
+
+
+def encode_batched(model, texts, batch_size=ENCODE_BATCH_SIZE):
+    """Yield float32 embeddings of `texts` (any iterable), one array per `batch_size` texts."""
+    batch = []
+    for text in texts:
+        batch.append(text)
+        if len(batch) == batch_size:
+            yield np.asarray(model.encode(batch, batch_size=batch_size), dtype=np.float32)
+            batch = []
+    if batch:
+        yield np.asarray(model.encode(batch, batch_size=batch_size), dtype=np.float32)
+
+
+def _start_store(directory, ids):
+    if len(set(ids)) != len(ids):
+        raise ValueError("Embedding ids must be unique.")
+    os.makedirs(directory, exist_ok=True)
+    # Readers treat a store without a manifest as missing while it is being rewritten
+    try:
+        os.remove(os.path.join(directory, MANIFEST_FILE))
+    except FileNotFoundError:
+        pass
+
+
+def _write_manifest(directory, ids, dimension, model_name, normalize):
+    with open(os.path.join(directory, IDS_FILE), 'w') as f_w:
+        json.dump(ids, f_w)
+    # Written last and replaced atomically, so a reader never sees a manifest without its vectors
+    manifest = {
+        'model': model_name,
+        'dimension': int(dimension),
+        'count': len(ids),
+        'normalized': normalize
+    }
+    path = os.path.join(directory, MANIFEST_FILE)
+    with open(path + '.tmp', 'w') as f_w:
+        json.dump(manifest, f_w)
+    os.replace(path + '.tmp', path)
+
+
+def write_embedding_store(directory, ids, vectors, model_name, normalize=True):
+    """Write (and replace) the store in `directory` from in-memory vectors; ids[i] is the id of vectors[i]."""
+    ids = list(ids)
+    vectors = normalize_rows(vectors) if normalize else np.asarray(vectors, dtype=np.float32)
+    if vectors.ndim != 2 or len(vectors) != len(ids):
+        raise ValueError(f"Expected {len(ids)} embeddings, got an array of shape {vectors.shape}.")
+    if np.isnan(vectors).any():
+        raise ValueError("Embeddings contain NaN values.")
+
+    _start_store(directory, ids)
+    np.save(os.path.join(directory, VECTORS_FILE), vectors)
+    _write_manifest(directory, ids, vectors.shape[1], model_name, normalize)
+
+
+def encode_embedding_store(directory, ids, texts, model, model_name, batch_size=ENCODE_BATCH_SIZE, normalize=True):
+    """
+    Embed texts[i] as the vector of ids[i] in batches and write the store. Each batch goes
+    straight into the memory-mapped vectors file, so `texts` can be a generator over a corpus
+    larger than memory.
+    """
+    ids = list(ids)
+    dimension = model.get_sentence_embedding_dimension()
+    _start_store(directory, ids)
+    vectors = np.lib.format.open_memmap(os.path.join(directory, VECTORS_FILE), mode='w+',
+                                        dtype=np.float32, shape=(len(ids), dimension))
+    row = 0
+    for batch in encode_batched(model, texts, batch_size):
+        if row + len(batch) > len(ids):
+            raise ValueError(f"More texts than the {len(ids)} ids given.")
+        if np.isnan(batch).any():
+            raise ValueError("Embeddings contain NaN values.")
+        vectors[row:row + len(batch)] = normalize_rows(batch) if normalize else batch
+        row += len(batch)
+    if row != len(ids):
+        raise ValueError(f"Got {row} texts for {len(ids)} ids.")
+    vectors.flush()
+    del vectors
+    _write_manifest(directory, ids, dimension, model_name, normalize)
+
+
+class EmbeddingStore:
+    """A memory-mapped store: vectors are paged in from disk as rows are read."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, MANIFEST_FILE), 'r') as f:
+            manifest = json.load(f)
+        self.model_name = manifest['model']
+        self.dimension = manifest['dimension']
+        self.normalized = manifest['normalized']
+        self.vectors = np.load(os.path.join(directory, VECTORS_FILE), mmap_mode='r')
+        with open(os.path.join(directory, IDS_FILE), 'r') as f:
+            self.ids = json.load(f)
+        if self.vectors.shape != (manifest['count'], self.dimension) or len(self.ids) != manifest['count']:
+            raise ValueError(f"Embedding store {directory} does not match its manifest.")
+        self.rows = {id_: i for i, id_ in enumerate(self.ids)}
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, id_):
+        return id_ in self.rows
+
+    def vector(self, id_):
+        """The embedding of `id_`, or None."""
+        row = self.rows.get(id_)
+        return None if row is None else self.vectors[row]
+
+    def get_many(self, ids):
+        """(ids found, float32[found, dimension]) for `ids`, in the order given."""
+        found = [id_ for id_ in ids if id_ in self.rows]
+        return found, self.vectors[[self.rows[id_] for id_ in found]]
+
+
+def load_embedding_store(directory):
+    """The store at `directory`, or None if it has not been built."""
+    if not os.path.exists(os.path.join(directory, MANIFEST_FILE)):
+        return None
+    return EmbeddingStore(directory)
@@ -1,7 +1,10 @@
-from bm25config import supabase
 import numpy as np
 import json
-from sklearn.metrics.pairwise import cosine_similarity
+from zonevectors import cosine_similarity, load_zone_matrix
+
+# Row-normalized zone embeddings written by zonedetailscreate.py; without them every zone
+# vector is fetched with the get_zone_vector RPC
+zone_matrix = load_zone_matrix()
 
 # Function to compare 2 vectors and return similarity score
 def similarity_score(vector1, vector2):
@@ -19,25 +22,17 @@ def similarity_score(vector1, vector2):
     if np.isnan(vector1).any() or np.isnan(vector2).any():
         raise ValueError("One or both input vectors contain NaN values.")
 
-    # Ensure vectors are reshaped to 2D for cosine similarity
-    vector1 = vector1.reshape(1, -1)
-    vector2 = vector2.reshape(1, -1)
-
     # Calculate cosine similarity
-    return round(float(cosine_similarity(vector1, vector2)[0][0]), 4)
+    return cosine_similarity(vector1, vector2)
 
 
-def filmchatengine(answer_vector, filmobject):
+def rpc_field_similarities(answer_vector, field_list):
+    """The original path: one get_zone_vector RPC (all sent concurrently) and one cosine similarity per field."""
+    # Imported here so the zone matrix path works without Supabase credentials
+    from supabaseclient import get_supabase_rpc
+    field_vectors = get_supabase_rpc().rpc_many([('get_zone_vector', {'zone_name': field}) for field in field_list])
     field_similarityscore_dict = {}
-    field_list = list(filmobject.keys())
-    
-    print("\nCalculating similarity scores for each field:")
-    
-    for field in field_list: 
-        # Retrieve the vector for the field
-        zone_vector_response = supabase.rpc('get_zone_vector', params={'zone_name': field}).execute()
-        field_vector = zone_vector_response.data
-        
+    for field, field_vector in zip(field_list, field_vectors):
         # Check if the field vector is None or empty
         if field_vector is None:
             print(f"No vector retrieved for field: {field}")
@@ -50,11 +45,28 @@ def filmchatengine(answer_vector, filmobject):
         # Print each field with its similarity score
         print(f"Field: {field}, Similarity Score: {similarity_score_value}")
 
-    # Sort fields by similarity score in descending order
-    similarity_dict_sorted = dict(sorted(field_similarityscore_dict.items(), key=lambda item: item[1], reverse=True))
+    return field_similarityscore_dict
+
+
+def filmchatengine(answer_vector, filmobject):
+    field_list = list(filmobject.keys())
+
+    print("\nCalculating similarity scores for each field:")
+
+    if zone_matrix is not None:
+        # Every field scored in one matrix-vector product
+        top_matching_fields = zone_matrix.top_k_zones(answer_vector, 3, field_list)
+        for field in field_list:
+            if field not in zone_matrix.rows:
+                print(f"No vector retrieved for field: {field}")
+    else:
+        field_similarityscore_dict = rpc_field_similarities(answer_vector, field_list)
+        # Sort fields by similarity score in descending order
+        top_matching_fields = sorted(field_similarityscore_dict.items(), key=lambda item: item[1], reverse=True)[0:3]
 
     # Take the top 3 fields
-    top_3_matching_fields = list(similarity_dict_sorted.keys())[0:3]
+    similarity_dict_sorted = dict(top_matching_fields)
+    top_3_matching_fields = list(similarity_dict_sorted.keys())
 
     # Print the top 3 matching fields with their scores
     print("\nTop 3 Matching Fields:")
@@ -0,0 +1,356 @@
+"""
+Binary index segment: one zone's postings for a set of documents in a single file, read
+through mmap. Segments hold raw term frequencies and zone lengths, so BM25 can be computed
+with corpus-wide statistics across any number of segments, and usually the quantized BM25
+impact of every posting as well, computed with the segment's own statistics: a reader uses
+those as they are whenever the segment alone holds the zone's live documents.
+
+Layout (little endian):
+    header      magic 'FSEG', version, impact bits (0: no impacts), num_terms, num_docs,
+                max_doc_id, total zone length, impact scale, then the byte offset of every section
+    terms       sorted utf-8 terms, concatenated
+    term_offs   uint64[num_terms + 1]  term i is terms[term_offs[i]:term_offs[i + 1]]
+    post_offs   uint64[num_terms + 1]  postings of term i are postings[post_offs[i]:post_offs[i + 1]]
+    dfs         uint32[num_terms]      number of postings of each term
+    doc_ids     uint32[num_docs]       every document with this zone, ascending
+    doc_lens    uint32[num_docs]       zone length of each of those documents
+    postings    per term: doc id gaps as varints, then the df term frequencies as varints
+    impacts     uint8/uint16[sum of dfs]  quantized impacts, term by term in posting order
+
+Version 2 segments (no impact bits, scale or impacts section) are still read.
+"""
+
+import os
+import mmap
+import math
+import struct
+import shutil
+import numpy as np
+from statscatalog import bm25_idf
+
+
+MAGIC = b'FSEG'
+VERSION = 3
+HEADER = struct.Struct('<4sHBxIIIxxxxQd8Q')
+# Version 2 header: no impact bits, impact scale or impacts section
+HEADER_V2 = struct.Struct('<4sHxxIIIxxxxQ7Q')
+# Versions Segment reads
+SUPPORTED_VERSIONS = (2, VERSION)
+
+# BM25 hyperparameters, same as tfidfindexcreator.py
+K1 = 1.5
+B = 0.75
+
+# Largest value a BM25-saturated tf from tfidfindexcreator.py can reach: k1 + 1 with k1 = 1.5
+MAX_SATURATED_TF = 2.5
+
+# Quantized impact dtypes by bit width
+IMPACT_DTYPES = {8: np.uint8, 16: np.uint16}
+
+
+def max_idf(num_docs):
+    """Largest BM25 idf (tfidfindexcreator.py's formula) a zone with num_docs documents can produce."""
+    return math.log2((num_docs - 1 + 0.5) / (1 + 0.5) + 1) if num_docs > 0 else 0.0
+
+
+def impact_scale_for(max_impact, impact_bits):
+    """Scale that maps max_impact to the top of the quantized range."""
+    return max_impact / ((1 << impact_bits) - 1) if max_impact > 0 else 1.0
+
+
+def zone_impact_scale(largest_zone_docs, impact_bits):
+    """
+    One scale for every zone of an index so quantized impacts can be summed across zones:
+    quantized impact * impact_scale = BM25 score.
+    """
+    return impact_scale_for(max_idf(largest_zone_docs) * MAX_SATURATED_TF, impact_bits)
+
+
+def quantize_impacts(impacts, impact_scale, impact_bits):
+    quantized = np.rint(np.asarray(impacts, dtype=np.float64) / impact_scale)
+    return np.clip(quantized, 0, (1 << impact_bits) - 1).astype(IMPACT_DTYPES[impact_bits])
+
+
+def bm25_impacts(freqs, lengths, dfs, num_docs, avg_doc_length):
+    """idf x saturated tf of postings, from raw term frequencies and zone lengths; dfs per posting or one df."""
+    tfs = (freqs * (K1 + 1)) / (freqs + K1 * (1 - B + B * (lengths / avg_doc_length)))
+    return bm25_idf(num_docs, dfs) * tfs
+
+
+# ---------------------------------------------------------------------------
+# Varint coding
+# ---------------------------------------------------------------------------
+
+def varint_sizes(values):
+    """Number of bytes encode_varints uses for each value."""
+    values = np.asarray(values, dtype=np.uint64)
+    num_bytes = np.ones(len(values), dtype=np.int64)
+    for shift in range(7, 64, 7):
+        num_bytes += values >= np.uint64(1 << shift)
+    return num_bytes
+
+
+def encode_varints(values):
+    """LEB128-encode non-negative integers, 7 bits per byte, high bit set on all but the last byte."""
+    values = np.asarray(values, dtype=np.uint64)
+    num_bytes = varint_sizes(values)
+    starts = np.concatenate(([0], np.cumsum(num_bytes)[:-1])).astype(np.int64)
+    encoded = np.empty(int(num_bytes.sum()), dtype=np.uint8)
+    for i in range(int(num_bytes.max()) if len(values) else 0):
+        has_byte = num_bytes > i
+        byte = (values[has_byte] >> np.uint64(7 * i)) & np.uint64(0x7F)
+        more = (num_bytes[has_byte] > i + 1).astype(np.uint64) << np.uint64(7)
+        encoded[starts[has_byte] + i] = (byte | more).astype(np.uint8)
+    return encoded.tobytes()
+
+
+def decode_varints(data, count):
+    """Inverse of encode_varints, vectorized: returns `count` uint64 values."""
+    encoded = np.frombuffer(data, dtype=np.uint8)
+    is_last = encoded < 0x80
+    value_index = np.cumsum(is_last) - is_last
+    value_starts = np.flatnonzero(np.concatenate(([True], is_last[:-1])))
+    shifts = ((np.arange(len(encoded)) - value_starts[value_index]) * 7).astype(np.uint64)
+    values = np.zeros(count, dtype=np.uint64)
+    np.add.at(values, value_index, (encoded & 0x7F).astype(np.uint64) << shifts)
+    return values
+
+
+# ---------------------------------------------------------------------------
+# Writer
+# ---------------------------------------------------------------------------
+
+class SegmentWriter:
+    """
+    Streaming segment writer: terms are added one at a time in increasing utf-8 byte order.
+    Postings are spooled to a temporary file next to `path`, so only the term dictionary
+    and the document table are held in memory while a zone is written. Gaps and frequencies
+    are varint-encoded in batches of terms, since most terms have only a handful of postings.
+    """
+
+    FLUSH_POSTINGS = 1 << 16
+
+    def __init__(self, path, doc_ids, doc_lengths, impact_scale=None, impact_bits=None):
+        """
+        doc_ids / doc_lengths: every document that has this zone (ascending) and its zone length.
+        impact_scale / impact_bits: quantization of the stored impacts (see zone_impact_scale);
+        without them the segment holds term frequencies only.
+        """
+        self.path = path
+        self.doc_ids = np.asarray(doc_ids, dtype=np.uint32)
+        self.doc_lengths = np.asarray(doc_lengths, dtype=np.uint32)
+        self.impact_scale = impact_scale
+        self.impact_bits = impact_bits if impact_scale is not None else None
+        self._spool_path = path + '.postings'
+        self._spool = open(self._spool_path, 'w+b')
+        # Impacts are spooled separately: they follow the postings section as one flat array
+        self._impacts_path = path + '.impacts'
+        self._impacts = open(self._impacts_path, 'w+b') if self.impact_bits else None
+        self._impacts_size = 0
+        num_docs = len(self.doc_ids)
+        self._avg_doc_length = int(self.doc_lengths.sum(dtype=np.uint64)) / num_docs if num_docs else 1.0
+        self._terms = bytearray()
+        self._term_offsets = [0]
+        self._postings_offsets = [0]
+        self._dfs = []
+        self._last_term = None
+        self._pending = []
+        self._pending_postings = 0
+
+    def add(self, term, doc_ids, freqs):
+        """Append one term; doc_ids ascending."""
+        key = term.encode('utf-8')
+        if self._last_term is not None and key <= self._last_term:
+            raise ValueError(f"Segment terms must be added in increasing order, got {term!r} after {self._last_term!r}")
+        self._last_term = key
+
+        doc_ids = np.asarray(doc_ids, dtype=np.int64)
+        self._pending.append((doc_ids, np.asarray(freqs, dtype=np.int64)))
+        self._pending_postings += len(doc_ids)
+        self._terms += key
+        self._term_offsets.append(len(self._terms))
+        self._dfs.append(len(doc_ids))
+        if self._pending_postings >= self.FLUSH_POSTINGS:
+            self._flush()
+
+    def _flush(self):
+        """Encode and spool the postings of every pending term."""
+        if not self._pending:
+            return
+        dfs = np.array([len(doc_ids) for doc_ids, _ in self._pending], dtype=np.int64)
+        term_starts = np.concatenate(([0], np.cumsum(dfs)))
+        doc_ids = np.concatenate([doc_ids for doc_ids, _ in self._pending])
+        freqs = np.concatenate([freqs for _, freqs in self._pending])
+        # Gaps restart at 0 for every term
+        gaps = np.diff(doc_ids, prepend=0)
+        first = term_starts[:-1][dfs > 0]
+        gaps[first] = doc_ids[first]
+
+        encoded_gaps = encode_varints(gaps)
+        encoded_freqs = encode_varints(freqs)
+        gap_starts = np.concatenate(([0], np.cumsum(varint_sizes(gaps)))).tolist()
+        freq_starts = np.concatenate(([0], np.cumsum(varint_sizes(freqs)))).tolist()
+        term_starts = term_starts.tolist()
+        for i in range(len(self._pending)):
+            start, end = term_starts[i], term_starts[i + 1]
+            self._spool.write(encoded_gaps[gap_starts[start]:gap_starts[end]])
+            self._spool.write(encoded_freqs[freq_starts[start]:freq_starts[end]])
+            self._postings_offsets.append(self._spool.tell())
+        if self._impacts is not None:
+            # Scored with this segment's own document count and average zone length
+            lengths = self.doc_lengths[np.searchsorted(self.doc_ids, doc_ids)].astype(np.int64)
+            impacts = bm25_impacts(freqs, lengths, np.repeat(dfs, dfs), len(self.doc_ids), self._avg_doc_length)
+            encoded = quantize_impacts(impacts, self.impact_scale, self.impact_bits).tobytes()
+            self._impacts.write(encoded)
+            self._impacts_size += len(encoded)
+        self._pending = []
+        self._pending_postings = 0
+
+    def close(self):
+        self._flush()
+        num_terms = len(self._dfs)
+        sections = [bytes(self._terms),
+                    np.array(self._term_offsets, dtype=np.uint64).tobytes(),
+                    np.array(self._postings_offsets, dtype=np.uint64).tobytes(),
+                    np.array(self._dfs, dtype=np.uint32).tobytes(),
+                    self.doc_ids.tobytes(),
+                    self.doc_lengths.tobytes()]
+        offsets = []
+        position = HEADER.size
+        for size in [len(section) for section in sections] + [self._postings_offsets[-1], self._impacts_size]:
+            # 8-byte alignment so every array section can be viewed in place
+            position += -position % 8
+            offsets.append(position)
+            position += size
+
+        max_doc_id = int(self.doc_ids[-1]) if len(self.doc_ids) else 0
+        total_length = int(self.doc_lengths.sum(dtype=np.uint64))
+        with open(self.path, 'wb') as f_w:
+            f_w.write(HEADER.pack(MAGIC, VERSION, self.impact_bits or 0, num_terms, len(self.doc_ids), max_doc_id,
+                                  total_length, self.impact_scale or 0.0, *offsets))
+            for offset, section in zip(offsets, sections):
+                f_w.write(b'\0' * (offset - f_w.tell()))
+                f_w.write(section)
+            for offset, spool in zip(offsets[-2:], (self._spool, self._impacts)):
+                if spool is not None:
+                    f_w.write(b'\0' * (offset - f_w.tell()))
+                    spool.seek(0)
+                    shutil.copyfileobj(spool, f_w)
+        self._spool.close()
+        os.remove(self._spool_path)
+        if self._impacts is not None:
+            self._impacts.close()
+            os.remove(self._impacts_path)
+
+
+def write_segment(path, term_postings, doc_ids, doc_lengths, impact_scale=None, impact_bits=None):
+    """
+    Write a segment file.
+    term_postings: iterable of (term, doc_ids, freqs) with doc ids ascending.
+    doc_ids / doc_lengths / impact_scale / impact_bits: see SegmentWriter.
+    """
+    writer = SegmentWriter(path, doc_ids, doc_lengths, impact_scale, impact_bits)
+    for term, term_doc_ids, freqs in sorted(term_postings, key=lambda row: row[0].encode('utf-8')):
+        writer.add(term, term_doc_ids, freqs)
+    writer.close()
+
+
+# ---------------------------------------------------------------------------
+# Reader
+# ---------------------------------------------------------------------------
+
+class Segment:
+    """
+    Zero-copy reader: the term dictionary, offsets, dfs and document table are numpy views
+    straight into the mmap; only the varints of a looked-up term are decoded.
+    """
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version = struct.unpack_from('<4sH', self._mmap, 0)
+        if magic != MAGIC or version not in SUPPORTED_VERSIONS:
+            supported = ' or '.join(str(v) for v in SUPPORTED_VERSIONS)
+            raise ValueError(f"{path} is not a version {supported} index segment, rebuild it with tfidfindexcreator.py")
+        if version == VERSION:
+            (_, _, impact_bits, self.num_terms, self.num_docs, self.max_doc_id, self.total_length,
+             impact_scale, *offsets) = HEADER.unpack_from(self._mmap, 0)
+        else:
+            (_, _, self.num_terms, self.num_docs, self.max_doc_id, self.total_length,
+             *offsets) = HEADER_V2.unpack_from(self._mmap, 0)
+            impact_bits, impact_scale = 0, 0.0
+            offsets.append(0)
+        (terms_offset, term_offsets_offset, postings_offsets_offset, dfs_offset,
+         doc_ids_offset, doc_lengths_offset, postings_offset, impacts_offset) = offsets
+
+        n = self.num_terms
+        self.term_offsets = np.frombuffer(self._mmap, dtype=np.uint64, count=n + 1, offset=term_offsets_offset)
+        self.postings_offsets = np.frombuffer(self._mmap, dtype=np.uint64, count=n + 1, offset=postings_offsets_offset)
+        self.dfs = np.frombuffer(self._mmap, dtype=np.uint32, count=n, offset=dfs_offset)
+        self.doc_ids = np.frombuffer(self._mmap, dtype=np.uint32, count=self.num_docs, offset=doc_ids_offset)
+        self.doc_lengths = np.frombuffer(self._mmap, dtype=np.uint32, count=self.num_docs, offset=doc_lengths_offset)
+        self._terms_offset = terms_offset
+        self._postings_offset = postings_offset
+
+        # Stored impacts (None for segments written without them); term i's are impacts[impact_offsets[i]:impact_offsets[i + 1]]
+        self.impact_bits = impact_bits or None
+        self.impact_scale = impact_scale if impact_bits else None
+        self.impacts = None
+        if impact_bits:
+            self.impact_offsets = np.concatenate(([0], np.cumsum(self.dfs, dtype=np.int64)))
+            self.impacts = np.frombuffer(self._mmap, dtype=IMPACT_DTYPES[impact_bits],
+                                         count=int(self.impact_offsets[-1]), offset=impacts_offset)
+
+    @property
+    def avg_doc_length(self):
+        return self.total_length / self.num_docs if self.num_docs else 1.0
+
+    def term(self, i):
+        start = self._terms_offset + int(self.term_offsets[i])
+        end = self._terms_offset + int(self.term_offsets[i + 1])
+        return self._mmap[start:end]
+
+    def find(self, term):
+        """Index of `term` in the sorted term dictionary, or -1."""
+        key = term.encode('utf-8')
+        lo, hi = 0, self.num_terms
+        while lo < hi:
+            mid = (lo + hi) // 2
+            current = self.term(mid)
+            if current < key:
+                lo = mid + 1
+            elif current > key:
+                hi = mid
+            else:
+                return mid
+        return -1
+
+    def terms(self):
+        for i in range(self.num_terms):
+            yield self.term(i).decode('utf-8')
+
+    def postings_at(self, term_id):
+        """(doc_ids, freqs) int64 arrays of the term at term_id."""
+        df = int(self.dfs[term_id])
+        start = self._postings_offset + int(self.postings_offsets[term_id])
+        end = self._postings_offset + int(self.postings_offsets[term_id + 1])
+        values = decode_varints(self._mmap[start:end], 2 * df).astype(np.int64)
+        return np.cumsum(values[:df]), values[df:]
+
+    def postings(self, term):
+        term_id = self.find(term)
+        if term_id < 0:
+            return None
+        return self.postings_at(term_id)
+
+    def impacts_at(self, term_id):
+        """Stored quantized impacts of the term at term_id, aligned with its postings (a view into the mmap)."""
+        return self.impacts[self.impact_offsets[term_id]:self.impact_offsets[term_id + 1]]
+
+    def lengths_of(self, doc_ids):
+        """Zone lengths of documents that are in this segment."""
+        return self.doc_lengths[np.searchsorted(self.doc_ids, doc_ids)].astype(np.int64)
+
+
+def segment_path(directory, zone):
+    return os.path.join(directory, f'{zone}.seg')
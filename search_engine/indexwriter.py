@@ -0,0 +1,462 @@
+import os
+import copy
+import json
+import heapq
+import shutil
+import argparse
+import threading
+from collections import defaultdict, Counter
+import numpy as np
+from indexsegment import Segment, SegmentWriter, write_segment, segment_path, zone_impact_scale
+from localindex import (clean_zone_name, read_manifest, write_manifest, next_generation, segment_directory,
+                        write_segment_docs, read_segment_deletes, write_segment_deletes, IndexSegment, MANIFEST_FILE)
+from statscatalog import StatsCatalog, write_stats_catalog, zone_importance_scores
+
+# Merge policy: once there are more than MAX_SEGMENTS segments, the MERGE_FACTOR smallest are merged into one
+MAX_SEGMENTS = 8
+MERGE_FACTOR = 4
+
+
+def tokenize_document(document):
+    """{zone: Counter(term -> freq)} for one document, tokenized like tfidfindexcreator.py."""
+    zones = {}
+    # Fields whose cleaned names collide keep the last one in sorted order, as the batch build does
+    for field, value in sorted(document.items()):
+        if value is not None:
+            zones[clean_zone_name(field)] = Counter(value.lower().split())
+    return zones
+
+
+class IndexWriter:
+    """
+    Incremental updates for a local index directory.
+
+    add_documents / delete_documents are buffered; commit() writes the buffered documents
+    as a new immutable segment, tombstones replaced or deleted documents in the existing
+    segments, rescores the committed documents' terms in a new stats catalog and publishes
+    a new manifest generation. Small segments are merged by
+    merge() (or a background thread, see start_background_merges), which drops deleted
+    documents. Only one IndexWriter may be open on a directory at a time.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.manifest = read_manifest(directory)
+        self._buffer = {}
+        self._pending_deletes = set()
+        self._lock = threading.RLock()
+        self._merge_lock = threading.Lock()
+        self._merge_thread = None
+        # Segment being written by a running merge, not in the manifest yet
+        self._merging = None
+        self._stop_merges = threading.Event()
+
+    # -----------------------------------------------------------------------
+    # Buffered updates
+    # -----------------------------------------------------------------------
+
+    def add_documents(self, documents):
+        """Add or replace documents, given as (docID, {field: text}) pairs."""
+        with self._lock:
+            for doc_id, document in documents:
+                self._buffer[int(doc_id)] = document
+                self._pending_deletes.add(int(doc_id))
+
+    def delete_documents(self, doc_ids):
+        with self._lock:
+            for doc_id in doc_ids:
+                self._buffer.pop(int(doc_id), None)
+                self._pending_deletes.add(int(doc_id))
+
+    def max_doc_id(self):
+        """Largest docID in the index or the buffer, so new films can be numbered after it."""
+        with self._lock:
+            largest = max(self._buffer, default=0)
+            for segment_info in self.manifest['segments']:
+                doc_ids = np.load(os.path.join(segment_directory(self.directory, segment_info['name']), 'docs.npy'))
+                if len(doc_ids):
+                    largest = max(largest, int(doc_ids[-1]))
+            return largest
+
+    # -----------------------------------------------------------------------
+    # Commit
+    # -----------------------------------------------------------------------
+
+    def _reserve_segment_name(self):
+        name = f"seg{self.manifest['next_segment']:06d}"
+        self.manifest['next_segment'] += 1
+        return name
+
+    def _tombstone(self, segment_info, doc_ids, generation):
+        """Mark doc_ids deleted in one segment; returns True if any of them were live there."""
+        directory = segment_directory(self.directory, segment_info['name'])
+        segment_docs = np.load(os.path.join(directory, 'docs.npy'))
+        deleted = read_segment_deletes(self.directory, segment_info, len(segment_docs))
+        newly_deleted = np.isin(segment_docs, doc_ids) & ~deleted
+        if not newly_deleted.any():
+            return False
+        write_segment_deletes(self.directory, segment_info, deleted | newly_deleted, generation)
+        return True
+
+    def _write_buffer_segment(self, name, documents):
+        """Write buffered documents ({docID: document}) as a new segment, one .seg per zone."""
+        directory = segment_directory(self.directory, name)
+        os.makedirs(directory, exist_ok=True)
+
+        zone_postings = defaultdict(lambda: defaultdict(list))
+        zone_lengths = defaultdict(list)
+        for doc_id in sorted(documents):
+            for zone, tf_counter in tokenize_document(documents[doc_id]).items():
+                zone_lengths[zone].append((doc_id, sum(tf_counter.values())))
+                for term, freq in tf_counter.items():
+                    zone_postings[zone][term].append((doc_id, freq))
+
+        # Impacts are stored with the segment's own statistics; the reader uses them once the
+        # segment holds all of a zone's live documents (e.g. after merging everything)
+        impact_bits = self.manifest['impact_bits']
+        impact_scale = zone_impact_scale(max((len(lengths) for lengths in zone_lengths.values()), default=0), impact_bits)
+        for zone, lengths in zone_lengths.items():
+            term_postings = [
+                (term, [doc_id for doc_id, _ in postings], [freq for _, freq in postings])
+                for term, postings in zone_postings[zone].items()
+            ]
+            write_segment(segment_path(directory, zone), term_postings,
+                          [doc_id for doc_id, _ in lengths], [length for _, length in lengths], impact_scale, impact_bits)
+            if zone not in self.manifest['zones']:
+                self.manifest['zones'].append(zone)
+        write_segment_docs(self.directory, name, list(documents))
+
+    def commit(self):
+        """Publish every buffered add and delete as a new index generation."""
+        with self._lock:
+            if not self._buffer and not self._pending_deletes:
+                return self.manifest['generation']
+            previous = copy.deepcopy(self.manifest)
+            generation = next_generation(self.manifest)
+            deletes = np.array(sorted(self._pending_deletes), dtype=np.int64)
+            for segment_info in self.manifest['segments']:
+                self._tombstone(segment_info, deletes, generation)
+
+            if self._buffer:
+                name = self._reserve_segment_name()
+                self._write_buffer_segment(name, self._buffer)
+                self.manifest['segments'].append({'name': name, 'deletes': None})
+                self.manifest['catalog'] = self._write_stats_catalog(self._buffer, generation)
+
+            self.manifest['generation'] = generation
+            write_manifest(self.directory, self.manifest)
+            self._buffer = {}
+            self._pending_deletes = set()
+            self._remove_unused_files(previous)
+            return generation
+
+    def _write_stats_catalog(self, documents, generation):
+        """
+        Write the stats catalog of a commit as statscatalog_<generation> and return its name.
+        Every term of the committed documents is rescored from the live segments (its df in
+        each zone and its occurrences in all zones), so terms new to the index are planned
+        like the others; the rows of other terms are kept until the next full build, and the
+        zone statistics are the live ones. Merges leave the live documents, and so the
+        catalog, unchanged.
+
+        Deletes are not rescored: a delete-only commit keeps the current catalog, and the terms
+        of deleted (or replaced) documents keep the dfs and importances of their last rescoring
+        until a committed document contains them again or the index is rebuilt. Finding those
+        terms would mean reading every posting list. Only query planning sees the stale values;
+        BM25 scores use live dfs and zone statistics (see LocalIndex).
+        """
+        catalog = StatsCatalog(os.path.join(self.directory, self.manifest.get('catalog', 'statscatalog')))
+        segments = [IndexSegment(self.directory, segment_info) for segment_info in self.manifest['segments']]
+        zone_names = catalog.zone_names + [zone for zone in self.manifest['zones'] if zone not in catalog.zone_names]
+        zone_ids = {zone: i for i, zone in enumerate(zone_names)}
+
+        term_zones = defaultdict(set)
+        for document in documents.values():
+            for zone, tf_counter in tokenize_document(document).items():
+                for term in tf_counter:
+                    term_zones[term].add(zone)
+        term_dfs, term_occurrences = {}, Counter()
+        zone_terms = np.bincount(catalog.zone_ids, minlength=len(zone_names))
+        for term, zones in term_zones.items():
+            # A term has postings only in the zones it had catalog entries for and the ones it was just added to
+            stored_zones = catalog.zone_importance(term) or {}
+            dfs = {}
+            for zone in zones | set(stored_zones):
+                df = 0
+                for segment in segments:
+                    postings = segment.zones[zone].postings(term) if zone in segment.zones else None
+                    if postings is None:
+                        continue
+                    doc_ids, freqs = postings
+                    live = ~segment.is_deleted(doc_ids)
+                    df += int(live.sum())
+                    term_occurrences[term] += int(freqs[live].sum())
+                if df:
+                    dfs[zone] = df
+            # Terms per zone: the catalog's entries plus the terms this commit brings to a zone
+            for zone in dfs:
+                if zone not in stored_zones:
+                    zone_terms[zone_ids[zone]] += 1
+            term_dfs[term] = dfs
+
+        updated = {
+            term.encode('utf-8'): [
+                (zone_ids[zone], zone_importance_scores([df], [term_occurrences[term]], int(zone_terms[zone_ids[zone]]))[0], df)
+                for zone, df in dfs.items()
+            ]
+            for term, dfs in term_dfs.items()
+        }
+        kept = (
+            (term, [(zone_ids[zone], score, df) for zone, (score, df) in entries.items()])
+            for term, entries in catalog.rows() if term not in updated
+        )
+        rows = heapq.merge(kept, sorted(updated.items()), key=lambda row: row[0])
+
+        zone_stats = []
+        for zone in zone_names:
+            num_docs = total_length = 0
+            for segment in segments:
+                if zone in segment.zones:
+                    live_docs, live_length = segment.live_zone_stats(zone)
+                    num_docs += live_docs
+                    total_length += live_length
+            zone_stats.append((zone, num_docs, total_length))
+
+        name = f'statscatalog_{generation}'
+        write_stats_catalog(os.path.join(self.directory, name), generation, zone_stats, rows)
+        return name
+
+    # -----------------------------------------------------------------------
+    # Merging
+    # -----------------------------------------------------------------------
+
+    def _segment_size(self, segment_info):
+        docs = np.load(os.path.join(segment_directory(self.directory, segment_info['name']), 'docs.npy'), mmap_mode='r')
+        return len(docs)
+
+    def segments_to_merge(self):
+        """Merge policy: the MERGE_FACTOR smallest segments once there are more than MAX_SEGMENTS."""
+        with self._lock:
+            segments = list(self.manifest['segments'])
+        if len(segments) <= MAX_SEGMENTS:
+            return []
+        return sorted(segments, key=self._segment_size)[:MERGE_FACTOR]
+
+    def merge(self, segment_names=None):
+        """
+        Merge segments (by default the ones the merge policy picks) into one new segment
+        without their deleted documents. The heavy work runs without holding the writer
+        lock, so adds, deletes and commits continue meanwhile; deletes committed during the
+        merge are carried over to the merged segment. Returns the new segment name or None.
+        """
+        with self._merge_lock:
+            with self._lock:
+                if segment_names is None:
+                    sources = self.segments_to_merge()
+                else:
+                    sources = [info for info in self.manifest['segments'] if info['name'] in set(segment_names)]
+                if len(sources) < 2:
+                    return None
+                # Snapshot of the sources as they are now
+                sources = [dict(info) for info in sources]
+                name = self._reserve_segment_name()
+                self._merging = name
+
+            try:
+                merged_docs = self._write_merged_segment(name, sources)
+            except Exception:
+                with self._lock:
+                    self._merging = None
+                shutil.rmtree(segment_directory(self.directory, name), ignore_errors=True)
+                raise
+
+            with self._lock:
+                previous = copy.deepcopy(self.manifest)
+                generation = next_generation(self.manifest)
+                current = {info['name']: info for info in self.manifest['segments']}
+                # Documents deleted in a source segment after the snapshot are deleted in the merged one
+                late_deletes = []
+                for source in sources:
+                    source_dir = segment_directory(self.directory, source['name'])
+                    source_docs = np.load(os.path.join(source_dir, 'docs.npy'))
+                    before = read_segment_deletes(self.directory, source, len(source_docs))
+                    after = read_segment_deletes(self.directory, current[source['name']], len(source_docs))
+                    late_deletes.append(source_docs[after & ~before])
+                merged_info = {'name': name, 'deletes': None}
+                late_deletes = np.concatenate(late_deletes)
+                if len(late_deletes):
+                    write_segment_deletes(self.directory, merged_info, np.isin(merged_docs, late_deletes), generation)
+
+                source_names = {source['name'] for source in sources}
+                position = min(i for i, info in enumerate(self.manifest['segments']) if info['name'] in source_names)
+                segments = [info for info in self.manifest['segments'] if info['name'] not in source_names]
+                segments.insert(position, merged_info)
+                self.manifest['segments'] = segments
+                self.manifest['generation'] = generation
+                write_manifest(self.directory, self.manifest)
+                self._merging = None
+                self._remove_unused_files(previous)
+            return name
+
+    def _write_merged_segment(self, name, sources):
+        """Write the live documents of `sources` as segment `name`; returns its docs.npy contents."""
+        directory = segment_directory(self.directory, name)
+        os.makedirs(directory, exist_ok=True)
+
+        opened = []
+        for source in sources:
+            source_dir = segment_directory(self.directory, source['name'])
+            source_docs = np.load(os.path.join(source_dir, 'docs.npy'))
+            deleted_ids = source_docs[read_segment_deletes(self.directory, source, len(source_docs))]
+            zones = {f[:-len('.seg')]: Segment(os.path.join(source_dir, f)) for f in os.listdir(source_dir) if f.endswith('.seg')}
+            opened.append((source_docs[~np.isin(source_docs, deleted_ids)], deleted_ids, zones))
+
+        # Document tables: live documents of every source, ascending
+        doc_tables = {}
+        for zone in sorted({zone for _, _, zones in opened for zone in zones}):
+            doc_ids, lengths = [], []
+            for _, deleted_ids, zones in opened:
+                if zone in zones:
+                    live = ~np.isin(zones[zone].doc_ids, deleted_ids)
+                    doc_ids.append(zones[zone].doc_ids[live].astype(np.int64))
+                    lengths.append(zones[zone].doc_lengths[live].astype(np.int64))
+            doc_ids, lengths = np.concatenate(doc_ids), np.concatenate(lengths)
+            order = np.argsort(doc_ids, kind='stable')
+            doc_tables[zone] = doc_ids[order], lengths[order]
+        # Impacts are re-quantized with the merged segment's statistics
+        impact_bits = self.manifest['impact_bits']
+        impact_scale = zone_impact_scale(max((len(doc_ids) for doc_ids, _ in doc_tables.values()), default=0), impact_bits)
+
+        for zone, (doc_ids, lengths) in doc_tables.items():
+            zone_segments = [(deleted_ids, zones[zone]) for _, deleted_ids, zones in opened if zone in zones]
+            writer = SegmentWriter(segment_path(directory, zone), doc_ids, lengths, impact_scale, impact_bits)
+
+            # Terms of all sources in byte order, postings concatenated and re-sorted by doc id
+            terms = heapq.merge(*[
+                segment_terms(segment, source_index) for source_index, (_, segment) in enumerate(zone_segments)
+            ])
+            current_term, parts = None, []
+
+            def write_term():
+                term_doc_ids = np.concatenate([part[0] for part in parts])
+                freqs = np.concatenate([part[1] for part in parts])
+                if len(term_doc_ids):
+                    order = np.argsort(term_doc_ids, kind='stable')
+                    writer.add(current_term.decode('utf-8'), term_doc_ids[order], freqs[order])
+
+            for term, source_index, term_id in terms:
+                if term != current_term:
+                    if parts:
+                        write_term()
+                    current_term, parts = term, []
+                deleted_ids, segment = zone_segments[source_index]
+                term_doc_ids, freqs = segment.postings_at(term_id)
+                live = ~np.isin(term_doc_ids, deleted_ids)
+                parts.append((term_doc_ids[live], freqs[live]))
+            if parts:
+                write_term()
+            writer.close()
+
+        merged_docs = np.unique(np.concatenate([live_docs for live_docs, _, _ in opened]))
+        write_segment_docs(self.directory, name, merged_docs)
+        return merged_docs
+
+    def _remove_unused_files(self, previous):
+        """
+        Delete segments, tombstone files and stats catalogs that neither the manifest nor
+        `previous`, the one it just replaced, refers to. The replaced manifest's files are kept
+        for one more generation so a reader that read it just before it was replaced can still
+        open them; readers further behind keep their snapshot (see LocalIndex.reopen).
+        """
+        manifests = (self.manifest, previous)
+        catalogs = {manifest.get('catalog', 'statscatalog') for manifest in manifests}
+        for name in os.listdir(self.directory):
+            if name.startswith('statscatalog') and name not in catalogs:
+                shutil.rmtree(os.path.join(self.directory, name), ignore_errors=True)
+        segments_root = os.path.join(self.directory, 'segments')
+        live = defaultdict(set)
+        for manifest in manifests:
+            for info in manifest['segments']:
+                live[info['name']].add(info.get('deletes'))
+        for name in os.listdir(segments_root):
+            path = os.path.join(segments_root, name)
+            if name not in live:
+                if name != self._merging:
+                    shutil.rmtree(path, ignore_errors=True)
+                continue
+            for filename in os.listdir(path):
+                if filename.startswith('deletes_') and filename not in live[name]:
+                    os.remove(os.path.join(path, filename))
+
+    # -----------------------------------------------------------------------
+    # Background merges
+    # -----------------------------------------------------------------------
+
+    def start_background_merges(self, interval=5.0):
+        """Run merge() whenever the merge policy asks for it, checking every `interval` seconds."""
+        if self._merge_thread is not None:
+            return
+        self._stop_merges.clear()
+
+        def run():
+            while not self._stop_merges.wait(interval):
+                while self.segments_to_merge() and not self._stop_merges.is_set():
+                    self.merge()
+
+        self._merge_thread = threading.Thread(target=run, name='index-merge', daemon=True)
+        self._merge_thread.start()
+
+    def stop_background_merges(self):
+        if self._merge_thread is None:
+            return
+        self._stop_merges.set()
+        self._merge_thread.join()
+        self._merge_thread = None
+
+
+def segment_terms(segment, source_index):
+    """(term bytes, source_index, term_id) for every term of a segment, in term order."""
+    for term_id in range(segment.num_terms):
+        yield bytes(segment.term(term_id)), source_index, term_id
+
+
+def read_documents(jsonl_path, first_doc_id):
+    """(docID, document) for every line of a JSONL file, numbered from first_doc_id."""
+    with open(jsonl_path, 'r') as f:
+        for doc_id, line in enumerate(f, first_doc_id):
+            if line.strip():
+                yield doc_id, json.loads(line)
+
+
+# Apply updates to a local index built by localindex.py
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Incrementally update a local index.")
+    parser.add_argument('index_directory')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    add = commands.add_parser('add', help="index new films from a JSONL file as a new segment")
+    add.add_argument('jsonl_path')
+    add.add_argument('--first-doc-id', type=int,
+                     help="docID of the first line (default: after the largest docID in the index, "
+                          "which matches appending the lines to allfilms.jsonl)")
+
+    delete = commands.add_parser('delete', help="delete films by docID")
+    delete.add_argument('doc_ids', type=int, nargs='+')
+
+    commands.add_parser('merge', help="merge small segments according to the merge policy")
+
+    args = parser.parse_args()
+    if not os.path.exists(os.path.join(args.index_directory, MANIFEST_FILE)):
+        parser.error(f"no local index at {args.index_directory}")
+
+    writer = IndexWriter(args.index_directory)
+    if args.command == 'add':
+        first_doc_id = args.first_doc_id if args.first_doc_id is not None else writer.max_doc_id() + 1
+        writer.add_documents(read_documents(args.jsonl_path, first_doc_id))
+        print(f"Committed generation {writer.commit()}")
+    elif args.command == 'delete':
+        writer.delete_documents(args.doc_ids)
+        print(f"Committed generation {writer.commit()}")
+    else:
+        while writer.segments_to_merge():
+            print(f"Merged into {writer.merge()}")
@@ -0,0 +1,432 @@
+import os
+import re
+import csv
+import sys
+import argparse
+import json
+import time
+import shutil
+import numpy as np
+from indexsegment import (Segment, write_segment, segment_path, quantize_impacts, zone_impact_scale, bm25_impacts,
+                          K1, B, IMPACT_DTYPES)
+from statscatalog import StatsCatalog, write_stats_catalog
+
+# Increase the CSV field size limit (posting dicts of common terms are huge)
+csv.field_size_limit(sys.maxsize)
+
+MANIFEST_FILE = 'manifest.json'
+
+
+def clean_zone_name(zone):
+    """Same cleaning tfidfindexcreator.py applies to a field name to get its CSV/table name."""
+    return "_".join(re.split('[ /]', zone.lower()))
+
+
+# ---------------------------------------------------------------------------
+# Index directory: manifest + segments/<segment>/<zone>.seg
+# ---------------------------------------------------------------------------
+#
+# Every segment covers a set of documents (docs.npy, ascending) and holds one .seg file per
+# zone. Segments never change once written; deleted documents are recorded in a tombstone
+# bitmap over docs.npy, written under a new file name whenever it changes so readers of an
+# older manifest keep a consistent view. The manifest lists the live segments with their
+# tombstone files and is replaced atomically on every commit; files only the replaced
+# manifest refers to are removed one generation later (see IndexWriter._remove_unused_files).
+
+def segment_directory(directory, segment_name):
+    return os.path.join(directory, 'segments', segment_name)
+
+
+def read_manifest(directory):
+    with open(os.path.join(directory, MANIFEST_FILE), 'r') as f:
+        return json.load(f)
+
+
+def write_manifest(directory, manifest):
+    """Atomically replace the manifest, so readers see either the old or the new index."""
+    path = os.path.join(directory, MANIFEST_FILE)
+    with open(path + '.tmp', 'w') as f_w:
+        json.dump(manifest, f_w, indent=2)
+    os.replace(path + '.tmp', path)
+
+
+def next_generation(manifest=None):
+    previous = manifest['generation'] if manifest else 0
+    return max(previous + 1, int(time.time()))
+
+
+def write_segment_docs(directory, segment_name, doc_ids):
+    np.save(os.path.join(segment_directory(directory, segment_name), 'docs.npy'),
+            np.unique(np.asarray(doc_ids, dtype=np.int64)))
+
+
+def read_segment_deletes(directory, segment_info, num_docs):
+    """Tombstone bitmap of a segment as a bool array over its docs.npy."""
+    if not segment_info.get('deletes'):
+        return np.zeros(num_docs, dtype=bool)
+    packed = np.load(os.path.join(segment_directory(directory, segment_info['name']), segment_info['deletes']))
+    return np.unpackbits(packed, count=num_docs).astype(bool)
+
+
+def write_segment_deletes(directory, segment_info, deleted, generation):
+    """Write a segment's tombstones under a new name and point segment_info at it."""
+    filename = f'deletes_{generation}.npy'
+    np.save(os.path.join(segment_directory(directory, segment_info['name']), filename), np.packbits(deleted))
+    segment_info['deletes'] = filename
+
+
+# ---------------------------------------------------------------------------
+# CSV -> segment conversion
+# ---------------------------------------------------------------------------
+
+def read_zone_csv(csv_path):
+    """Rows of one bm25indexdata/<zone>.csv as (term, {docID: tf}, idf)."""
+    rows = []
+    with open(csv_path, 'r', newline='') as f:
+        for row in csv.reader(f):
+            if len(row) < 3:
+                continue
+            rows.append((row[0], json.loads(row[1]), float(row[2])))
+    return rows
+
+
+def read_zone_doclengths_csv(csv_path):
+    """Read bm25doclengths/<zone>.csv (docID, length) as ascending (doc_ids, lengths) arrays."""
+    rows = []
+    with open(csv_path, 'r', newline='') as f:
+        for row in csv.reader(f):
+            rows.append((int(row[0]), int(row[1])))
+    rows.sort()
+    doc_ids = np.array([doc_id for doc_id, _ in rows], dtype=np.int64)
+    lengths = np.array([length for _, length in rows], dtype=np.int64)
+    return doc_ids, lengths
+
+
+def convert_zone_csv(csv_path, output_path, doc_ids, doc_lengths, impact_scale=None, impact_bits=None):
+    """
+    Convert one bm25indexdata/<zone>.csv (term, {docID: tf}, idf) into a binary segment.
+    The CSV only has the BM25-saturated tf, so the raw term frequency is recovered by
+    inverting the saturation with the document's zone length (exact for the term
+    frequencies films actually have; the tf is rounded to 6 decimals).
+    Returns the number of terms and postings written.
+    """
+    avg_doc_length = doc_lengths.mean() if len(doc_lengths) else 1.0
+    term_postings = []
+    num_postings = 0
+    for term, tf_dict, _ in read_zone_csv(csv_path):
+        postings = sorted((int(doc_id), tf) for doc_id, tf in tf_dict.items())
+        term_doc_ids = np.array([doc_id for doc_id, _ in postings], dtype=np.int64)
+        tfs = np.array([tf for _, tf in postings], dtype=np.float64)
+        norms = 1 - B + B * doc_lengths[np.searchsorted(doc_ids, term_doc_ids)] / avg_doc_length
+        # tf = f * (k1 + 1) / (f + k1 * norm)  =>  f = tf * k1 * norm / (k1 + 1 - tf)
+        freqs = tfs * K1 * norms / np.maximum(K1 + 1 - tfs, 1e-9)
+        freqs = np.clip(np.rint(freqs), 1, np.iinfo(np.int32).max).astype(np.int64)
+        term_postings.append((term, term_doc_ids, freqs))
+        num_postings += len(term_doc_ids)
+
+    write_segment(output_path, term_postings, doc_ids, doc_lengths, impact_scale, impact_bits)
+    return len(term_postings), num_postings
+
+
+# ---------------------------------------------------------------------------
+# Stats catalog (see statscatalog.py)
+# ---------------------------------------------------------------------------
+
+def read_zone_importance_csv(csv_path):
+    """(term bytes, {zone name: score}) for every row of zoneimportance.csv, in byte order."""
+    rows = []
+    with open(csv_path, 'r', newline='') as f:
+        reader = csv.reader(f)
+        next(reader, None)  # Skip the header
+        for row in reader:
+            rows.append((row[1].encode('utf-8'), json.loads(row[2])))
+    rows.sort(key=lambda row: row[0])
+    return rows
+
+
+def convert_stats_catalog(zone_importance, directory, zone_segments, version):
+    """
+    Write the stats catalog of a local index from the statscatalog/ tfidfindexcreator.py
+    builds, or from a zoneimportance.csv. zone_segments: {zone: Segment} of the index's
+    first segment, in manifest zone order; zone ids follow that order, zone statistics and
+    dfs come from the segments, and scores of zones the index does not have are dropped.
+    """
+    if os.path.isdir(zone_importance):
+        rows = ((term, {zone: score for zone, (score, _) in entries.items()})
+                for term, entries in StatsCatalog(zone_importance).rows())
+    else:
+        rows = read_zone_importance_csv(zone_importance)
+    zone_ids = {zone: i for i, zone in enumerate(zone_segments)}
+    segments = list(zone_segments.values())
+
+    def term_rows():
+        for term, zone_scores in rows:
+            entries = []
+            for zone, score in zone_scores.items():
+                if zone in zone_ids:
+                    segment = segments[zone_ids[zone]]
+                    term_id = segment.find(term.decode('utf-8'))
+                    entries.append((zone_ids[zone], score, int(segment.dfs[term_id]) if term_id >= 0 else 0))
+            yield term, entries
+
+    zone_stats = [(zone, segment.num_docs, segment.total_length) for zone, segment in zone_segments.items()]
+    write_stats_catalog(directory, version, zone_stats, term_rows())
+
+
+def create_index(output_directory, zone_importance, zone_names, impact_bits=16):
+    """
+    Write the manifest of a fresh index whose only segment, segments/seg000000, has been
+    written already, and build its stats catalog.
+    """
+    directory = segment_directory(output_directory, 'seg000000')
+    zone_segments = {zone: Segment(segment_path(directory, zone)) for zone in zone_names}
+    doc_ids = [segment.doc_ids for segment in zone_segments.values()]
+    write_segment_docs(output_directory, 'seg000000', np.concatenate(doc_ids) if doc_ids else [])
+
+    generation = next_generation()
+    convert_stats_catalog(zone_importance, os.path.join(output_directory, 'statscatalog'), zone_segments, generation)
+
+    manifest = {
+        'generation': generation,
+        'impact_bits': impact_bits,
+        'zones': list(zone_names),
+        'segments': [{'name': 'seg000000', 'deletes': None}],
+        'next_segment': 1,
+        'catalog': 'statscatalog'
+    }
+    write_manifest(output_directory, manifest)
+    print(f'Local index written to {output_directory}')
+
+
+def convert_csv_index(csv_directory, zone_importance, output_directory, impact_bits=16):
+    """
+    Build a local index directory from the CSV outputs of the bm25architecture scripts.
+    Zone lengths are read from the bm25doclengths directory next to csv_directory.
+    """
+    zone_files = sorted(f for f in os.listdir(csv_directory) if f.endswith('.csv') and not f.startswith('.'))
+    doclength_directory = os.path.join(os.path.dirname(os.path.abspath(csv_directory)), 'bm25doclengths')
+    directory = segment_directory(output_directory, 'seg000000')
+    os.makedirs(directory, exist_ok=True)
+
+    zone_doc_lengths = {}
+    for filename in zone_files:
+        doclength_csv = os.path.join(doclength_directory, filename)
+        if not os.path.exists(doclength_csv):
+            raise FileNotFoundError(f"{doclength_csv} is missing, rerun tfidfindexcreator.py to write the zone lengths")
+        zone_doc_lengths[filename.replace('.csv', '')] = read_zone_doclengths_csv(doclength_csv)
+    # The impacts stored in the segment share the scale of the largest zone, as the reader's do
+    impact_scale = zone_impact_scale(max((len(doc_ids) for doc_ids, _ in zone_doc_lengths.values()), default=0), impact_bits)
+
+    zones = []
+    for filename in zone_files:
+        zone = filename.replace('.csv', '')
+        doc_ids, doc_lengths = zone_doc_lengths[zone]
+        num_terms, num_postings = convert_zone_csv(
+            os.path.join(csv_directory, filename), segment_path(directory, zone), doc_ids, doc_lengths,
+            impact_scale, impact_bits
+        )
+        zones.append(zone)
+        print(f'Converted index for {zone}: {num_terms} terms, {num_postings} postings.')
+
+    create_index(output_directory, zone_importance, zones, impact_bits)
+
+
+def assemble_segment_index(segments_directory, zone_importance, output_directory, impact_bits=16):
+    """Build a local index directory from segments written directly by tfidfindexcreator.py."""
+    directory = segment_directory(output_directory, 'seg000000')
+    os.makedirs(directory, exist_ok=True)
+    zones = []
+    for filename in sorted(os.listdir(segments_directory)):
+        if filename.endswith('.seg'):
+            shutil.copyfile(os.path.join(segments_directory, filename), os.path.join(directory, filename))
+            zones.append(filename[:-len('.seg')])
+    create_index(output_directory, zone_importance, zones, impact_bits)
+
+
+# ---------------------------------------------------------------------------
+# Reader
+# ---------------------------------------------------------------------------
+
+class IndexSegment:
+    """One segment of a LocalIndex: its zone segments and tombstoned documents."""
+
+    def __init__(self, directory, segment_info):
+        self.name = segment_info['name']
+        self.directory = segment_directory(directory, self.name)
+        self.doc_ids = np.load(os.path.join(self.directory, 'docs.npy'))
+        self.deleted_ids = self.doc_ids[read_segment_deletes(directory, segment_info, len(self.doc_ids))]
+        self.zones = {}
+        for filename in os.listdir(self.directory):
+            if filename.endswith('.seg'):
+                self.zones[filename[:-len('.seg')]] = Segment(os.path.join(self.directory, filename))
+
+    def is_deleted(self, doc_ids):
+        """Bool mask of which doc_ids are tombstoned in this segment."""
+        if not len(self.deleted_ids):
+            return np.zeros(len(doc_ids), dtype=bool)
+        positions = np.minimum(np.searchsorted(self.deleted_ids, doc_ids), len(self.deleted_ids) - 1)
+        return self.deleted_ids[positions] == doc_ids
+
+    def live_zone_stats(self, zone):
+        """(live documents with this zone, their total zone length)."""
+        segment = self.zones[zone]
+        if not len(self.deleted_ids):
+            return segment.num_docs, segment.total_length
+        deleted = self.is_deleted(segment.doc_ids.astype(np.int64))
+        return segment.num_docs - int(deleted.sum()), segment.total_length - int(segment.doc_lengths[deleted].sum())
+
+
+class LocalIndex:
+    """
+    Read-only view over an index directory. Corpus-wide statistics (live documents and
+    average length per zone, live df per term) are taken over every segment minus the
+    tombstoned documents. A zone whose live documents are all in one segment is scored
+    with the impacts stored in that segment, which were computed with exactly these
+    statistics; otherwise BM25 impacts are computed from them when postings are read.
+    """
+
+    def __init__(self, directory):
+        manifest_path = os.path.join(directory, MANIFEST_FILE)
+        self.manifest_mtime = os.stat(manifest_path).st_mtime_ns
+        manifest = read_manifest(directory)
+        if 'segments' not in manifest:
+            raise ValueError(f"{directory} was written by an older localindex.py, rebuild it with from-segments or from-csv")
+        self.directory = directory
+        self.generation = manifest['generation']
+        self.impact_bits = manifest['impact_bits']
+        self.zone_names = manifest['zones']
+        self.segments = [IndexSegment(directory, segment_info) for segment_info in manifest['segments']]
+
+        self.zone_info = {}
+        for segment in self.segments:
+            for zone in segment.zones:
+                num_docs, total_length = segment.live_zone_stats(zone)
+                info = self.zone_info.setdefault(zone, {'num_docs': 0, 'total_length': 0})
+                info['num_docs'] += num_docs
+                info['total_length'] += total_length
+        for info in self.zone_info.values():
+            info['avg_doc_length'] = info['total_length'] / info['num_docs'] if info['num_docs'] else 1.0
+
+        self.num_docs = max((int(segment.doc_ids[-1]) + 1 for segment in self.segments if len(segment.doc_ids)), default=0)
+        largest_zone = max((info['num_docs'] for info in self.zone_info.values()), default=0)
+        self.impact_scale = zone_impact_scale(largest_zone, self.impact_bits)
+
+        # Zones held by one segment without tombstoned documents: that segment's statistics are
+        # the corpus-wide ones, so its stored impacts (if written with this scale) are final
+        self.stored_impacts = {}
+        for zone, info in self.zone_info.items():
+            holders = [segment.zones[zone] for segment in self.segments if zone in segment.zones]
+            segment = holders[0]
+            if (len(holders) == 1 and segment.num_docs == info['num_docs'] and segment.impact_bits == self.impact_bits
+                    and segment.impact_scale == self.impact_scale):
+                self.stored_impacts[zone] = segment
+
+        # Zone importances and dfs as of the last commit (see IndexWriter), N and average lengths of this generation
+        self.catalog = StatsCatalog(
+            os.path.join(directory, manifest.get('catalog', 'statscatalog')),
+            {zone: (info['num_docs'], info['total_length']) for zone, info in self.zone_info.items()},
+            self.generation
+        )
+
+    def reopen(self):
+        """The index at the same directory if its manifest has changed since this one was opened, else self."""
+        try:
+            if os.stat(os.path.join(self.directory, MANIFEST_FILE)).st_mtime_ns == self.manifest_mtime:
+                return self
+        except FileNotFoundError:
+            return self
+        try:
+            return LocalIndex(self.directory)
+        except FileNotFoundError:
+            # The manifest read is more than one generation old and its files are gone already;
+            # keep serving this snapshot, the next call opens the newest manifest
+            return self
+
+    def is_live(self, doc_ids):
+        """Bool mask of which doc_ids are in a segment of this index without being deleted there."""
+        doc_ids = np.asarray(doc_ids, dtype=np.int64)
+        live = np.zeros(len(doc_ids), dtype=bool)
+        for segment in self.segments:
+            live |= np.isin(doc_ids, segment.doc_ids) & ~segment.is_deleted(doc_ids)
+        return live
+
+    def avg_doc_length(self, zone_name):
+        info = self.zone_info.get(zone_name)
+        return info['avg_doc_length'] if info else 1.0
+
+    def zone_importance(self, term):
+        """Same shape as the get_zonei_score RPC: {zone_name: score} or None."""
+        return self.catalog.zone_importance(term)
+
+    def raw_postings(self, zone_name, term):
+        """Live (doc_ids, freqs, zone lengths) of a term across all segments, sorted by doc id, or None."""
+        parts = []
+        for segment in self.segments:
+            zone_segment = segment.zones.get(zone_name)
+            postings = zone_segment.postings(term) if zone_segment is not None else None
+            if postings is None:
+                continue
+            doc_ids, freqs = postings
+            live = ~segment.is_deleted(doc_ids)
+            if not live.all():
+                doc_ids, freqs = doc_ids[live], freqs[live]
+            if len(doc_ids):
+                parts.append((doc_ids, freqs, zone_segment.lengths_of(doc_ids)))
+        if not parts:
+            return None
+
+        doc_ids, freqs, lengths = (np.concatenate(column) for column in zip(*parts))
+        # Updated documents move to newer segments, so ids from different segments can interleave
+        if len(parts) > 1 and np.any(np.diff(doc_ids) < 0):
+            order = np.argsort(doc_ids, kind='stable')
+            doc_ids, freqs, lengths = doc_ids[order], freqs[order], lengths[order]
+        return doc_ids, freqs, lengths
+
+    def postings(self, zone_name, term):
+        """Return (doc_ids, quantized BM25 impacts) arrays for a term in a zone, or None."""
+        segment = self.stored_impacts.get(zone_name)
+        if segment is not None:
+            term_id = segment.find(term)
+            if term_id < 0:
+                return None
+            doc_ids, _ = segment.postings_at(term_id)
+            return doc_ids, segment.impacts_at(term_id)
+
+        raw = self.raw_postings(zone_name, term)
+        if raw is None:
+            return None
+        doc_ids, freqs, lengths = raw
+        info = self.zone_info[zone_name]
+        impacts = bm25_impacts(freqs, lengths, len(doc_ids), info['num_docs'], info['avg_doc_length'])
+        return doc_ids, quantize_impacts(impacts, self.impact_scale, self.impact_bits)
+
+
+def load_local_index(directory):
+    """Open the local index at `directory`, or return None if it has not been built."""
+    if not os.path.exists(os.path.join(directory, MANIFEST_FILE)):
+        return None
+    return LocalIndex(directory)
+
+
+# Build the local index from the bm25architecture outputs
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the local index from the bm25architecture outputs.")
+    parser.add_argument('--impact-bits', type=int, choices=sorted(IMPACT_DTYPES), default=16,
+                        help="width of the quantized per-posting impact scores")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    from_csv = commands.add_parser('from-csv', help="convert existing bm25indexdata CSVs")
+    from_csv.add_argument('csv_directory', help="bm25indexdata directory written by tfidfindexcreator.py")
+    from_csv.add_argument('zone_importance', help="statscatalog directory or zoneimportance.csv")
+    from_csv.add_argument('output_directory')
+
+    from_segments = commands.add_parser('from-segments', help="use the bm25segments written by tfidfindexcreator.py")
+    from_segments.add_argument('segment_directory')
+    from_segments.add_argument('zone_importance', help="bm25architecture/statscatalog written by tfidfindexcreator.py, or a zoneimportance.csv")
+    from_segments.add_argument('output_directory')
+
+    args = parser.parse_args()
+    if args.command == 'from-csv':
+        convert_csv_index(args.csv_directory, args.zone_importance, args.output_directory, args.impact_bits)
+    else:
+        assemble_segment_index(args.segment_directory, args.zone_importance, args.output_directory, args.impact_bits)
@@ -1,28 +1,100 @@
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from groq import Groq
-from pydantic import BaseModel
-from typing import List
+from contextlib import asynccontextmanager
+from pydantic import BaseModel, Field
+from typing import List, Optional
 import os
+import time
 import uvicorn
 import logging
-from sentence_transformers import SentenceTransformer
+import threading
 from dotenv import load_dotenv
-from search_engine import search  # Import the search function from search_engine
+from search_engine import search, queryprocessor, result_cache, postings_cache  # Import the search function from search_engine
 from filmchat_engine import filmchatengine
+from queryencoder import QueryEncoder
+from boundedexecutor import BoundedExecutor, ExecutorOverloaded
+from resultcache import SingleFlight
+from resultsets import ResultSetStore
+from docstore import DOCSTORE_DIR, load_doc_store, film_object
+from snippets import CARD_FIELDS, film_card, query_terms
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Initialize FastAPI
-app = FastAPI()
-
 # Load environment variables from .env file
 load_dotenv()
 
-# Initialize the SentenceTransformer model
-model = SentenceTransformer('all-MiniLM-L6-v2')
+# Set to 0 to skip warming up the encoder, index and clients before serving
+WARMUP = os.environ.get('WARMUP', '1') == '1'
+
+# Embeds texts for /encode (film chat), micro-batching concurrent requests; /search does not
+# embed. It uses the process-wide sentence encoder (all-MiniLM-L6-v2 on PyTorch, or int8 ONNX
+# with ENCODER_BACKEND=onnx), loaded once by the warm-up or the first /encode request.
+query_encoder = QueryEncoder()
+
+# Blocking work runs on bounded thread pools so a slow query never stalls the event loop:
+# index lookups, Supabase RPCs and scoring on one, Groq chat completions on another
+search_executor = BoundedExecutor(
+    'search', int(os.environ.get('SEARCH_WORKERS', 4)), int(os.environ.get('SEARCH_MAX_QUEUE', 64))
+)
+llm_executor = BoundedExecutor(
+    'llm', int(os.environ.get('LLM_WORKERS', 8)), int(os.environ.get('LLM_MAX_QUEUE', 64))
+)
+
+# Concurrent identical searches (same tokens and k) await one computation on the event loop,
+# so a burst of one popular query takes one search worker instead of all of them
+search_flights = SingleFlight()
+
+# Ranked lists of paged searches, read page by page through /search/page with an opaque cursor
+result_sets = ResultSetStore(
+    int(os.environ.get('RESULT_SETS_MAX', 10000)),
+    int(os.environ.get('RESULT_SETS_MAX_IDS', 5_000_000)),
+    float(os.environ.get('RESULT_SETS_TTL', 3600))
+)
+
+# Compressed local copy of every film (docstore.py build ...), so a page of results is turned
+# into film objects with one local read instead of an RPC per film; None if it has not been built
+doc_store = load_doc_store(DOCSTORE_DIR)
+
+# The Groq client is created on first use; importing groq is a noticeable part of cold start
+groq_client = None
+groq_client_lock = threading.Lock()
+
+def get_groq_client():
+    global groq_client
+    with groq_client_lock:
+        if groq_client is None:
+            from groq import Groq
+            groq_client = Groq(
+                api_key=os.getenv('GROQ_KEY')  # Replace with your actual Groq API key
+            )
+        return groq_client
+
+async def warm_up():
+    # Load the model and run one inference, touch the index and caches with one search, and
+    # create the Groq client, so the first real requests do not pay for any of it
+    steps = [
+        ("encoder", lambda: query_encoder.encode_async("warm up")),
+        ("search", lambda: search_executor.run(search, "film", None, 18)),
+        ("groq client", lambda: llm_executor.run(get_groq_client)),
+    ]
+    for name, step in steps:
+        start = time.perf_counter()
+        try:
+            await step()
+            logger.info(f"Warm-up {name}: {time.perf_counter() - start:.2f}s")
+        except Exception:
+            logger.warning(f"Warm-up {name} failed", exc_info=True)
+
+@asynccontextmanager
+async def lifespan(app):
+    if WARMUP:
+        await warm_up()
+    yield
+
+# Initialize FastAPI
+app = FastAPI(lifespan=lifespan)
 
 # Define data models for request payloads
 class SentenceInput(BaseModel):
@@ -30,7 +102,21 @@ class SentenceInput(BaseModel):
 
 class SearchQuery(BaseModel):
     query: str  # User's text query
-    vector: List[float]  # Precomputed vector for the user query
+    vector: Optional[List[float]] = None  # Precomputed vector for the user query; ranking does not need it
+    k: Optional[int] = Field(default=None, ge=1)  # Only return the top k films (pruned retrieval); all films if omitted
+    page_size: Optional[int] = Field(default=None, ge=1)  # Keep the ranked list server-side and return its first page and a cursor
+    fields: Optional[List[str]] = None  # Also return the films, with only these film_details fields (needs page_size or k); paged searches default to CARD_FIELDS
+    snippets: bool = True  # With fields, add a query-highlighted snippet of each film's best-matching zone
+
+class SearchPageQuery(BaseModel):
+    cursor: str  # Cursor returned by a paged /search
+    page: int = Field(default=1, ge=1)
+    fields: Optional[List[str]] = None  # film_details fields of the returned films; CARD_FIELDS if omitted
+    snippets: bool = True
+
+class FilmsQuery(BaseModel):
+    ids: List[int]  # Film ids (docIDs), e.g. one page of search results
+    fields: Optional[List[str]] = None  # Only return these fields (title, poster, cleaned zone names); all if omitted
 
 class filmchatQuery(BaseModel):
     filmobject: dict  # User's text query
@@ -45,37 +131,88 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize the Groq client with the API key
-client = Groq(
-    api_key=os.getenv('GROQ_KEY')  # Replace with your actual Groq API key
-)
-
 # `encode` endpoint to generate vector embeddings for a given sentence
 @app.post('/encode')
 async def encodetext(sentence_input: SentenceInput) -> List[float]:
     sentence = sentence_input.sentence
-    encoded_vector = model.encode(sentence).tolist()
+    encoded_vector = (await query_encoder.encode_async(sentence)).tolist()
     return encoded_vector
 
+# Film cards (projected film objects with snippets) of a list of film ids, from one local read;
+# None where the document store has no film
+def film_cards(film_ids, fields, query, snippets):
+    terms = query_terms(query) if snippets and query else None
+    documents = doc_store.get_many(film_ids)
+    return [None if document is None else film_card(film_id, document, fields, terms) for film_id, document in zip(film_ids, documents)]
+
 # `search` endpoint to handle search queries with a query and its vector
 @app.post("/search")
 async def perform_search(query: SearchQuery):
+    # Films are read for every returned id, so an unbounded result list cannot ask for them
+    if query.fields is not None and query.page_size is None and query.k is None:
+        raise HTTPException(status_code=400, detail="fields needs page_size or k")
     try:
-        # Pass both the query string and the vector to the search function
-        results = search(query.query, query.vector)
-        return {"results": results}
+        # BM25 ranking only needs the query text, so text-only requests are not embedded
+        key = (tuple(queryprocessor(query.query)), query.k)
+        results = list(await search_flights.run(key, lambda: search_executor.run(search, query.query, query.vector, query.k)))
+        if query.page_size is None:
+            response = {"results": results}
+        else:
+            cursor = result_sets.put(results, query.page_size, query.query)
+            page_results, pages, total, _ = result_sets.page(cursor, 1)
+            response = {"results": page_results, "cursor": cursor, "page": 1, "pages": pages, "total": total}
+        # Pages (and searches with a field projection) come with their films, so the caller needs no
+        # per-film lookups; a page shows result cards unless other fields are asked for
+        fields = query.fields
+        if fields is None and query.page_size is not None:
+            fields = CARD_FIELDS
+        if fields is not None and doc_store is not None:
+            response["films"] = await search_executor.run(film_cards, response["results"], fields, query.query, query.snippets)
+        return response
+    except ExecutorOverloaded as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         # Log the exception for debugging
         logger.error("Search failed", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
+# `search/page` endpoint to return one page of the ranked list of a paged search
+@app.post("/search/page")
+async def search_page(query: SearchPageQuery):
+    page = result_sets.page(query.cursor, query.page)
+    if page is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired cursor, run the search again")
+    page_results, pages, total, search_query = page
+    response = {"results": page_results, "cursor": query.cursor, "page": query.page, "pages": pages, "total": total}
+    if doc_store is not None:
+        fields = query.fields if query.fields is not None else CARD_FIELDS
+        try:
+            response["films"] = await search_executor.run(film_cards, page_results, fields, search_query, query.snippets)
+        except ExecutorOverloaded as e:
+            raise HTTPException(status_code=503, detail=str(e))
+    return response
+
+# `films` endpoint to return the film objects of a list of film ids from the local document store,
+# in the order given, with null for ids it does not hold
+@app.post("/films")
+async def get_films(query: FilmsQuery):
+    if doc_store is None:
+        raise HTTPException(status_code=503, detail="Document store not built")
+    try:
+        documents = await search_executor.run(doc_store.get_many, query.ids, query.fields)
+    except ExecutorOverloaded as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    return {"films": [None if document is None else film_object(film_id, document) for film_id, document in zip(query.ids, documents)]}
+
 # `filmchat` endpoint to handle question queries within a paritcular film (film chat) feature - returns the aspect of the film to focus on for answering the question
 @app.post("/filmchat")
 async def answer_filmquestion(query: filmchatQuery):
     try:
         # Pass both the query string and the vector to the search function
-        results = filmchatengine(query.vector, query.filmobject)
+        results = await search_executor.run(filmchatengine, query.vector, query.filmobject)
         return {"results": results}
+    except ExecutorOverloaded as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         # Log the exception for debugging
         logger.error("Search failed", exc_info=True)
@@ -104,20 +241,24 @@ async def extract_data(request: answerQuery):
 
     try:
         # Use the Groq client to create a chat completion with the constructed prompt
-        chat_completion = client.chat.completions.create(
-            messages=[
-                {
-                    "role": "user",
-                    "content": prompt
-                }
-            ],
-            model="llama-3.3-70b-versatile"  # Ensure this model is supported
+        chat_completion = await llm_executor.run(
+            lambda: get_groq_client().chat.completions.create(
+                messages=[
+                    {
+                        "role": "user",
+                        "content": prompt
+                    }
+                ],
+                model="llama-3.3-70b-versatile"  # Ensure this model is supported
+            )
         )
 
         # Extract the content from the response
         extracted_data = chat_completion.choices[0].message.content
 
         return {extracted_data}
+    except ExecutorOverloaded as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         # Log the exception for debugging
         logger.error("An error occurred", exc_info=True)
@@ -128,6 +269,19 @@ async def extract_data(request: answerQuery):
 async def read_root():
     return {"message": "API is running"}
 
+# Executor, encoder and cache counters, e.g. to watch a load test
+@app.get("/stats")
+async def read_stats():
+    return {
+        "result_cache": result_cache.stats(),
+        "search_flights": search_flights.stats(),
+        "result_sets": result_sets.stats(),
+        "postings_cache": postings_cache.stats(),
+        "search_executor": search_executor.stats(),
+        "llm_executor": llm_executor.stats(),
+        "query_encoder": query_encoder.stats()
+    }
+
 # Run the FastAPI app with Uvicorn if executed as the main program
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 8000))
@@ -0,0 +1,114 @@
+import threading
+from collections import OrderedDict
+import numpy as np
+
+
+def postings_nbytes(postings):
+    """Approximate memory held by a (doc_ids, impacts) posting list."""
+    if postings is None:
+        return 64
+    doc_ids, impacts = postings
+    if isinstance(doc_ids, np.ndarray):
+        return doc_ids.nbytes + np.asarray(impacts).nbytes + 64
+    # Python lists of ints/floats: pointer + boxed object per entry
+    return len(doc_ids) * 64 + 64
+
+
+class PostingsCache:
+    """
+    Process-wide LRU cache of posting lists keyed by (zone, term), bounded by a byte budget.
+    Entries belong to one index generation; a new generation drops everything.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.generation = None
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _check_generation(self, generation):
+        if generation != self.generation:
+            self._entries.clear()
+            self.current_bytes = 0
+            self.generation = generation
+
+    def get(self, generation, zone, term):
+        """Return (found, postings)."""
+        with self._lock:
+            self._check_generation(generation)
+            entry = self._entries.get((zone, term))
+            if entry is None:
+                self.misses += 1
+                return False, None
+            self._entries.move_to_end((zone, term))
+            self.hits += 1
+            return True, entry[0]
+
+    def put(self, generation, zone, term, postings):
+        size = postings_nbytes(postings)
+        with self._lock:
+            self._check_generation(generation)
+            if size > self.max_bytes:
+                return
+            old = self._entries.pop((zone, term), None)
+            if old is not None:
+                self.current_bytes -= old[1]
+            self._entries[(zone, term)] = (postings, size)
+            self.current_bytes += size
+            # Evict least recently used entries until we are back under budget
+            while self.current_bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.current_bytes -= evicted_size
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self.current_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'generation': self.generation
+            }
+
+
+class QueryPostingsMemo:
+    """
+    Per-query view over the backend's query data. Every (zone, term) posting list and
+    every zone importance is fetched at most once per query, and posting lists are shared
+    across queries through the process-wide PostingsCache.
+    """
+
+    def __init__(self, query_data, cache, generation):
+        self.query_data = query_data
+        self.cache = cache
+        self.generation = generation
+        self.fetches = 0
+        self._postings = {}
+        self._zone_importances = {}
+        self._avg_lengths = {}
+
+    def zone_importance(self, word):
+        if word not in self._zone_importances:
+            self._zone_importances[word] = self.query_data.zone_importance(word)
+        return self._zone_importances[word]
+
+    def avg_doc_length(self, zone):
+        if zone not in self._avg_lengths:
+            self._avg_lengths[zone] = self.query_data.avg_doc_length(zone)
+        return self._avg_lengths[zone]
+
+    def postings(self, zone, word):
+        key = (zone, word)
+        if key in self._postings:
+            return self._postings[key]
+        found, postings = self.cache.get(self.generation, zone, word)
+        if not found:
+            postings = self.query_data.postings(zone, word)
+            self.fetches += 1
+            self.cache.put(self.generation, zone, word, postings)
+        self._postings[key] = postings
+        return postings
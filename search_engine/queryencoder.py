@@ -0,0 +1,147 @@
+import os
+import time
+import queue
+import asyncio
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+import numpy as np
+from sentenceencoder import get_encoder
+
+# Largest batch handed to model.encode, and how long the first request of a batch waits for company
+ENCODE_MAX_BATCH = int(os.environ.get('ENCODE_MAX_BATCH', 32))
+ENCODE_MAX_WAIT_MS = float(os.environ.get('ENCODE_MAX_WAIT_MS', 5))
+
+# Normalized query texts whose embeddings are kept
+EMBEDDING_CACHE_SIZE = int(os.environ.get('EMBEDDING_CACHE_SIZE', 4096))
+
+
+def normalize_query(text):
+    """
+    Cache key and encoded text of a query: lowercased with whitespace collapsed. all-MiniLM-L6-v2
+    lowercases and splits on whitespace itself, so this never changes the embedding.
+    """
+    return ' '.join(text.lower().split())
+
+
+class EmbeddingCache:
+    """Process-wide LRU cache of query embeddings keyed by normalized query text."""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            vector = self._entries.get(key)
+            if vector is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return vector
+
+    def put(self, key, vector):
+        with self._lock:
+            if self.max_entries <= 0:
+                return
+            self._entries[key] = vector
+            self._entries.move_to_end(key)
+            # Evict least recently used queries
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'max_entries': self.max_entries, 'hits': self.hits, 'misses': self.misses}
+
+
+class QueryEncoder:
+    """
+    Embeds query texts in-process. Requests from concurrent callers are gathered by one worker
+    thread into micro-batches: a batch is encoded once it has max_batch texts or its first text
+    has waited max_wait_ms. Repeated queries are answered from the embedding cache, and
+    identical texts in flight share one encoding. Without a model it uses the shared encoder,
+    loaded by the first batch.
+    """
+
+    def __init__(self, model=None, max_batch=ENCODE_MAX_BATCH, max_wait_ms=ENCODE_MAX_WAIT_MS, cache_size=EMBEDDING_CACHE_SIZE):
+        self.model = model
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max_wait_ms / 1000
+        self.cache = EmbeddingCache(cache_size)
+        self.batches = 0
+        self.encoded = 0
+        self._queue = queue.Queue()
+        self._pending = {}  # normalized text -> Future of its embedding, while queued or encoding
+        self._lock = threading.Lock()
+        self._worker = None
+
+    def submit(self, text):
+        """A concurrent.futures.Future of the (read-only, float32) embedding of `text`."""
+        key = normalize_query(text)
+        vector = self.cache.get(key)
+        if vector is not None:
+            future = Future()
+            future.set_result(vector)
+            return future
+        with self._lock:
+            future = self._pending.get(key)
+            if future is not None:
+                return future
+            future = Future()
+            self._pending[key] = future
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name='query-encoder', daemon=True)
+                self._worker.start()
+        self._queue.put(key)
+        return future
+
+    def encode(self, text):
+        """Embedding of `text`, blocking until its batch is encoded."""
+        return self.submit(text).result()
+
+    async def encode_async(self, text):
+        """Embedding of `text` without blocking the event loop."""
+        return await asyncio.wrap_future(self.submit(text))
+
+    def _next_batch(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            try:
+                if self.model is None:
+                    self.model = get_encoder()
+                vectors = np.asarray(self.model.encode(batch, batch_size=len(batch)), dtype=np.float32)
+            except Exception as e:
+                with self._lock:
+                    futures = [self._pending.pop(key) for key in batch]
+                for future in futures:
+                    future.set_exception(e)
+                continue
+            self.batches += 1
+            self.encoded += len(batch)
+            for key, vector in zip(batch, vectors):
+                vector.setflags(write=False)  # Shared by every caller and the cache
+                self.cache.put(key, vector)
+                with self._lock:
+                    future = self._pending.pop(key)
+                future.set_result(vector)
+
+    def stats(self):
+        return {'batches': self.batches, 'encoded': self.encoded, 'cache': self.cache.stats()}
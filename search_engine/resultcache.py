@@ -0,0 +1,125 @@
+import time
+import asyncio
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+
+
+class ResultCache:
+    """
+    Process-wide LRU cache of ranked results keyed by the normalized query (its token list
+    and k), with a TTL. Entries belong to one index generation; a new generation drops
+    everything. Concurrent misses on the same key are coalesced: the first caller computes
+    and the others wait for its result (single-flight). Waiting blocks the calling thread;
+    async endpoints coalesce before taking an executor thread instead (see SingleFlight).
+    """
+
+    def __init__(self, max_entries, ttl_seconds):
+        self.max_entries = max_entries
+        self.ttl = ttl_seconds
+        self.generation = None
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.expired = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._entries = OrderedDict()  # key -> (results, expiry time)
+        self._in_flight = {}  # (generation, key) -> Future of the results being computed
+        self._lock = threading.Lock()
+
+    def _check_generation(self, generation):
+        if generation != self.generation:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self.generation = generation
+
+    def get_or_compute(self, generation, key, compute):
+        """Cached results for `key`, or compute() them once however many callers ask at the same time."""
+        with self._lock:
+            self._check_generation(generation)
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[1] > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return list(entry[0])
+                del self._entries[key]
+                self.expired += 1
+            future = self._in_flight.get((generation, key))
+            if future is not None:
+                self.coalesced += 1
+                leader = False
+            else:
+                self.misses += 1
+                future = Future()
+                self._in_flight[(generation, key)] = future
+                leader = True
+
+        if not leader:
+            return list(future.result())
+
+        try:
+            results = compute()
+        except BaseException as e:
+            with self._lock:
+                del self._in_flight[(generation, key)]
+            future.set_exception(e)
+            raise
+        with self._lock:
+            del self._in_flight[(generation, key)]
+            # Results computed against an older generation are returned but not cached
+            if generation == self.generation and self.max_entries > 0:
+                self._entries[key] = (tuple(results), time.monotonic() + self.ttl)
+                self._entries.move_to_end(key)
+                # Evict least recently used queries
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+                    self.evictions += 1
+        future.set_result(tuple(results))
+        return list(results)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'coalesced': self.coalesced,
+                'expired': self.expired,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'in_flight': len(self._in_flight),
+                'generation': self.generation
+            }
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent identical calls on the event loop: the first caller of a key starts
+    the call and every caller awaits its result, so waiters hold no executor thread. A caller
+    that goes away (e.g. a disconnected client) does not cancel the call the others await.
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.coalesced = 0
+        self._in_flight = {}  # key -> asyncio.Task of the running call
+
+    async def run(self, key, call):
+        """Result of `call()` (a coroutine function), shared with concurrent callers of `key`."""
+        task = self._in_flight.get(key)
+        if task is None:
+            self.calls += 1
+            task = asyncio.ensure_future(call())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def stats(self):
+        return {'calls': self.calls, 'coalesced': self.coalesced, 'in_flight': len(self._in_flight)}
@@ -0,0 +1,84 @@
+import math
+import time
+import secrets
+import threading
+from collections import OrderedDict
+import numpy as np
+
+
+class ResultSetStore:
+    """
+    Ranked result lists kept server-side so clients page through them with a short opaque
+    cursor instead of holding (and re-sending) every film id. Bounded by the number of
+    result sets and by the total number of ids held, least recently used evicted first, and
+    each set expires ttl_seconds after it was last read.
+    """
+
+    def __init__(self, max_sets, max_ids, ttl_seconds):
+        self.max_sets = max_sets
+        self.max_ids = max_ids
+        self.ttl = ttl_seconds
+        self.current_ids = 0
+        self.created = 0
+        self.evictions = 0
+        self.expired = 0
+        self._sets = OrderedDict()  # cursor -> [film ids (int64 array), page size, expiry time, query]
+        self._lock = threading.Lock()
+
+    def _remove(self, cursor):
+        film_ids = self._sets.pop(cursor)[0]
+        self.current_ids -= len(film_ids)
+
+    def put(self, film_ids, page_size, query=None):
+        """Store a ranked list, and the query it answers (for snippets), and return its cursor."""
+        film_ids = np.asarray(film_ids, dtype=np.int64)
+        cursor = secrets.token_urlsafe(16)
+        now = time.monotonic()
+        with self._lock:
+            # Sets are in last-read order, so the expired ones are at the front
+            while self._sets and next(iter(self._sets.values()))[2] <= now:
+                self._remove(next(iter(self._sets)))
+                self.expired += 1
+            self._sets[cursor] = [film_ids, page_size, now + self.ttl, query]
+            self.current_ids += len(film_ids)
+            self.created += 1
+            # Evict least recently used result sets until we are back under both bounds; a
+            # single set larger than max_ids is still kept on its own
+            while len(self._sets) > 1 and (len(self._sets) > self.max_sets or self.current_ids > self.max_ids):
+                self._remove(next(iter(self._sets)))
+                self.evictions += 1
+        return cursor
+
+    def page(self, cursor, page):
+        """
+        (film ids of 1-based `page`, number of pages, total films, query), or None if the cursor
+        is unknown or has expired. Pages past the end are empty.
+        """
+        with self._lock:
+            entry = self._sets.get(cursor)
+            if entry is None:
+                return None
+            film_ids, page_size, expiry, query = entry
+            now = time.monotonic()
+            if expiry <= now:
+                self._remove(cursor)
+                self.expired += 1
+                return None
+            entry[2] = now + self.ttl
+            self._sets.move_to_end(cursor)
+        pages = max(1, math.ceil(len(film_ids) / page_size))
+        start = (page - 1) * page_size
+        return film_ids[start:start + page_size].tolist(), pages, len(film_ids), query
+
+    def stats(self):
+        with self._lock:
+            return {
+                'sets': len(self._sets),
+                'max_sets': self.max_sets,
+                'ids': self.current_ids,
+                'max_ids': self.max_ids,
+                'ttl_seconds': self.ttl,
+                'created': self.created,
+                'evictions': self.evictions,
+                'expired': self.expired
+            }
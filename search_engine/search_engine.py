@@ -1,52 +1,38 @@
-import json
-from bm25config import supabase
-from sklearn.metrics.pairwise import cosine_similarity
+import os
+import logging
+from searchbackend import get_backend
+from postingscache import PostingsCache, QueryPostingsMemo
+from resultcache import ResultCache
+from titleindex import TITLE_INDEX_DIR, load_title_index
 import numpy as np
-from vectormodel import model
-import ast
-from collections import defaultdict
 import re
 
-# BM25 Hyperparameters
-k1 = 1.5
-b = 0.75
-initial_ratio_threshold = 0.5
-long_query_threshold = 7
-DEFAULT_DOC_LENGTH = 1000
+logger = logging.getLogger(__name__)
+
+# BM25 saturation (k1, b) is never applied here: postings carry final per-film impact scores
+# (idf x saturated tf), stored by the index build or computed by the backend, so scoring here
+# is plain summation.
+MAX_QUERY_TERMS = 64  # One bit per word in the per-film coverage bitmask
+SKIP_SEARCH_RATIO = 16  # Top-k: binary-search a posting list when it is this many times longer than the candidate set
 MIN_RESULTS_THRESHOLD = 3  # Minimum number of results before trying word dropping
 
-def queryprocessor(query):
-    q_list = re.split(r'\W+', query.lower())
-    tokenized_words = [word for word in q_list if word]
-    print("Tokenized Words:", tokenized_words)
-    return tokenized_words
+# Local memory-mapped index if it has been built, Supabase RPCs otherwise
+backend = get_backend()
 
-def similarity_score(raw_vector1, raw_vector2):
-    vector1 = np.array(raw_vector1)
-    vector2 = np.array(raw_vector2)
-    return round(float(cosine_similarity([vector1], [vector2])[0][0]), 4)
+# Posting lists shared across queries, bounded by POSTINGS_CACHE_BYTES (default 256 MB)
+postings_cache = PostingsCache(int(os.environ.get('POSTINGS_CACHE_BYTES', 256 * 1024 * 1024)))
 
-def get_avg_doc_length(zone_name):
-    response = supabase.rpc('get_zone_avglength', {'zone_name': zone_name}).execute()
-    return float(response.data) if response.data else 1.0
+# Ranked results of recent queries, keyed by token list and k; RESULT_CACHE_SIZE=0 disables it
+result_cache = ResultCache(int(os.environ.get('RESULT_CACHE_SIZE', 1024)), float(os.environ.get('RESULT_CACHE_TTL', 300)))
 
-def get_unique_zones(word_list):
-    unique_zones = set()
-    for word in word_list:
-        zone_importance_response = supabase.rpc('get_zonei_score', params={'search_term': word}).execute()
-        zone_importance_dict = zone_importance_response.data
-        if not zone_importance_dict:
-            print(f"No zone importance data for '{word}'")
-            continue
-        word_zones = {zone for zone, score in zone_importance_dict.items() if score > 0}
-        unique_zones.update(word_zones)
-    print("\nAll Unique Zones across words:", unique_zones)
-    return unique_zones
+# Exact and near-exact film titles (titleindex.py); None if it has not been built
+title_index = load_title_index(TITLE_INDEX_DIR)
 
-def calculate_bm25_score(tf, idf, doc_length, avg_doc_length, k1=1.5, b=0.75):
-    numerator = tf * (k1 + 1)
-    denominator = tf + k1 * (1 - b + b * (doc_length / avg_doc_length))
-    return idf * (numerator / denominator)
+def queryprocessor(query):
+    q_list = re.split(r'\W+', query.lower())
+    tokenized_words = [word for word in q_list if word]
+    logger.debug("Tokenized Words: %s", tokenized_words)
+    return tokenized_words
 
 def calculate_words_per_drop(query_length):
     if query_length >= 20:
@@ -56,38 +42,183 @@ def calculate_words_per_drop(query_length):
     else:
         return 1
 
-def get_search_results(word_list, query_vector):
-    print("\n--- Starting Enhanced BM25 Search ---")
-    print(f"Tokenized Query Terms: {word_list}\n")
+def score_dtype(impact_arrays):
+    """Quantized (integer) impacts are summed exactly in int64, float impacts in float64."""
+    if all(np.issubdtype(impacts.dtype, np.integer) for impacts in impact_arrays):
+        return np.int64
+    return np.float64
+
+def score_query_terms(query_data, words, word_zones_dict):
+    """
+    Single pass over the postings of all query words.
+    Returns a dense (len(words) x num_films) matrix of partial scores and a per-film
+    coverage bitmask where bit i is set if the film matched words[i] in any zone.
+    """
+    word_postings = []
+    num_films = 0
+    for term_index, word in enumerate(words):
+        for zone in word_zones_dict[word]:  # Using ALL zones where word appears
+            postings = query_data.postings(zone, word)
+            if postings is None:
+                continue
+            doc_ids, impacts = postings
+            if len(doc_ids) == 0:
+                continue
+            doc_ids = np.asarray(doc_ids)
+            word_postings.append((term_index, doc_ids, np.asarray(impacts)))
+            num_films = max(num_films, int(doc_ids[-1]) + 1)
+
+    partial_scores = np.zeros((len(words), num_films), dtype=score_dtype([impacts for _, _, impacts in word_postings]))
+    coverage = np.zeros(num_films, dtype=np.uint64)
+
+    for term_index, doc_ids, impacts in word_postings:
+        # Same dtype on both sides keeps np.add.at on its fast path
+        np.add.at(partial_scores[term_index], doc_ids, impacts.astype(partial_scores.dtype, copy=False))
+        coverage[doc_ids] |= np.uint64(1 << term_index)
 
-    # Step 1: Get all unique zones
-    unique_zones = get_unique_zones(word_list)
-    avg_zone_lengths = {zone: get_avg_doc_length(zone) for zone in unique_zones}
+    return partial_scores, coverage
+
+def rank_relaxation_level(partial_scores, coverage, active_term_indices):
+    """Films containing every active word, ranked by impact summed over the active words only."""
+    required_mask = 0
+    for term_index in active_term_indices:
+        required_mask |= 1 << term_index
+    required_mask = np.uint64(required_mask)
+
+    film_ids = np.flatnonzero((coverage & required_mask) == required_mask)
+    film_scores = partial_scores[active_term_indices][:, film_ids].sum(axis=0)
+    order = np.argsort(-film_scores, kind='stable')
+    return film_ids[order].tolist()
+
+def word_posting_lists(query_data, word, zones):
+    """Non-empty (doc_ids, impacts) posting lists of a word, doc ids sorted ascending."""
+    posting_lists = []
+    for zone in zones:
+        postings = query_data.postings(zone, word)
+        if postings is None:
+            continue
+        doc_ids, impacts = postings
+        if len(doc_ids) == 0:
+            continue
+        # Kept in their stored dtype: converting whole lists would touch every posting
+        posting_lists.append((np.asarray(doc_ids), np.asarray(impacts)))
+    return posting_lists
 
-    # Step 2: Calculate composite scores for each word using ALL zones
+def locate_candidates(doc_ids, candidates, num_films):
+    """
+    Positions of the candidate films in a sorted posting list plus a mask of which ones are in it.
+    Few candidates against a long list use a binary search per candidate, so the rest of the
+    list is skipped; otherwise a dense film id -> position lookup is cheaper.
+    """
+    if len(candidates) * SKIP_SEARCH_RATIO < len(doc_ids):
+        positions = np.minimum(np.searchsorted(doc_ids, candidates.astype(doc_ids.dtype)), len(doc_ids) - 1)
+        return positions, doc_ids[positions] == candidates
+    lookup = np.full(num_films, -1, dtype=np.int64)
+    lookup[doc_ids] = np.arange(len(doc_ids))
+    positions = lookup[candidates]
+    return positions, positions >= 0
+
+def score_top_k(query_data, words, word_zones_dict, k):
+    """
+    Top-k films among those containing every word, using MaxScore pruning.
+
+    1. Intersect: candidates come from the rarest word and are located in every other
+       word's posting lists, so postings of common words like "film" are never scored
+       for films that cannot match.
+    2. Score word by word, highest upper bound first. Every candidate is known to match,
+       so the k-th best partial score is a lower bound for the final top k; films whose
+       partial score plus the remaining words' upper bounds falls below it are dropped.
+
+    Returns (top-k film ids ranked by score then film id, number of films containing every word).
+    """
+    word_lists = {word: word_posting_lists(query_data, word, word_zones_dict[word]) for word in words}
+    if any(not posting_lists for posting_lists in word_lists.values()):
+        return [], 0
+    num_films = max(int(doc_ids[-1]) + 1 for posting_lists in word_lists.values() for doc_ids, _ in posting_lists)
+
+    # Step 1: Conjunctive candidate set, rarest word first
+    words_by_df = sorted(words, key=lambda w: sum(len(doc_ids) for doc_ids, _ in word_lists[w]))
+    in_rarest = np.zeros(num_films, dtype=bool)
+    for doc_ids, _ in word_lists[words_by_df[0]]:
+        in_rarest[doc_ids] = True
+    candidates = np.flatnonzero(in_rarest)
+
+    located = {}  # word -> [(positions, hits) per posting list], aligned with candidates
+    for word in words_by_df:
+        located[word] = [locate_candidates(doc_ids, candidates, num_films) for doc_ids, _ in word_lists[word]]
+        in_word = np.zeros(len(candidates), dtype=bool)
+        for _, hits in located[word]:
+            in_word |= hits
+        if not in_word.all():
+            candidates = candidates[in_word]
+            located = {w: [(positions[in_word], hits[in_word]) for positions, hits in lists] for w, lists in located.items()}
+        if len(candidates) == 0:
+            return [], 0
+    total_matches = len(candidates)
+
+    # Step 2: MaxScore over the matching films
+    # A word's upper bound: the best impact it can contribute from each of its zones
+    word_upper_bounds = {word: sum(impacts.max().item() for _, impacts in word_lists[word]) for word in words}
+    words_by_bound = sorted(words, key=lambda w: word_upper_bounds[w], reverse=True)
+    remaining_upper_bound = sum(word_upper_bounds.values())
+    scores = np.zeros(len(candidates), dtype=score_dtype([impacts for lists in word_lists.values() for _, impacts in lists]))
+
+    for word_index, word in enumerate(words_by_bound):
+        for (_, impacts), (positions, hits) in zip(word_lists[word], located[word]):
+            hit_indices = np.flatnonzero(hits)
+            scores[hit_indices] += impacts[positions[hit_indices]]
+        # Clamped so float drift never prunes the k-th film itself once every word is scored
+        remaining_upper_bound = max(remaining_upper_bound - word_upper_bounds[word], 0)
+
+        if len(candidates) > k:
+            threshold = np.partition(scores, -k)[-k]
+            keep = scores + remaining_upper_bound >= threshold
+            if not keep.all():
+                candidates, scores = candidates[keep], scores[keep]
+                for w in words_by_bound[word_index + 1:]:
+                    located[w] = [(positions[keep], hits[keep]) for positions, hits in located[w]]
+
+    # Every film tied with the k-th score is a contender; ties rank by ascending film id, as
+    # in the exhaustive ranking, so the top k is always a prefix of it
+    top = np.flatnonzero(scores >= np.partition(scores, -k)[-k]) if len(scores) > k else np.arange(len(scores))
+    top = top[np.lexsort((candidates[top], -scores[top]))][:k]
+    return candidates[top].tolist(), total_matches
+
+def get_search_results(word_list, query_vector, k=None):
+    logger.debug("--- Starting Enhanced BM25 Search ---")
+    logger.debug("Tokenized Query Terms: %s", word_list)
+
+    # Everything the query needs from the index, in one round trip for the Supabase backend.
+    # The memo shares fetched postings with later queries through the process-wide cache.
+    index_data = backend.fetch_query(word_list)
+    query_data = QueryPostingsMemo(index_data, postings_cache, index_data.generation)
+
+    # Step 1: Calculate composite scores for each word using ALL zones
     word_composite_scores = {}
     word_zones_dict = {}  # Store ALL relevant zones for each word
     for word in word_list:
-        zone_importance_response = supabase.rpc('get_zonei_score', params={'search_term': word}).execute()
-        zone_importance_dict = zone_importance_response.data
+        zone_importance_dict = query_data.zone_importance(word)
         if not zone_importance_dict:
-            print(f"No zone importance data for '{word}'")
+            logger.debug("No zone importance data for '%s'", word)
             continue
 
         # Calculate full composite score from all zones
         full_composite_score = sum(score for zone, score in zone_importance_dict.items() if score > 0)
         word_composite_scores[word] = full_composite_score
-        print(f"Full composite score for word '{word}': {full_composite_score}")
+        logger.debug("Full composite score for word '%s': %s", word, full_composite_score)
 
         if full_composite_score > 0:
             # Store ALL zones where word appears with importance > 0
             word_zones = {zone for zone, score in zone_importance_dict.items() if score > 0}
             word_zones_dict[word] = word_zones
-            print(f"All zones for word '{word}': {word_zones}")
+            logger.debug("All zones for word '%s': %s", word, word_zones)
 
-    # Step 3: Filter out words with zero composite scores
+    # Step 2: Filter out words with zero composite scores
     filtered_words = [word for word in word_composite_scores if word_composite_scores[word] > 0]
-    print(f"Filtered words with non-zero composite scores: {filtered_words}")
+    if len(filtered_words) > MAX_QUERY_TERMS:
+        # Coverage bitmasks hold one bit per word; keep the most important ones
+        filtered_words = sorted(filtered_words, key=lambda w: word_composite_scores[w], reverse=True)[:MAX_QUERY_TERMS]
+    logger.debug("Filtered words with non-zero composite scores: %s", filtered_words)
 
     # Calculate words to drop per iteration
     words_per_drop = calculate_words_per_drop(len(filtered_words))
@@ -96,52 +227,35 @@ def get_search_results(word_list, query_vector):
 
     best_results = []  # Keep track of best results found so far
 
-    while len(filtered_words) >= min_words_required:
-        # Step 4: Calculate BM25 scores
-        film_scores = defaultdict(float)
-        films_with_all_words = defaultdict(set)
-
-        for word in filtered_words:
-            for zone in word_zones_dict[word]:  # Using ALL zones where word appears
-                tfidf_response = supabase.rpc('get_tf_idf', params={'t_name': zone, 'search_term': word}).execute()
-                tfidf_data = tfidf_response.data
-
-                if not tfidf_data or 'tf' not in tfidf_data:
-                    continue
-
-                idf = tfidf_data.get('idf', 0)
-                for film_id, tf in tfidf_data['tf'].items():
-                    doc_length = DEFAULT_DOC_LENGTH
-                    avg_doc_length = avg_zone_lengths.get(zone, 1.0)
-                    bm25_score = calculate_bm25_score(tf, idf, doc_length, avg_doc_length, k1, b)
-                    film_scores[film_id] += bm25_score
-                    films_with_all_words[film_id].add(word)
-
-        # Step 5: Filter and rank by BM25 scores
-        final_film_scores = {
-            film_id: score 
-            for film_id, score in film_scores.items() 
-            if len(films_with_all_words[film_id]) == len(filtered_words)
-        }
+    # Step 3: Without k, score every word once; each relaxation level is then derived from these partial scores.
+    # With k, each level runs a pruned top-k search instead.
+    if k is None:
+        term_indices = {word: i for i, word in enumerate(filtered_words)}
+        partial_scores, coverage = score_query_terms(query_data, filtered_words, word_zones_dict)
 
-        # If we found results, evaluate them
-        if final_film_scores:
-            ranked_films = sorted(final_film_scores.items(), key=lambda item: item[1], reverse=True)
-            ranked_film_ids = [film_id for film_id, _ in ranked_films]
+    while len(filtered_words) >= min_words_required:
+        # Step 4: Keep films matching all remaining words and rank them by BM25 score
+        if k is None:
+            active_term_indices = [term_indices[word] for word in filtered_words]
+            ranked_film_ids = rank_relaxation_level(partial_scores, coverage, active_term_indices)
             results_count = len(ranked_film_ids)
+        else:
+            ranked_film_ids, results_count = score_top_k(query_data, filtered_words, word_zones_dict, k)
 
+        # If we found results, evaluate them
+        if ranked_film_ids:
             # Keep track of best results found
-            if not best_results or len(ranked_film_ids) >= MIN_RESULTS_THRESHOLD:
+            if not best_results or results_count >= MIN_RESULTS_THRESHOLD:
                 best_results = ranked_film_ids
 
             # If we have enough results (>= 3), return them
             if results_count >= MIN_RESULTS_THRESHOLD:
                 if words_dropped > 0:
-                    print(f"\nFound {results_count} results after dropping {words_dropped} words")
-                    print(f"Final words used: {filtered_words}")
+                    logger.debug("Found %s results after dropping %s words", results_count, words_dropped)
+                    logger.debug("Final words used: %s", filtered_words)
                 return ranked_film_ids
             
-            print(f"\nFound only {results_count} results, trying with fewer words...")
+            logger.debug("Found only %s results, trying with fewer words...", results_count)
 
         # No results or too few results - drop lowest scoring words
         words_to_drop = min(words_per_drop, len(filtered_words) - min_words_required)
@@ -153,24 +267,54 @@ def get_search_results(word_list, query_vector):
         filtered_words = sorted_words[words_to_drop:]
         words_dropped += words_to_drop
 
-        print(f"\nDropping {words_to_drop} words: {words_being_dropped}")
-        print(f"Words dropped so far: {words_dropped}")
-        print(f"Remaining words: {filtered_words}")
+        logger.debug("Dropping %s words: %s", words_to_drop, words_being_dropped)
+        logger.debug("Words dropped so far: %s", words_dropped)
+        logger.debug("Remaining words: %s", filtered_words)
 
     # If we've exhausted all possibilities, return best results found
     if best_results:
-        print(f"\nReturning best results found ({len(best_results)} results)")
+        logger.debug("Returning best results found (%s results)", len(best_results))
         return best_results
 
-    print("\nNo results found after all attempts")
+    logger.debug("No results found after all attempts")
     return []
 
-def search(user_query, user_query_vector):
+def title_match(query_terms):
+    """
+    DocIDs of the film(s) whose title the query is and that are still in the index, or []
+    (always [] without a title index). The title index is built once from allfilms.jsonl,
+    so films deleted since by indexwriter.py are dropped here.
+    """
+    if title_index is None:
+        return []
+    film_ids = title_index.match(' '.join(query_terms))
+    return backend.live_doc_ids(film_ids) if film_ids else []
+
+def get_title_results(title_film_ids, word_list, query_vector, k=None):
+    """
+    Navigational fast path: the films the query names come first, then the ranked search
+    results; with k, a pruned top-k search fills the remaining k - len(title_film_ids) places.
+    """
+    logger.debug("Title match: %s", title_film_ids)
+    if k is not None and len(title_film_ids) >= k:
+        return title_film_ids[:k]
+    related = [film_id for film_id in get_search_results(word_list, query_vector, k) if film_id not in title_film_ids]
+    return title_film_ids + (related if k is None else related[:k - len(title_film_ids)])
+
+def search(user_query, user_query_vector, k=None):
+    """Ranked film ids for the query; with `k`, only the k best films are computed and returned."""
     query_terms = queryprocessor(user_query)
-    film_list = get_search_results(query_terms, user_query_vector)
+    # The generation first: it picks up a new index, which title matches are checked against
+    generation = backend.current_generation()
+    title_film_ids = title_match(query_terms)
+    if title_film_ids:
+        compute = lambda: get_title_results(title_film_ids, query_terms, user_query_vector, k)
+    else:
+        compute = lambda: get_search_results(query_terms, user_query_vector, k)
+    # Identical token lists rank identically (the vector is not used for ranking, and title
+    # matches depend only on the tokens); concurrent identical queries wait for the first one
+    # instead of each running the whole pipeline
+    film_list = result_cache.get_or_compute(generation, (tuple(query_terms), k), compute)
     
-    print("\n--- Final Ranked Search Results ---")
-    print(f"Total results found: {len(film_list)}")
-    for film_id in film_list:
-        print(film_id)
+    logger.debug("Total results found: %s", len(film_list))
     return film_list
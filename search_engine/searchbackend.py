@@ -0,0 +1,182 @@
+import os
+from localindex import load_local_index
+from statscatalog import load_stats_catalog
+
+# Where `python localindex.py ...` writes the local index
+INDEX_DIR = os.environ.get('FILMSEARCH_INDEX_DIR', os.path.join(os.path.dirname(__file__), 'localindex'))
+
+# Stats catalog written by tfidfindexcreator.py, used for query planning with the Supabase backend
+CATALOG_DIR = os.environ.get('FILMSEARCH_CATALOG_DIR', os.path.join(os.path.dirname(__file__), 'bm25architecture', 'statscatalog'))
+
+# Set to 0 to use the per-term RPCs, fanned out concurrently (e.g. before sql/get_query_index_data.sql is deployed)
+SUPABASE_BATCHED_FETCH = os.environ.get('SUPABASE_BATCHED_FETCH', '1') == '1'
+
+# Bump after re-migrating the index tables so cached postings from the old data are dropped
+SUPABASE_INDEX_GENERATION = os.environ.get('SUPABASE_INDEX_GENERATION', '0')
+
+
+def rpc_postings(tfidf_data):
+    """
+    Turn a get_tf_idf payload ({'tf': {filmid: tf}, 'idf': idf}) into (doc_ids, impacts),
+    sorted by doc id like the local index postings. The stored tf is already BM25-saturated,
+    so a posting's impact is just idf * tf.
+    """
+    if not tfidf_data or 'tf' not in tfidf_data:
+        return None
+    idf = tfidf_data.get('idf', 0)
+    postings = sorted((int(film_id), tf) for film_id, tf in tfidf_data['tf'].items())
+    doc_ids = [film_id for film_id, _ in postings]
+    impacts = [idf * tf for _, tf in postings]
+    return doc_ids, impacts
+
+
+class QueryIndexData:
+    """Everything one query needs from the index, fetched up front in a single round trip."""
+
+    def __init__(self, zone_importances, avg_lengths, postings, generation, catalog=None):
+        self.zone_importances = zone_importances
+        self.generation = generation
+        self.avg_lengths = avg_lengths
+        self._postings = postings
+        self.catalog = catalog
+
+    def zone_importance(self, word):
+        if self.catalog is not None:
+            return self.catalog.zone_importance(word)
+        return self.zone_importances.get(word)
+
+    def avg_doc_length(self, zone):
+        if self.catalog is not None:
+            return self.catalog.avg_doc_length(zone)
+        avg_length = self.avg_lengths.get(zone)
+        return float(avg_length) if avg_length else 1.0
+
+    def postings(self, zone, word):
+        return self._postings.get((zone, word))
+
+
+class LocalBackend:
+    """Serves postings from the memory-mapped local index and planning statistics from its stats catalog."""
+
+    name = 'local'
+
+    def __init__(self, index):
+        self.index = index
+        self.generation = index.generation
+
+    def zone_importance(self, word):
+        return self.index.zone_importance(word)
+
+    def avg_doc_length(self, zone):
+        return self.index.avg_doc_length(zone)
+
+    def postings(self, zone, word):
+        return self.index.postings(zone, word)
+
+    def live_doc_ids(self, doc_ids):
+        """The doc_ids the index holds, without the ones indexwriter.py has deleted, in the order given."""
+        return [doc_id for doc_id, live in zip(doc_ids, self.index.is_live(doc_ids).tolist()) if live]
+
+    def current_generation(self):
+        """Generation of the newest committed index, picking it up if indexwriter.py has published one."""
+        self.index = self.index.reopen()
+        self.generation = self.index.generation
+        return self.generation
+
+    def fetch_query(self, word_list):
+        # Lookups are in-process memory-mapped reads, nothing to batch. Pick up segments
+        # committed by indexwriter.py; the query reads one index snapshot throughout.
+        self.index = self.index.reopen()
+        self.generation = self.index.generation
+        return self.index
+
+
+class SupabaseBackend:
+    """Fallback backend: postings (and, without a stats catalog, planning data) from Supabase RPCs."""
+
+    name = 'supabase'
+
+    def __init__(self):
+        # Imported here so the local backend works without Supabase credentials or httpx
+        from supabaseclient import get_supabase_rpc
+        self.supabase = get_supabase_rpc()
+        self.generation = SUPABASE_INDEX_GENERATION
+        # Zone importances and zone lengths come from the in-memory catalog when it has been
+        # built, so only postings are fetched per query
+        self.catalog = load_stats_catalog(CATALOG_DIR)
+        if self.catalog is not None:
+            print(f"Using stats catalog at {CATALOG_DIR} (version {self.catalog.version})")
+
+    def zone_importance(self, word):
+        if self.catalog is not None:
+            return self.catalog.zone_importance(word)
+        return self.supabase.rpc('get_zonei_score', {'search_term': word})
+
+    def avg_doc_length(self, zone):
+        if self.catalog is not None:
+            return self.catalog.avg_doc_length(zone)
+        avg_length = self.supabase.rpc('get_zone_avglength', {'zone_name': zone})
+        return float(avg_length) if avg_length else 1.0
+
+    def postings(self, zone, word):
+        return rpc_postings(self.supabase.rpc('get_tf_idf', {'t_name': zone, 'search_term': word}))
+
+    def live_doc_ids(self, doc_ids):
+        """All of doc_ids: the Supabase tables are built from the same allfilms.jsonl as the title index."""
+        return list(doc_ids)
+
+    def current_generation(self):
+        """The Supabase index generation plus the version of the stats catalog used for planning."""
+        if self.catalog is None:
+            return self.generation
+        self.catalog = self.catalog.refresh()
+        return (self.generation, self.catalog.version)
+
+    def fetch_query(self, word_list):
+        """Fetch zone importances, zone lengths and postings for every query word up front."""
+        if self.catalog is not None:
+            # Pick up a rebuilt catalog
+            self.catalog = self.catalog.refresh()
+        if not SUPABASE_BATCHED_FETCH:
+            return self.fetch_query_concurrently(word_list)
+        data = self.supabase.rpc('get_query_index_data', {'search_terms': list(word_list)}) or {}
+        postings = {}
+        for word, zone_postings in (data.get('postings') or {}).items():
+            for zone, tfidf_data in zone_postings.items():
+                postings[(zone, word)] = rpc_postings(tfidf_data)
+        return QueryIndexData(data.get('zone_importances') or {}, data.get('avg_lengths') or {}, postings, self.generation, self.catalog)
+
+    def fetch_query_concurrently(self, word_list):
+        """
+        The same data from the per-term RPCs (for databases without get_query_index_data),
+        fanned out concurrently: zone importances first unless the catalog has them, then
+        every zone length and posting list the query can use at once.
+        """
+        words = list(dict.fromkeys(word_list))
+        if self.catalog is not None:
+            zone_importances = {word: self.catalog.zone_importance(word) for word in words}
+        else:
+            results = self.supabase.rpc_many([('get_zonei_score', {'search_term': word}) for word in words])
+            zone_importances = dict(zip(words, results))
+        zone_importances = {word: zones for word, zones in zone_importances.items() if zones}
+
+        # The engine only reads postings of zones where a word has positive importance
+        keys = [(zone, word) for word, zones in zone_importances.items() for zone, score in zones.items() if score > 0]
+        zones = [] if self.catalog is not None else sorted({zone for zone, _ in keys})
+        results = self.supabase.rpc_many(
+            [('get_tf_idf', {'t_name': zone, 'search_term': word}) for zone, word in keys]
+            + [('get_zone_avglength', {'zone_name': zone}) for zone in zones]
+        )
+        postings = {key: rpc_postings(tfidf_data) for key, tfidf_data in zip(keys, results)}
+        avg_lengths = dict(zip(zones, results[len(keys):]))
+        return QueryIndexData(zone_importances, avg_lengths, postings, self.generation, self.catalog)
+
+
+def get_backend():
+    """Use the local index when it has been built, otherwise fall back to Supabase."""
+    index = load_local_index(INDEX_DIR)
+    if index is not None:
+        print(f"Using local index at {INDEX_DIR} (generation {index.generation})")
+        return LocalBackend(index)
+    print("No local index found, falling back to Supabase")
+    return SupabaseBackend()
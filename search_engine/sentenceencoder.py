@@ -0,0 +1,264 @@
+"""
+Sentence encoder backends for the query and zone embeddings.
+
+    torch  SentenceTransformer(MODEL_NAME) on PyTorch (the default)
+    onnx   the same transformer exported to ONNX with int8 dynamically quantized weights, run
+           with ONNX Runtime from a local model directory; no PyTorch at serving time
+
+Both return what SentenceTransformer.encode does: float32 mean-pooled token embeddings,
+L2-normalized when the model normalizes (all-MiniLM-L6-v2 does).
+
+    python sentenceencoder.py export onnxmodel             # export + quantize MODEL_NAME
+    python sentenceencoder.py parity onnxmodel             # compare against the PyTorch embeddings
+
+An ONNX model directory holds model_int8.onnx, tokenizer.json and manifest.json (model name,
+dimension, max sequence length, pooling and normalization).
+"""
+
+import os
+import sys
+import json
+import argparse
+import threading
+import numpy as np
+
+MODEL_NAME = 'all-MiniLM-L6-v2'
+
+# 'torch' or 'onnx'
+ENCODER_BACKEND = os.environ.get('ENCODER_BACKEND', 'torch')
+ONNX_MODEL_DIR = os.environ.get('ONNX_MODEL_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'onnxmodel'))
+# ONNX Runtime intra-op threads; 0 lets it use every core
+ONNX_THREADS = int(os.environ.get('ONNX_THREADS', 0))
+
+MANIFEST_FILE = 'manifest.json'
+ONNX_FILE = 'model_int8.onnx'
+TOKENIZER_FILE = 'tokenizer.json'
+
+# The parity check fails if any text's ONNX embedding is further than this from the PyTorch one
+MIN_PARITY_COSINE = 0.99
+
+PARITY_TEXTS = [
+    "tamil film",
+    "a heist thriller set in mumbai",
+    "films directed by mani ratnam",
+    "Who composed the music for this film?",
+    "romantic comedy with a wedding",
+    "plot",
+    "release_reception",
+    "Directed by",
+    "What did critics say about the climax?",
+    "an animated film about a talking dog and his family who move to a new city",
+]
+
+
+class OnnxEncoder:
+    """Int8 ONNX Runtime encoder with the same encode() interface as SentenceTransformer."""
+
+    def __init__(self, directory, threads=ONNX_THREADS):
+        # Imported here so the PyTorch backend does not need onnxruntime installed
+        import onnxruntime
+        from tokenizers import Tokenizer
+
+        with open(os.path.join(directory, MANIFEST_FILE), 'r') as f:
+            self.manifest = json.load(f)
+        if self.manifest['pooling'] != 'mean':
+            raise ValueError(f"Unsupported pooling {self.manifest['pooling']!r} in {directory}, only mean pooling is exported.")
+        self.model_name = self.manifest['model']
+        self.normalize = self.manifest['normalize']
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(directory, TOKENIZER_FILE))
+        self.tokenizer.enable_truncation(max_length=self.manifest['max_seq_length'])
+        self.tokenizer.enable_padding(pad_id=self.manifest['pad_token_id'], pad_token=self.manifest['pad_token'])
+
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = threads
+        self.session = onnxruntime.InferenceSession(
+            os.path.join(directory, self.manifest.get('onnx_file', ONNX_FILE)), options, providers=['CPUExecutionProvider']
+        )
+        self.input_names = {model_input.name for model_input in self.session.get_inputs()}
+
+    def get_sentence_embedding_dimension(self):
+        return self.manifest['dimension']
+
+    def _encode_batch(self, texts):
+        encodings = self.tokenizer.encode_batch(texts)
+        inputs = {
+            'input_ids': np.array([encoding.ids for encoding in encodings], dtype=np.int64),
+            'attention_mask': np.array([encoding.attention_mask for encoding in encodings], dtype=np.int64),
+            'token_type_ids': np.array([encoding.type_ids for encoding in encodings], dtype=np.int64),
+        }
+        token_embeddings = self.session.run(None, {name: value for name, value in inputs.items() if name in self.input_names})[0]
+        # Mean over the real (unpadded) tokens, as sentence-transformers' Pooling layer does
+        mask = inputs['attention_mask'][:, :, None].astype(np.float32)
+        embeddings = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        if self.normalize:
+            embeddings /= np.clip(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12, None)
+        return embeddings.astype(np.float32)
+
+    def encode(self, sentences, batch_size=32, **kwargs):
+        """float32[len(sentences), dimension], or float32[dimension] for a single string."""
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        embeddings = np.zeros((len(texts), self.get_sentence_embedding_dimension()), dtype=np.float32)
+        # Batch texts of similar length together so little time goes into padding
+        order = sorted(range(len(texts)), key=lambda i: -len(texts[i]))
+        for start in range(0, len(order), batch_size):
+            rows = order[start:start + batch_size]
+            embeddings[rows] = self._encode_batch([texts[i] for i in rows])
+        return embeddings[0] if single else embeddings
+
+
+def load_encoder(backend=None, model_directory=None):
+    """The encoder selected by `backend` (default $ENCODER_BACKEND)."""
+    backend = backend or ENCODER_BACKEND
+    if backend == 'torch':
+        from sentence_transformers import SentenceTransformer
+        return SentenceTransformer(MODEL_NAME)
+    if backend == 'onnx':
+        return OnnxEncoder(model_directory or ONNX_MODEL_DIR)
+    raise ValueError(f"Unknown encoder backend {backend!r}, expected 'torch' or 'onnx'.")
+
+
+_encoders = {}
+_encoders_lock = threading.Lock()
+
+
+def get_encoder(backend=None):
+    """
+    The process-wide encoder for `backend` (default $ENCODER_BACKEND), loaded on first use.
+    Everything that embeds text shares it, so a process holds one copy of the model.
+    """
+    backend = backend or ENCODER_BACKEND
+    with _encoders_lock:
+        if backend not in _encoders:
+            _encoders[backend] = load_encoder(backend)
+        return _encoders[backend]
+
+
+def export_onnx(directory, model_name=MODEL_NAME, keep_fp32=False):
+    """Export `model_name`'s transformer to ONNX, quantize its weights to int8 and write the model directory."""
+    import torch
+    from sentence_transformers import SentenceTransformer
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    model = SentenceTransformer(model_name, device='cpu')
+    transformer, pooling = model[0], model[1]
+    if not pooling.pooling_mode_mean_tokens:
+        raise ValueError(f"{model_name} does not use mean pooling, which is the only pooling the ONNX encoder implements.")
+    normalize = any(type(module).__name__ == 'Normalize' for module in model)
+    auto_model = transformer.auto_model.eval()
+
+    class TokenEmbeddings(torch.nn.Module):
+        # The transformer's last hidden state only; pooling runs in numpy
+        def __init__(self, auto_model):
+            super().__init__()
+            self.auto_model = auto_model
+
+        def forward(self, input_ids, attention_mask, token_type_ids):
+            return self.auto_model(input_ids=input_ids, attention_mask=attention_mask, token_type_ids=token_type_ids)[0]
+
+    os.makedirs(directory, exist_ok=True)
+    fp32_path = os.path.join(directory, 'model_fp32.onnx')
+    dummy = model.tokenizer(["an example film query"], return_tensors='pt')
+    with torch.no_grad():
+        torch.onnx.export(
+            TokenEmbeddings(auto_model),
+            (dummy['input_ids'], dummy['attention_mask'], dummy['token_type_ids']),
+            fp32_path,
+            input_names=['input_ids', 'attention_mask', 'token_type_ids'],
+            output_names=['last_hidden_state'],
+            dynamic_axes={
+                'input_ids': {0: 'batch', 1: 'sequence'},
+                'attention_mask': {0: 'batch', 1: 'sequence'},
+                'token_type_ids': {0: 'batch', 1: 'sequence'},
+                'last_hidden_state': {0: 'batch', 1: 'sequence'},
+            },
+            opset_version=14,
+        )
+    quantize_dynamic(fp32_path, os.path.join(directory, ONNX_FILE), weight_type=QuantType.QInt8)
+    if not keep_fp32:
+        os.remove(fp32_path)
+
+    model.tokenizer.save_pretrained(directory)  # writes tokenizer.json for the fast tokenizer
+    manifest = {
+        'model': model_name,
+        'onnx_file': ONNX_FILE,
+        'dimension': model.get_sentence_embedding_dimension(),
+        'max_seq_length': model.max_seq_length,
+        'pooling': 'mean',
+        'normalize': normalize,
+        'pad_token': model.tokenizer.pad_token,
+        'pad_token_id': model.tokenizer.pad_token_id,
+        'quantization': 'dynamic int8 weights',
+    }
+    with open(os.path.join(directory, MANIFEST_FILE), 'w') as f_w:
+        json.dump(manifest, f_w, indent=2)
+
+
+def read_parity_texts(input_file, samples):
+    """PARITY_TEXTS plus up to `samples` field texts from a JSONL film file."""
+    texts = list(PARITY_TEXTS)
+    if input_file:
+        with open(input_file, 'r') as f:
+            for line in f:
+                texts.extend(content for content in json.loads(line).values() if content)
+                if len(texts) >= len(PARITY_TEXTS) + samples:
+                    break
+    return texts[:len(PARITY_TEXTS) + samples]
+
+
+def parity_check(reference, candidate, texts, batch_size=32):
+    """
+    Compare two encoders on `texts`: the cosine between each text's two embeddings, and how
+    often both agree on every text's nearest other text.
+    """
+    expected = np.asarray(reference.encode(texts, batch_size=batch_size), dtype=np.float32)
+    actual = np.asarray(candidate.encode(texts, batch_size=batch_size), dtype=np.float32)
+    expected /= np.clip(np.linalg.norm(expected, axis=1, keepdims=True), 1e-12, None)
+    actual /= np.clip(np.linalg.norm(actual, axis=1, keepdims=True), 1e-12, None)
+    cosines = (expected * actual).sum(axis=1)
+
+    neighbours = []
+    for embeddings in (expected, actual):
+        similarities = embeddings @ embeddings.T
+        np.fill_diagonal(similarities, -np.inf)
+        neighbours.append(similarities.argmax(axis=1))
+    return {
+        'texts': len(texts),
+        'min_cosine': float(cosines.min()),
+        'mean_cosine': float(cosines.mean()),
+        'worst_text': texts[int(cosines.argmin())],
+        'nearest_neighbour_agreement': float((neighbours[0] == neighbours[1]).mean()) if len(texts) > 1 else 1.0,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export and check the int8 ONNX sentence encoder.")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    export = commands.add_parser('export', help="export MODEL_NAME to ONNX and quantize it to int8")
+    export.add_argument('directory')
+    export.add_argument('--model', default=MODEL_NAME)
+    export.add_argument('--keep-fp32', action='store_true', help="keep the unquantized model_fp32.onnx too")
+
+    parity = commands.add_parser('parity', help="compare the ONNX embeddings against the PyTorch ones")
+    parity.add_argument('directory')
+    parity.add_argument('--input-file', help="JSONL films whose field texts are added to the built-in texts")
+    parity.add_argument('--samples', type=int, default=500)
+    parity.add_argument('--min-cosine', type=float, default=MIN_PARITY_COSINE)
+
+    args = parser.parse_args()
+    if args.command == 'export':
+        export_onnx(args.directory, args.model, args.keep_fp32)
+        print(f"Wrote the int8 ONNX encoder to {args.directory}")
+    else:
+        from sentence_transformers import SentenceTransformer
+        candidate = OnnxEncoder(args.directory)
+        reference = SentenceTransformer(candidate.model_name, device='cpu')
+        report = parity_check(reference, candidate, read_parity_texts(args.input_file, args.samples))
+        for key, value in report.items():
+            print(f"{key}: {value}")
+        if report['min_cosine'] < args.min_cosine:
+            print(f"FAILED: minimum cosine {report['min_cosine']:.4f} is below {args.min_cosine}")
+            sys.exit(1)
+        print("OK")
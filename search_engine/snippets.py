@@ -0,0 +1,120 @@
+import os
+import re
+import numpy as np
+from docstore import TOKEN_RE, TOKEN_OFFSETS_KEY, decode_token_offsets, film_object
+
+# Tokens shown in a snippet; longer zones are cut around the densest run of query terms
+SNIPPET_TOKENS = int(os.environ.get('SNIPPET_TOKENS', 30))
+
+# Only the start of each zone is searched for matches, as highlighters usually cap analysis
+SNIPPET_MAX_CHARS = int(os.environ.get('SNIPPET_MAX_CHARS', 10000))
+
+# film_details fields a result card renders (director, language, country); the default projection of paged searches
+CARD_FIELDS = ['directed_by', 'language', 'country']
+
+
+def query_terms(query):
+    """Lowercased query tokens, as the search engine's queryprocessor splits them."""
+    return {match.group() for match in TOKEN_RE.finditer(query.lower())}
+
+
+def zone_token_offsets(document, zone):
+    """Stored token offsets of a zone; re-tokenized for documents stored without them."""
+    encoded = document.get(TOKEN_OFFSETS_KEY, {}).get(zone)
+    if encoded is not None:
+        return decode_token_offsets(encoded)
+    return np.array([match.span() for match in TOKEN_RE.finditer(document[zone])], dtype=np.int64).reshape(-1, 2)
+
+
+def terms_pattern(terms):
+    """Regex matching whole tokens equal to any of the (lowercase) query terms in lowercased text."""
+    alternatives = '|'.join(sorted((re.escape(term) for term in terms), key=len, reverse=True))
+    return re.compile(rf'\b(?:{alternatives})\b')
+
+
+def find_terms(pattern, text):
+    """
+    (start offsets into text, lowercased matched terms) of every query term in the analyzed
+    start of `text`, from one pass over the text they are offsets into.
+    """
+    analyzed = text[:SNIPPET_MAX_CHARS]
+    lowered = analyzed.lower()
+    if len(lowered) != len(analyzed):
+        # Lowercasing a few characters (e.g. 'İ') changes their length, so offsets into the lowered
+        # text are not offsets into text; match the original text case-insensitively instead
+        lowered, pattern = analyzed, re.compile(pattern.pattern, re.IGNORECASE)
+    matches = list(pattern.finditer(lowered))
+    return [match.start() for match in matches], [match.group().lower() for match in matches]
+
+
+def best_window(positions, matched, window):
+    """First token of the window of `window` tokens holding the most distinct query terms, then the most occurrences."""
+    positions = np.asarray(positions, dtype=np.int64)
+    # Candidate windows start at a match; count the matches and the distinct terms in each
+    ends = positions + window
+    occurrences = np.searchsorted(positions, ends) - np.arange(len(positions))
+    distinct = np.zeros(len(positions), dtype=np.int64)
+    matched = np.asarray(matched)
+    for term in np.unique(matched):
+        term_positions = positions[matched == term]
+        following = np.searchsorted(term_positions, positions)
+        present = following < len(term_positions)
+        present[present] = term_positions[following[present]] < ends[present]
+        distinct += present
+    best = int(np.argmax(distinct * (len(positions) + 1) + occurrences))
+    # Start a little before the first match so it has some context
+    return max(0, int(positions[best]) - window // 4)
+
+
+def best_snippet(document, terms, window=SNIPPET_TOKENS):
+    """
+    {'zone', 'text', 'highlights'} for the zone of `document` matching the most distinct query
+    terms (then the most occurrences): about `window` tokens around the densest run of
+    matches, with highlights as [start, end) character offsets into text. None if no zone
+    contains a query term.
+    """
+    if not terms:
+        return None
+    pattern = terms_pattern(terms)
+    best = None
+    for zone, text in document.items():
+        if zone in ('title', 'poster', TOKEN_OFFSETS_KEY) or not isinstance(text, str):
+            continue
+        starts, matched = find_terms(pattern, text)
+        if not matched:
+            continue
+        score = (len(set(matched)), len(matched))
+        if best is None or score > best[0]:
+            best = (score, zone, text, starts, matched)
+    if best is None:
+        return None
+
+    # Token offsets are only needed for the chosen zone: they turn match positions into token
+    # positions for the window, and the window back into character offsets
+    _, zone, text, starts, matched = best
+    offsets = zone_token_offsets(document, zone)
+    positions = np.searchsorted(offsets[:, 0], starts).tolist()
+    first = best_window(positions, matched, window)
+    last = min(first + window, len(offsets)) - 1
+    start = 0 if first == 0 else int(offsets[first][0])
+    end = len(text) if last == len(offsets) - 1 else int(offsets[last][1])
+    prefix = '…' if start > 0 else ''
+    suffix = '…' if end < len(text) else ''
+    highlights = [
+        [int(offsets[p][0]) - start + len(prefix), int(offsets[p][1]) - start + len(prefix)]
+        for p in positions if first <= p <= last
+    ]
+    return {'zone': zone, 'text': prefix + text[start:end] + suffix, 'highlights': highlights}
+
+
+def film_card(doc_id, document, fields=None, terms=None):
+    """
+    A film object with only `fields` of film_details (all of them if None), plus a snippet
+    for the query `terms` when given.
+    """
+    card = film_object(doc_id, document)
+    if fields is not None:
+        card['film_details'] = {field: card['film_details'][field] for field in fields if field in card['film_details']}
+    if terms is not None:
+        card['snippet'] = best_snippet(document, terms)
+    return card
@@ -0,0 +1,55 @@
+-- Batched lookup for a whole query: one RPC instead of get_zonei_score per word,
+-- get_zone_avglength per zone and get_tf_idf per (word, zone).
+--
+-- Returns:
+-- {
+--   "zone_importances": {term: {zone: score, ...}, ...},
+--   "avg_lengths":      {zone: avg_doc_length, ...},
+--   "postings":         {term: {zone: {"tf": {filmid: tf, ...}, "idf": idf}, ...}, ...}
+-- }
+-- Only zones with a positive importance for a term are expanded, which is what
+-- search_engine.get_search_results scores.
+create or replace function get_query_index_data(search_terms text[])
+returns jsonb
+language plpgsql
+stable
+as $$
+declare
+    importances jsonb := '{}'::jsonb;
+    avg_lengths jsonb := '{}'::jsonb;
+    postings jsonb := '{}'::jsonb;
+    term text;
+    zone_scores jsonb;
+    zone_entry record;
+    term_postings jsonb;
+begin
+    foreach term in array search_terms loop
+        continue when importances ? term;
+
+        zone_scores := get_zonei_score(search_term => term)::jsonb;
+        continue when zone_scores is null;
+        importances := importances || jsonb_build_object(term, zone_scores);
+
+        term_postings := '{}'::jsonb;
+        for zone_entry in
+            select key from jsonb_each(zone_scores) where (value #>> '{}')::float > 0
+        loop
+            if not avg_lengths ? zone_entry.key then
+                avg_lengths := avg_lengths || jsonb_build_object(
+                    zone_entry.key, get_zone_avglength(zone_name => zone_entry.key)
+                );
+            end if;
+            term_postings := term_postings || jsonb_build_object(
+                zone_entry.key, get_tf_idf(t_name => zone_entry.key, search_term => term)::jsonb
+            );
+        end loop;
+        postings := postings || jsonb_build_object(term, term_postings);
+    end loop;
+
+    return jsonb_build_object(
+        'zone_importances', importances,
+        'avg_lengths', avg_lengths,
+        'postings', postings
+    );
+end;
+$$;
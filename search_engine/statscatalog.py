@@ -0,0 +1,197 @@
+"""
+Stats catalog: everything query planning needs about zones and terms, loaded into memory
+once at startup so planning never touches the index or the database.
+
+Directory layout:
+    catalog.json      version, zone names and per-zone document count / total zone length
+    terms.bin         sorted utf-8 terms, concatenated
+    term_offsets.npy  int64[num_terms + 1]  term i is terms.bin[term_offsets[i]:term_offsets[i + 1]]
+    zone_offsets.npy  int64[num_terms + 1]  entries of term i are [zone_offsets[i], zone_offsets[i + 1])
+    zone_ids.npy      int32[entries]        zone of each entry (index into catalog.json's zones)
+    scores.npy        float64[entries]      zone importance, highest first within a term
+    dfs.npy           uint32[entries]       documents containing the term in that zone
+
+i.e. a term x zone sparse matrix in CSR layout with an importance and a df per entry.
+Every file is written under a temporary name and renamed into place.
+"""
+
+import os
+import json
+import math
+import numpy as np
+
+CATALOG_FILE = 'catalog.json'
+
+# Zone importance smoothing and cap
+ZONE_IMPORTANCE_EPSILON = 1.0
+ZONE_IMPORTANCE_MAX_SCORE = 10.0
+# Decimals zone importances are rounded to, as in zoneimportance.csv and the get_zonei_score RPC
+ZONE_IMPORTANCE_DECIMALS = 3
+
+
+def bm25_idf(num_docs, dfs):
+    """BM25 idf, the formula tfidfindexcreator.py uses; vectorized over dfs."""
+    dfs = np.asarray(dfs, dtype=np.float64)
+    return np.log2((num_docs - dfs + 0.5) / (dfs + 0.5) + 1)
+
+
+def zone_importance_scores(dfs, occurrences, zone_terms,
+                           epsilon=ZONE_IMPORTANCE_EPSILON, max_score=ZONE_IMPORTANCE_MAX_SCORE):
+    """
+    Zone importance of terms in one zone: (documents with the term in the zone / occurrences
+    of the term in all zones) / log2(1 + terms in the zone), smoothed by epsilon and capped
+    at max_score. dfs and occurrences are per term; returns the scores rounded to
+    ZONE_IMPORTANCE_DECIMALS.
+    """
+    scores = (np.asarray(dfs, dtype=np.float64) / (np.asarray(occurrences, dtype=np.float64) + epsilon)) / math.log2(1 + zone_terms)
+    return [round(score, ZONE_IMPORTANCE_DECIMALS) for score in np.minimum(scores, max_score).tolist()]
+
+
+def save_array(path, array):
+    """np.save under a temporary name, then atomically replace `path`."""
+    with open(path + '.tmp', 'wb') as f_w:
+        np.save(f_w, array)
+    os.replace(path + '.tmp', path)
+
+
+def write_stats_catalog(directory, version, zone_stats, term_rows):
+    """
+    Write a catalog directory.
+    zone_stats: (zone name, documents with the zone, total zone length) per zone id.
+    term_rows: (term bytes, [(zone id, importance, df), ...]) in byte order of the terms.
+    """
+    os.makedirs(directory, exist_ok=True)
+    term_offsets = [0]
+    zone_offsets = [0]
+    zone_ids, scores, dfs = [], [], []
+    terms_path = os.path.join(directory, 'terms.bin')
+    with open(terms_path + '.tmp', 'wb') as f_w:
+        for term, entries in term_rows:
+            f_w.write(term)
+            term_offsets.append(term_offsets[-1] + len(term))
+            for zone_id, score, df in sorted(entries, key=lambda entry: -entry[1]):
+                zone_ids.append(zone_id)
+                scores.append(score)
+                dfs.append(df)
+            zone_offsets.append(len(zone_ids))
+    os.replace(terms_path + '.tmp', terms_path)
+
+    save_array(os.path.join(directory, 'term_offsets.npy'), np.array(term_offsets, dtype=np.int64))
+    save_array(os.path.join(directory, 'zone_offsets.npy'), np.array(zone_offsets, dtype=np.int64))
+    save_array(os.path.join(directory, 'zone_ids.npy'), np.array(zone_ids, dtype=np.int32))
+    save_array(os.path.join(directory, 'scores.npy'), np.array(scores, dtype=np.float64))
+    save_array(os.path.join(directory, 'dfs.npy'), np.array(dfs, dtype=np.uint32))
+    # Written last and replaced atomically: its version is what readers check to refresh
+    catalog = {
+        'version': version,
+        'zones': [zone for zone, _, _ in zone_stats],
+        'num_docs': [int(num_docs) for _, num_docs, _ in zone_stats],
+        'total_lengths': [int(total_length) for _, _, total_length in zone_stats]
+    }
+    path = os.path.join(directory, CATALOG_FILE)
+    with open(path + '.tmp', 'w') as f_w:
+        json.dump(catalog, f_w)
+    os.replace(path + '.tmp', path)
+
+
+class StatsCatalog:
+    """
+    In-memory snapshot of a catalog directory. Zone statistics can be overridden with live
+    values (the local index passes the counts over its current segments) and idf is
+    computed from them once, for every entry, when the catalog is loaded.
+    """
+
+    def __init__(self, directory, zone_stats=None, version=None):
+        """zone_stats: optional {zone: (documents, total zone length)} replacing the stored ones."""
+        self.directory = directory
+        catalog_path = os.path.join(directory, CATALOG_FILE)
+        self.mtime = os.stat(catalog_path).st_mtime_ns
+        with open(catalog_path, 'r') as f:
+            catalog = json.load(f)
+        self.version = catalog['version'] if version is None else version
+        self.zone_names = catalog['zones']
+        if zone_stats is None:
+            zone_stats = {zone: (num_docs, total_length) for zone, num_docs, total_length
+                          in zip(catalog['zones'], catalog['num_docs'], catalog['total_lengths'])}
+        self.zone_num_docs = {zone: num_docs for zone, (num_docs, _) in zone_stats.items()}
+        self.zone_avg_doc_length = {
+            zone: total_length / num_docs if num_docs else 1.0 for zone, (num_docs, total_length) in zone_stats.items()
+        }
+
+        with open(os.path.join(directory, 'terms.bin'), 'rb') as f:
+            blob = f.read()
+        term_offsets = np.load(os.path.join(directory, 'term_offsets.npy')).tolist()
+        self.term_ids = {blob[start:end].decode('utf-8'): i for i, (start, end) in enumerate(zip(term_offsets, term_offsets[1:]))}
+        self.zone_offsets = np.load(os.path.join(directory, 'zone_offsets.npy'))
+        self.zone_ids = np.load(os.path.join(directory, 'zone_ids.npy'))
+        self.scores = np.load(os.path.join(directory, 'scores.npy'))
+        if self.scores.dtype == np.float32:
+            # Catalogs written before scores were stored as float64
+            self.scores = np.round(self.scores.astype(np.float64), ZONE_IMPORTANCE_DECIMALS)
+        self.dfs = np.load(os.path.join(directory, 'dfs.npy'))
+        entry_num_docs = np.array([self.zone_num_docs.get(zone, 0) for zone in self.zone_names], dtype=np.float64)[self.zone_ids]
+        self.idfs = bm25_idf(entry_num_docs, self.dfs)
+
+    def refresh(self):
+        """A new snapshot if catalog.json has been replaced since this one was loaded, else self."""
+        try:
+            if os.stat(os.path.join(self.directory, CATALOG_FILE)).st_mtime_ns == self.mtime:
+                return self
+        except FileNotFoundError:
+            return self
+        return StatsCatalog(self.directory)
+
+    def _entries(self, term):
+        term_id = self.term_ids.get(term)
+        if term_id is None:
+            return None
+        return int(self.zone_offsets[term_id]), int(self.zone_offsets[term_id + 1])
+
+    def zone_importance(self, term):
+        """Same shape as the get_zonei_score RPC: {zone_name: score} or None."""
+        entries = self._entries(term)
+        if entries is None:
+            return None
+        start, end = entries
+        return {
+            self.zone_names[zone_id]: float(score)
+            for zone_id, score in zip(self.zone_ids[start:end].tolist(), self.scores[start:end].tolist())
+        }
+
+    def term_stats(self, term):
+        """{zone_name: (df, idf)} of a term, or None."""
+        entries = self._entries(term)
+        if entries is None:
+            return None
+        start, end = entries
+        return {
+            self.zone_names[zone_id]: (df, idf)
+            for zone_id, df, idf in zip(self.zone_ids[start:end].tolist(), self.dfs[start:end].tolist(), self.idfs[start:end].tolist())
+        }
+
+    def idf(self, term, zone):
+        stats = self.term_stats(term)
+        return stats[zone][1] if stats and zone in stats else 0.0
+
+    def avg_doc_length(self, zone):
+        return self.zone_avg_doc_length.get(zone, 1.0)
+
+    def num_docs(self, zone):
+        return self.zone_num_docs.get(zone, 0)
+
+    def rows(self):
+        """Yield (term bytes, {zone_name: (importance, df)}) for every term, in byte order."""
+        zone_offsets = self.zone_offsets.tolist()
+        zone_ids, scores, dfs = self.zone_ids.tolist(), self.scores.tolist(), self.dfs.tolist()
+        for term, term_id in self.term_ids.items():
+            start, end = zone_offsets[term_id], zone_offsets[term_id + 1]
+            yield term.encode('utf-8'), {
+                self.zone_names[zone_id]: (score, df) for zone_id, score, df in zip(zone_ids[start:end], scores[start:end], dfs[start:end])
+            }
+
+
+def load_stats_catalog(directory):
+    """The catalog at `directory`, or None if it has not been built."""
+    if not os.path.exists(os.path.join(directory, CATALOG_FILE)):
+        return None
+    return StatsCatalog(directory)
@@ -0,0 +1,138 @@
+"""
+Async Supabase RPC client over one pooled httpx connection pool.
+
+Postgres functions are called through PostgREST (POST <rest url>/rpc/<function>), the same
+endpoint supabase-py's `supabase.rpc(...).execute()` uses, so responses have the same shape
+as its `.data`. Connections are kept alive and multiplexed over HTTP/2 when the server
+supports it, every call has a timeout, and `rpc_many` fans calls out concurrently.
+
+The engines are synchronous and run on executor threads, so `SupabaseRPC` runs the async
+client on its own event loop thread and gives them blocking `rpc` / `rpc_many` calls that
+share one pool.
+
+Configuration (environment):
+    SUPABASE_URL, SUPABASE_KEY   as for bm25config.py
+    SUPABASE_REST_URL            PostgREST base URL, default $SUPABASE_URL/rest/v1; point it at
+                                 a local PostgREST (or compatible stand-in) to test
+    SUPABASE_HTTP2               1 (default) or 0
+    SUPABASE_MAX_CONNECTIONS     pool size, default 20
+    SUPABASE_TIMEOUT             seconds per call, default 10
+"""
+
+import os
+import asyncio
+import threading
+import httpx
+from dotenv import load_dotenv
+
+load_dotenv()
+
+SUPABASE_HTTP2 = os.environ.get('SUPABASE_HTTP2', '1') == '1'
+SUPABASE_MAX_CONNECTIONS = int(os.environ.get('SUPABASE_MAX_CONNECTIONS', 20))
+SUPABASE_TIMEOUT = float(os.environ.get('SUPABASE_TIMEOUT', 10))
+# Idle connections are closed after this many seconds
+SUPABASE_KEEPALIVE_EXPIRY = 60.0
+
+
+class SupabaseError(Exception):
+    """A PostgREST error response (status code and body) or a transport failure."""
+
+    def __init__(self, function, status, message):
+        super().__init__(f"RPC {function} failed ({status}): {message}")
+        self.function = function
+        self.status = status
+
+
+def rest_url():
+    url = os.environ.get('SUPABASE_REST_URL')
+    if url:
+        return url.rstrip('/')
+    return os.environ.get('SUPABASE_URL', '').rstrip('/') + '/rest/v1'
+
+
+def http2_available():
+    try:
+        import h2  # noqa: F401  httpx needs it for HTTP/2
+        return True
+    except ImportError:
+        return False
+
+
+class AsyncSupabaseClient:
+    """Async PostgREST RPC calls over a keep-alive (HTTP/2 when available) connection pool."""
+
+    def __init__(self, url=None, key=None, http2=SUPABASE_HTTP2, max_connections=SUPABASE_MAX_CONNECTIONS,
+                 timeout=SUPABASE_TIMEOUT):
+        key = key if key is not None else os.environ.get('SUPABASE_KEY', '')
+        self.timeout = timeout
+        self.client = httpx.AsyncClient(
+            base_url=url or rest_url(),
+            headers={'apikey': key, 'Authorization': f'Bearer {key}', 'Content-Type': 'application/json'},
+            http2=http2 and http2_available(),
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections,
+                                keepalive_expiry=SUPABASE_KEEPALIVE_EXPIRY),
+            timeout=httpx.Timeout(timeout),
+        )
+
+    async def rpc(self, function, params=None, timeout=None):
+        """The decoded JSON result of calling Postgres function `function` with `params`."""
+        try:
+            response = await self.client.post(f'/rpc/{function}', json=params or {},
+                                              timeout=timeout if timeout is not None else self.timeout)
+        except httpx.TimeoutException as e:
+            raise SupabaseError(function, 'timeout', str(e) or type(e).__name__) from e
+        except httpx.TransportError as e:
+            raise SupabaseError(function, 'transport', str(e) or type(e).__name__) from e
+        if response.status_code >= 400:
+            raise SupabaseError(function, response.status_code, response.text)
+        if not response.content:
+            return None
+        return response.json()
+
+    async def rpc_many(self, calls, timeout=None):
+        """Results of [(function, params), ...], called concurrently, in the order given."""
+        return await asyncio.gather(*(self.rpc(function, params, timeout) for function, params in calls))
+
+    async def aclose(self):
+        await self.client.aclose()
+
+
+class SupabaseRPC:
+    """Blocking facade over AsyncSupabaseClient for the synchronous engines; thread-safe."""
+
+    def __init__(self, **client_options):
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name='supabase-client', daemon=True)
+        self._thread.start()
+        # The httpx client belongs to the loop it is used on
+        self.client = self._call(self._create_client(client_options))
+
+    @staticmethod
+    async def _create_client(client_options):
+        return AsyncSupabaseClient(**client_options)
+
+    def _call(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop).result()
+
+    def rpc(self, function, params=None, timeout=None):
+        return self._call(self.client.rpc(function, params, timeout))
+
+    def rpc_many(self, calls, timeout=None):
+        return self._call(self.client.rpc_many(calls, timeout))
+
+    def close(self):
+        self._call(self.client.aclose())
+        self._loop.call_soon_threadsafe(self._loop.stop)
+
+
+_shared = None
+_shared_lock = threading.Lock()
+
+
+def get_supabase_rpc():
+    """The process-wide SupabaseRPC, created on first use."""
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = SupabaseRPC()
+        return _shared
@@ -0,0 +1,51 @@
+import os
+import sys
+import pytest
+
+# The search engine modules import each other by bare name, as when run from search_engine/
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Nothing built on this machine is picked up: tests that need an index build their own
+os.environ.setdefault('FILMSEARCH_INDEX_DIR', os.path.join(os.path.dirname(__file__), 'no-index'))
+os.environ.setdefault('FILMSEARCH_TITLE_INDEX_DIR', os.path.join(os.path.dirname(__file__), 'no-title-index'))
+
+
+@pytest.fixture
+def index_directory(tmp_path):
+    """An empty local index that tests fill through IndexWriter."""
+    from localindex import write_manifest
+    from statscatalog import write_stats_catalog
+
+    directory = tmp_path / 'localindex'
+    os.makedirs(directory / 'segments')
+    write_stats_catalog(str(directory / 'statscatalog'), 1, [], [])
+    write_manifest(str(directory), {'generation': 1, 'impact_bits': 16, 'zones': [], 'segments': [], 'next_segment': 0})
+    return str(directory)
+
+
+@pytest.fixture
+def search_index(monkeypatch, index_directory):
+    """search_engine.search() served from index_directory, with empty caches; call it to (re)open the index."""
+    import search_engine
+    from localindex import LocalIndex
+    from postingscache import PostingsCache
+    from resultcache import ResultCache
+    from searchbackend import LocalBackend
+
+    def open_index():
+        monkeypatch.setattr(search_engine, 'backend', LocalBackend(LocalIndex(index_directory)))
+    monkeypatch.setattr(search_engine, 'postings_cache', PostingsCache(1 << 20))
+    monkeypatch.setattr(search_engine, 'result_cache', ResultCache(0, 0))
+    monkeypatch.setattr(search_engine, 'title_index', None)
+    return open_index
+
+
+@pytest.fixture
+def client(monkeypatch):
+    """The FastAPI app (without warm-up) with search() ranking films 1 to 45 and no document store."""
+    from fastapi.testclient import TestClient
+    import main
+
+    monkeypatch.setattr(main, 'search', lambda query, vector, k: list(range(1, 46))[:k])
+    monkeypatch.setattr(main, 'doc_store', None)
+    return TestClient(main.app)
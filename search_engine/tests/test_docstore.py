@@ -0,0 +1,75 @@
+import json
+import random
+import pytest
+from docstore import (DocStore, build_doc_store, film_document, film_object, encode_token_offsets, decode_token_offsets,
+                      TOKEN_RE, TOKEN_OFFSETS_KEY)
+
+WORDS = "robot war love police village space music hero city family drama comedy Amélie İstanbul 東京".split()
+
+
+def corpus(count, seed=0):
+    rng = random.Random(seed)
+    return [
+        {'title': f'Film {i}', 'Plot': ' '.join(rng.choices(WORDS, k=rng.randint(5, 60))),
+         'Directed by': rng.choice(WORDS), 'Box office': None}
+        for i in range(count)
+    ]
+
+
+def write_corpus(path, films, invalid_lines=()):
+    with open(path, 'w') as f_w:
+        for line_number, film in enumerate(films, start=1):
+            f_w.write('{not json\n' if line_number in invalid_lines else json.dumps(film, ensure_ascii=False) + '\n')
+    return str(path)
+
+
+def stored_bytes(document):
+    return json.dumps(document, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+
+@pytest.mark.parametrize('count', [5, 300])  # Too few documents to train a dictionary, and enough
+def test_documents_round_trip_byte_for_byte(tmp_path, count):
+    films = corpus(count)
+    posters = {'Film 3': 'https://example.com/3.jpg'}
+    manifest = build_doc_store(write_corpus(tmp_path / 'films.jsonl', films, invalid_lines={2}), str(tmp_path / 'store'),
+                               posters, block_docs=4)
+    assert manifest['num_docs'] == count - 1 and manifest['max_doc_id'] == count
+    assert manifest['dictionary'] == (count > 5)
+
+    store = DocStore(str(tmp_path / 'store'))
+    doc_ids = list(range(1, count + 1))
+    for doc_id, document in zip(doc_ids, store.get_many(doc_ids)):
+        if doc_id == 2:
+            assert document is None
+        else:
+            film = films[doc_id - 1]
+            assert stored_bytes(document) == stored_bytes(film_document(film, posters.get(film['title'])))
+    assert store.get(4)['poster'] == 'https://example.com/3.jpg'
+
+
+def test_get_many_keeps_the_order_given_and_projects_fields(tmp_path):
+    films = corpus(10)
+    store_directory = str(tmp_path / 'store')
+    build_doc_store(write_corpus(tmp_path / 'films.jsonl', films), store_directory, block_docs=3)
+    store = DocStore(store_directory)
+
+    # Ids spread over several blocks, repeated, unknown and out of range
+    doc_ids = [9, 1, 0, 4, 9, 11, -3, 2]
+    documents = store.get_many(doc_ids, fields=['title', 'directed_by', 'no_such_field'])
+    assert [document and document['title'] for document in documents] == [
+        'Film 8', 'Film 0', None, 'Film 3', 'Film 8', None, None, 'Film 1'
+    ]
+    assert documents[1] == {'title': 'Film 0', 'directed_by': films[0]['Directed by']}
+
+    card = film_object(4, store.get(4))
+    assert set(card) == {'id', 'title', 'poster', 'film_details'}
+    assert set(card['film_details']) == {'plot', 'directed_by'}
+
+
+def test_token_offsets_decode_to_the_token_spans():
+    for text in ['', 'one', '  The  Dark—Knight (2008), İstanbul 東京 ' + 'x' * 70000 + ' end']:
+        spans = [list(match.span()) for match in TOKEN_RE.finditer(text)]
+        assert decode_token_offsets(encode_token_offsets(text)).tolist() == spans
+
+    document = film_document({'title': 'Up', 'Plot': 'a house flies'})
+    assert decode_token_offsets(document[TOKEN_OFFSETS_KEY]['plot']).tolist() == [[0, 1], [2, 7], [8, 13]]
@@ -0,0 +1,86 @@
+import os
+import json
+import importlib
+import numpy as np
+import pytest
+from indexsegment import Segment
+from indexwriter import tokenize_document
+
+BUILD_DIRECTORY = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'bm25architecture')
+
+
+@pytest.fixture
+def tfidfindexcreator(tmp_path, monkeypatch):
+    # The builder logs to jsonl_errors.log in the working directory as soon as it is imported
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.syspath_prepend(BUILD_DIRECTORY)
+    return importlib.import_module('tfidfindexcreator')
+
+
+def write_corpus(path, documents):
+    with open(path, 'w') as f_w:
+        for document in documents:
+            f_w.write(json.dumps(document) + '\n')
+    return str(path)
+
+
+def test_fields_with_colliding_cleaned_names_share_one_zone(tfidfindexcreator, tmp_path):
+    documents = [
+        {'title': 'Heat', 'box office': 'ten million'},
+        {'title': 'Ran', 'Box office': 'two million dollars'},
+        {'title': 'Up', 'Box office': 'million', 'box office': 'seven hundred million'},
+    ]
+    tfidfindexcreator.build_index(write_corpus(tmp_path / 'films.jsonl', documents), str(tmp_path))
+
+    segment = Segment(str(tmp_path / 'bm25segments' / 'box_office.seg'))
+    assert segment.doc_ids.tolist() == [1, 2, 3]
+    # Document 3 keeps 'box office', the last of its colliding fields in sorted order
+    assert segment.doc_lengths.tolist() == [2, 3, 3]
+    doc_ids, freqs = segment.postings('million')
+    assert doc_ids.tolist() == [1, 2, 3] and freqs.tolist() == [1, 1, 1]
+    assert segment.postings('seven')[0].tolist() == [3]
+
+    # The incremental writer tokenizes the same documents into the same zones
+    for doc_id, document in enumerate(documents, start=1):
+        zone_lengths = {zone: sum(counts.values()) for zone, counts in tokenize_document(document).items()}
+        assert zone_lengths['box_office'] == segment.lengths_of([doc_id])[0]
+
+    with open(tmp_path / 'bm25doclengths' / 'box_office.csv') as f:
+        assert f.read().split() == ['1,2', '2,3', '3,3']
+
+
+def built_files(directory):
+    """{relative path: bytes} of everything a build wrote, with the catalog's build timestamp left out."""
+    files = {}
+    for output in ('bm25indexdata', 'bm25doclengths', 'bm25segments', 'statscatalog'):
+        for name in sorted(os.listdir(os.path.join(directory, output))):
+            with open(os.path.join(directory, output, name), 'rb') as f:
+                files[f'{output}/{name}'] = f.read()
+    catalog = json.loads(files.pop('statscatalog/catalog.json'))
+    del catalog['version']
+    files['statscatalog/catalog.json'] = catalog
+    return files
+
+
+def test_parallel_build_is_byte_identical_to_serial(tfidfindexcreator, tmp_path):
+    rng = np.random.default_rng(9)
+    words = "robot war love police village space music hero city family drama comedy".split()
+    fields = ['plot', 'cast', 'Box office', 'box office', 'genre']
+    documents = [
+        {field: ' '.join(rng.choice(words, size=rng.integers(1, 12))) for field in rng.choice(fields, size=3, replace=False)}
+        for _ in range(200)
+    ]
+    corpus = write_corpus(tmp_path / 'films.jsonl', documents)
+
+    outputs = {}
+    for workers in (1, 3):
+        directory = tmp_path / f'workers{workers}'
+        os.makedirs(directory)
+        # A small run size so both builds spill and merge several runs
+        tfidfindexcreator.build_index(corpus, str(directory), max_run_postings=300, workers=workers)
+        outputs[workers] = built_files(str(directory))
+
+    assert 'bm25segments/box_office.seg' in outputs[1]
+    assert outputs[3].keys() == outputs[1].keys()
+    for path in outputs[1]:
+        assert outputs[3][path] == outputs[1][path], path
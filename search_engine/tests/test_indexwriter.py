@@ -0,0 +1,71 @@
+import os
+import pytest
+import localindex
+import search_engine
+from indexwriter import IndexWriter
+from localindex import LocalIndex, read_manifest
+
+
+def test_terms_new_to_the_index_are_searchable_after_commit(index_directory, search_index):
+    writer = IndexWriter(index_directory)
+    writer.add_documents([
+        (1, {'title': 'Steel Giant', 'plot': 'a robot learns to love'}),
+        (2, {'title': 'Night Patrol', 'plot': 'a police officer hunts a robot'}),
+        (3, {'title': 'Harvest', 'plot': 'a village waits for rain'}),
+    ])
+    writer.commit()
+    writer.add_documents([
+        (4, {'title': 'Zorblax', 'plot': 'zorblax the robot saves the village'}),
+        (5, {'title': 'Zorblax Returns', 'plot': 'the robot zorblax comes back'}),
+    ])
+    writer.commit()
+
+    search_index()
+    assert sorted(search_engine.search("zorblax robot", None)) == [4, 5]
+    assert search_engine.backend.zone_importance('zorblax').keys() == {'title', 'plot'}
+
+
+def test_commits_replace_the_stats_catalog(index_directory):
+    writer = IndexWriter(index_directory)
+    catalogs = []
+    for doc_id in (1, 2, 3):
+        writer.add_documents([(doc_id, {'plot': f'robot number {doc_id}'})])
+        writer.commit()
+        catalogs.append(writer.manifest['catalog'])
+
+    catalog = LocalIndex(index_directory).catalog
+    assert catalog.term_stats('robot')['plot'][0] == 3
+    assert catalog.term_stats('2')['plot'][0] == 1
+    # Only the catalogs of the current and the previous generation are kept
+    assert sorted(name for name in os.listdir(index_directory) if name.startswith('statscatalog')) == catalogs[1:]
+
+
+def test_the_replaced_manifest_can_still_be_opened_after_a_commit(index_directory, monkeypatch):
+    writer = IndexWriter(index_directory)
+    writer.add_documents([(doc_id, {'plot': f'robot number {doc_id}'}) for doc_id in (1, 2, 3)])
+    writer.commit()
+    writer.delete_documents([1])
+    writer.commit()
+    old_manifest = read_manifest(index_directory)
+    reader = LocalIndex(index_directory)
+
+    # New tombstones and a new catalog replace the ones old_manifest refers to
+    writer.delete_documents([2])
+    writer.add_documents([(4, {'plot': 'robot number 4'})])
+    writer.commit()
+
+    # A reader that read the manifest just before the commit replaced it
+    monkeypatch.setattr(localindex, 'read_manifest', lambda directory: old_manifest)
+    index = LocalIndex(index_directory)
+    assert index.generation == old_manifest['generation']
+    assert index.raw_postings('plot', 'robot')[0].tolist() == [2, 3]
+
+    # Two generations behind, its files are gone: reopen keeps serving the open snapshot
+    writer.delete_documents([3])
+    writer.commit()
+    assert reader.reopen() is reader
+    with pytest.raises(FileNotFoundError):
+        LocalIndex(index_directory)
+
+    monkeypatch.undo()
+    assert reader.reopen().raw_postings('plot', 'robot')[0].tolist() == [4]
@@ -0,0 +1,66 @@
+import random
+import struct
+import pytest
+import numpy as np
+from indexwriter import IndexWriter
+from localindex import LocalIndex
+from indexsegment import Segment, write_segment
+
+WORDS = "robot war love police village space music hero city family drama comedy".split()
+
+
+def films(first_doc_id, count, seed):
+    rng = random.Random(seed)
+    return [
+        (doc_id, {'title': ' '.join(rng.choices(WORDS, k=2)), 'plot': ' '.join(rng.choices(WORDS, k=rng.randint(3, 30)))})
+        for doc_id in range(first_doc_id, first_doc_id + count)
+    ]
+
+
+def assert_stored_impacts_are_exact(index):
+    """Stored impacts equal the ones computed from the live statistics, posting for posting."""
+    for zone, segment in list(index.stored_impacts.items()):
+        for term in segment.terms():
+            doc_ids, impacts = index.postings(zone, term)
+            del index.stored_impacts[zone]
+            computed_doc_ids, computed_impacts = index.postings(zone, term)
+            index.stored_impacts[zone] = segment
+            np.testing.assert_array_equal(doc_ids, computed_doc_ids)
+            np.testing.assert_array_equal(impacts, computed_impacts)
+
+
+def test_single_segment_zones_use_stored_impacts(index_directory):
+    writer = IndexWriter(index_directory)
+    writer.add_documents(films(1, 60, seed=1))
+    writer.commit()
+
+    index = LocalIndex(index_directory)
+    assert set(index.stored_impacts) == {'title', 'plot'}
+    assert_stored_impacts_are_exact(index)
+
+
+def test_stored_impacts_are_requantized_on_merge(index_directory):
+    writer = IndexWriter(index_directory)
+    writer.add_documents(films(1, 60, seed=1))
+    writer.commit()
+    writer.add_documents(films(61, 20, seed=2))
+    writer.delete_documents([3, 4])
+    writer.commit()
+
+    # Zones spread over two segments, with tombstones: impacts are computed when read
+    assert LocalIndex(index_directory).stored_impacts == {}
+
+    writer.merge([info['name'] for info in writer.manifest['segments']])
+    index = LocalIndex(index_directory)
+    assert set(index.stored_impacts) == {'title', 'plot'}
+    assert_stored_impacts_are_exact(index)
+
+
+def test_unsupported_segment_versions_name_the_supported_ones(tmp_path):
+    path = str(tmp_path / 'plot.seg')
+    write_segment(path, [('robot', [1, 2], [1, 3])], [1, 2], [4, 5])
+    with open(path, 'r+b') as f:
+        f.seek(4)
+        f.write(struct.pack('<H', 9))
+    with pytest.raises(ValueError, match='not a version 2 or 3 index segment'):
+        Segment(path)
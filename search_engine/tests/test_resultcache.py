@@ -0,0 +1,127 @@
+import time
+import asyncio
+import threading
+from boundedexecutor import BoundedExecutor
+from resultcache import ResultCache, SingleFlight
+
+
+def counting(results):
+    """compute() returning `results`, and the list of its calls."""
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return list(results)
+    return compute, calls
+
+
+def test_hits_return_the_cached_results():
+    cache = ResultCache(8, 60)
+    compute, calls = counting([3, 1, 2])
+    assert cache.get_or_compute(1, ('robot',), compute) == [3, 1, 2]
+    assert cache.get_or_compute(1, ('robot',), compute) == [3, 1, 2]
+    assert len(calls) == 1
+    assert cache.stats()['hits'] == 1 and cache.stats()['misses'] == 1
+
+    # Callers get their own list
+    cache.get_or_compute(1, ('robot',), compute).append(4)
+    assert cache.get_or_compute(1, ('robot',), compute) == [3, 1, 2]
+
+
+def test_a_new_generation_drops_every_entry():
+    cache = ResultCache(8, 60)
+    compute, calls = counting([1])
+    cache.get_or_compute(1, ('robot',), compute)
+    cache.get_or_compute(2, ('robot',), compute)
+    assert len(calls) == 2
+    assert cache.stats()['invalidations'] == 1 and cache.stats()['generation'] == 2
+
+
+def test_entries_expire_and_are_evicted_least_recently_used_first():
+    cache = ResultCache(2, 0.05)
+    compute, calls = counting([1])
+    cache.get_or_compute(1, ('a',), compute)
+    time.sleep(0.1)
+    cache.get_or_compute(1, ('a',), compute)
+    assert len(calls) == 2 and cache.stats()['expired'] == 1
+
+    cache = ResultCache(2, 60)
+    for key in (('a',), ('b',), ('a',), ('c',)):
+        cache.get_or_compute(1, key, compute)
+    # 'b' was the least recently used when 'c' came in
+    calls.clear()
+    cache.get_or_compute(1, ('a',), compute)
+    cache.get_or_compute(1, ('b',), compute)
+    assert len(calls) == 1 and cache.stats()['evictions'] == 2
+
+
+def test_concurrent_misses_compute_once():
+    cache = ResultCache(8, 60)
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return [7]
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_compute(1, ('robot',), compute))) for _ in range(4)]
+    threads[0].start()
+    started.wait(5)
+    for thread in threads[1:]:
+        thread.start()
+    while cache.stats()['coalesced'] < 3:
+        time.sleep(0.01)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert results == [[7]] * 4 and len(calls) == 1
+
+
+def test_single_flight_waiters_hold_no_executor_thread():
+    async def scenario():
+        # Two workers and no queue: a third concurrent executor call would be rejected
+        executor = BoundedExecutor('test', 2, 0)
+        flights = SingleFlight()
+        release = threading.Event()
+        calls = []
+
+        def search(query):
+            calls.append(query)
+            if query == 'popular':
+                release.wait(5)
+            return [len(query)]
+
+        popular = [asyncio.ensure_future(flights.run('popular', lambda: executor.run(search, 'popular'))) for _ in range(5)]
+        await asyncio.sleep(0.05)
+        # An unrelated query still finds a free worker while the popular one runs
+        assert await flights.run('rare', lambda: executor.run(search, 'rare')) == [4]
+        release.set()
+        results = await asyncio.gather(*popular)
+        executor.shutdown()
+        return results, calls, flights.stats(), executor.stats()
+
+    results, calls, flight_stats, executor_stats = asyncio.run(scenario())
+    assert results == [[7]] * 5
+    assert sorted(calls) == ['popular', 'rare']
+    assert flight_stats == {'calls': 2, 'coalesced': 4, 'in_flight': 0}
+    assert executor_stats['rejected'] == 0
+
+
+def test_a_cancelled_caller_does_not_cancel_the_shared_call():
+    async def scenario():
+        flights = SingleFlight()
+
+        async def call():
+            await asyncio.sleep(0.05)
+            return 'done'
+
+        first = asyncio.ensure_future(flights.run('key', call))
+        second = asyncio.ensure_future(flights.run('key', call))
+        await asyncio.sleep(0)
+        first.cancel()
+        return await second
+
+    assert asyncio.run(scenario()) == 'done'
@@ -0,0 +1,63 @@
+import time
+from resultsets import ResultSetStore
+
+
+def test_pages_split_the_ranked_list():
+    store = ResultSetStore(10, 1000, 60)
+    film_ids = list(range(100, 145))
+    cursor = store.put(film_ids, 20, 'robot')
+
+    assert store.page(cursor, 1) == (film_ids[:20], 3, 45, 'robot')
+    assert store.page(cursor, 2)[0] == film_ids[20:40]
+    # The last page is short and pages past the end are empty
+    assert store.page(cursor, 3)[0] == film_ids[40:]
+    assert store.page(cursor, 4)[0] == []
+
+    assert store.page(store.put(film_ids[:40], 20), 2)[:3] == (film_ids[20:40], 2, 40)
+    assert store.page(store.put([], 20), 1)[:3] == ([], 1, 0)
+
+
+def test_unknown_and_expired_cursors_are_gone():
+    store = ResultSetStore(10, 1000, 0.2)
+    assert store.page('no-such-cursor', 1) is None
+
+    cursor = store.put([1, 2, 3], 2)
+    kept = store.put([4, 5], 2)
+    time.sleep(0.12)
+    # Reading a set extends its lifetime
+    assert store.page(kept, 1) is not None
+    time.sleep(0.12)
+    assert store.page(cursor, 1) is None
+    assert store.page(kept, 2)[0] == []
+    assert store.stats()['expired'] == 1
+
+
+def test_least_recently_read_sets_are_evicted_first():
+    store = ResultSetStore(2, 10, 60)
+    first = store.put([1, 2, 3], 10)
+    second = store.put([4, 5, 6], 10)
+    store.page(first, 1)
+    store.put([7, 8, 9], 10)
+    assert store.page(second, 1) is None and store.page(first, 1) is not None
+
+    # Bounded by the ids held as well; a set larger than max_ids is still kept on its own
+    large = store.put(list(range(20)), 10)
+    assert store.page(first, 1) is None
+    assert store.page(large, 2)[0] == list(range(10, 20))
+    assert store.stats()['sets'] == 1 and store.stats()['ids'] == 20
+
+
+def test_paged_search_and_expired_cursor(client, monkeypatch):
+    import main
+    monkeypatch.setattr(main, 'result_sets', ResultSetStore(10, 1000, 0.05))
+    first = client.post('/search', json={'query': 'robot films', 'page_size': 20}).json()
+    assert first['results'] == list(range(1, 21))
+    assert (first['page'], first['pages'], first['total']) == (1, 3, 45)
+
+    last = client.post('/search/page', json={'cursor': first['cursor'], 'page': 3})
+    assert last.status_code == 200 and last.json()['results'] == list(range(41, 46))
+
+    time.sleep(0.1)
+    expired = client.post('/search/page', json={'cursor': first['cursor'], 'page': 2})
+    assert expired.status_code == 404
+    assert client.post('/search/page', json={'cursor': 'made-up', 'page': 1}).status_code == 404
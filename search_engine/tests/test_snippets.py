@@ -0,0 +1,53 @@
+import json
+from docstore import DocStore, build_doc_store, film_document
+from snippets import best_snippet, film_card, query_terms
+
+
+def highlighted(snippet):
+    return [snippet['text'][start:end] for start, end in snippet['highlights']]
+
+
+def test_highlights_are_offsets_of_the_query_terms_in_the_snippet():
+    plot = ' '.join(['Filler words before the story begins.'] * 12) + \
+        ' A lonely Robot builds a second robot, and the two robots go to war. ' + ' '.join(['Quiet ending.'] * 12)
+    document = film_document({'title': 'Steel', 'Plot': plot, 'Genre': 'robot film'})
+    snippet = best_snippet(document, query_terms("robot war"))
+
+    # The plot matches both terms, the genre only one
+    assert snippet['zone'] == 'plot'
+    assert snippet['text'].startswith('…') and snippet['text'].endswith('…')
+    assert highlighted(snippet) == ['Robot', 'robot', 'war']
+    # Whole tokens only: 'robots' is not highlighted
+    assert 'robots' in snippet['text']
+
+
+def test_zones_whose_lowercase_changes_length_are_highlighted_from_the_same_matches():
+    # 'İ' lowercases to two characters; 'stanbul' is a token of the lowercased text only
+    document = film_document({'title': 'Trip', 'Plot': 'Two friends travel from İstanbul to Ankara with a robot and a robot dog'})
+    snippet = best_snippet(document, {'stanbul', 'robot'})
+    assert highlighted(snippet) == ['robot', 'robot']
+
+    document = film_document({'title': 'Trip', 'Plot': 'İzmir, İstanbul', 'Cast': 'a Robot'})
+    snippet = best_snippet(document, {'stanbul', 'robot'})
+    assert snippet['zone'] == 'cast' and highlighted(snippet) == ['Robot']
+
+    snippet = best_snippet(film_document({'title': 'Trip', 'Plot': 'İstanbul, then ANKARA and ankara'}), {'ankara'})
+    assert highlighted(snippet) == ['ANKARA', 'ankara']
+
+
+def test_highlights_use_the_stored_token_offsets(tmp_path):
+    films = [{'title': 'Trip', 'Plot': 'From  İstanbul—to Ankara: a robot road trip'}]
+    with open(tmp_path / 'films.jsonl', 'w') as f_w:
+        for film in films:
+            f_w.write(json.dumps(film, ensure_ascii=False) + '\n')
+    build_doc_store(str(tmp_path / 'films.jsonl'), str(tmp_path / 'store'))
+    card = film_card(1, DocStore(str(tmp_path / 'store')).get(1), ['plot'], query_terms("Ankara robot"))
+    assert highlighted(card['snippet']) == ['Ankara', 'robot']
+    assert card['film_details'] == {'plot': films[0]['Plot']}
+
+
+def test_films_need_a_bounded_result_list(client):
+    assert client.post('/search', json={'query': 'robot', 'fields': ['language']}).status_code == 400
+    response = client.post('/search', json={'query': 'robot', 'fields': ['language'], 'k': 5})
+    assert response.status_code == 200 and response.json()['results'] == [1, 2, 3, 4, 5]
+    assert client.post('/search', json={'query': 'robot'}).json()['results'] == list(range(1, 46))
@@ -0,0 +1,34 @@
+import os
+import numpy as np
+from statscatalog import StatsCatalog, write_stats_catalog
+
+ZONE_STATS = [('plot', 10, 120), ('cast', 8, 40)]
+ROWS = [(b'robot', [(0, 0.123, 4), (1, 0.7, 1)]), (b'war', [(1, 1.005, 2)])]
+
+
+def test_zone_importances_read_back_as_written(tmp_path):
+    write_stats_catalog(str(tmp_path), 1, ZONE_STATS, ROWS)
+    catalog = StatsCatalog(str(tmp_path))
+    assert catalog.zone_importance('robot') == {'cast': 0.7, 'plot': 0.123}
+    assert catalog.zone_importance('war') == {'cast': 1.005}
+    assert catalog.term_stats('robot')['plot'][0] == 4
+
+
+def test_float32_catalogs_are_rounded_to_the_csv_precision(tmp_path):
+    write_stats_catalog(str(tmp_path), 1, ZONE_STATS, ROWS)
+    scores = np.load(tmp_path / 'scores.npy')
+    np.save(tmp_path / 'scores.npy', scores.astype(np.float32))
+    assert StatsCatalog(str(tmp_path)).zone_importance('robot') == {'cast': 0.7, 'plot': 0.123}
+
+
+def test_rewriting_a_catalog_replaces_its_files(tmp_path):
+    write_stats_catalog(str(tmp_path), 1, ZONE_STATS, ROWS)
+    inodes = {name: os.stat(tmp_path / name).st_ino for name in os.listdir(tmp_path)}
+    write_stats_catalog(str(tmp_path), 2, ZONE_STATS, ROWS[:1])
+
+    # New files renamed into place: a reader holding the old ones keeps reading them intact
+    assert sorted(os.listdir(tmp_path)) == sorted(inodes)
+    for name, inode in inodes.items():
+        assert os.stat(tmp_path / name).st_ino != inode, name
+    catalog = StatsCatalog(str(tmp_path))
+    assert catalog.version == 2 and catalog.zone_importance('war') is None
@@ -0,0 +1,76 @@
+import json
+import pytest
+from titleindex import TitleIndex, build_title_index, max_edits
+
+TITLES = ["Brave", "Batman", "Inception", "The Dark Knight", "Amélie"]
+
+
+@pytest.fixture
+def title_index(tmp_path):
+    films = tmp_path / 'allfilms.jsonl'
+    films.write_text(''.join(json.dumps({'title': title}) + '\n' for title in TITLES))
+    build_title_index(str(films), str(tmp_path / 'titleindex'))
+    return TitleIndex(str(tmp_path / 'titleindex'))
+
+
+def test_typo_budget_boundaries():
+    assert max_edits('brave') == 0
+    assert max_edits('batman') == 1
+    assert max_edits('inceptionx') == 1
+    assert max_edits('inceptionxx') == 2
+
+
+def test_queries_of_five_characters_or_fewer_must_match_exactly(title_index):
+    assert title_index.match("Brave!") == [1]
+    assert title_index.match("bravo") == []
+    assert title_index.match("amelie") == [5]
+
+
+def test_longer_queries_tolerate_typos(title_index):
+    assert title_index.match("batmen") == [2]
+    assert title_index.match("incepton") == [3]
+    assert title_index.match("the drk knigt") == [4]
+    assert title_index.match("batmxyz") == []
+
+
+@pytest.fixture
+def title_search(tmp_path, monkeypatch, index_directory, search_index):
+    """A local index and a title index of the same films; returns the IndexWriter."""
+    import search_engine
+    from indexwriter import IndexWriter
+
+    films = [{'title': 'The Dark Knight', 'plot': 'batman fights the joker in a dark city'}]
+    films += [{'title': f'Knight {i}', 'plot': f'a dark knight rides out, chapter {i}'} for i in range(2, 61)]
+    writer = IndexWriter(index_directory)
+    writer.add_documents(enumerate(films, start=1))
+    writer.commit()
+    path = tmp_path / 'allfilms.jsonl'
+    path.write_text(''.join(json.dumps(film) + '\n' for film in films))
+    build_title_index(str(path), str(tmp_path / 'titleindex'))
+
+    search_index()
+    monkeypatch.setattr(search_engine, 'title_index', TitleIndex(str(tmp_path / 'titleindex')))
+    return writer
+
+
+def test_title_matches_come_first_without_truncating_the_results(title_search):
+    import search_engine
+
+    results = search_engine.search("The Dark Knight", None)
+    assert results[0] == 1
+    # Without k, the title match heads the full ranked list, as any other query returns
+    ranked = search_engine.get_search_results(['the', 'dark', 'knight'], None)
+    assert len(ranked) == 60
+    assert results == [1] + [film_id for film_id in ranked if film_id != 1]
+
+    assert search_engine.search("The Dark Knight", None, k=3) == results[:3]
+
+
+def test_deleted_films_are_not_title_matches(title_search, search_index):
+    import search_engine
+
+    title_search.delete_documents([1])
+    title_search.commit()
+    search_index()
+    assert search_engine.title_match(['the', 'dark', 'knight']) == []
+    assert 1 not in search_engine.search("The Dark Knight", None)
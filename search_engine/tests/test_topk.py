@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+from search_engine import score_query_terms, rank_relaxation_level, score_top_k
+
+
+class Postings:
+    """Stands in for QueryPostingsMemo: {(zone, word): (doc_ids, impacts)}."""
+
+    def __init__(self, postings):
+        self._postings = postings
+
+    def postings(self, zone, word):
+        return self._postings.get((zone, word))
+
+
+def exhaustive(query_data, words, word_zones):
+    partial_scores, coverage = score_query_terms(query_data, words, word_zones)
+    return rank_relaxation_level(partial_scores, coverage, list(range(len(words))))
+
+
+def test_top_k_is_a_prefix_of_the_exhaustive_ranking_with_tied_scores():
+    # Films 1..40 contain both words; every third film shares one score, the rest share another
+    doc_ids = np.arange(1, 41)
+    query_data = Postings({
+        ('plot', 'robot'): (doc_ids, np.where(doc_ids % 3 == 0, 50, 20).astype(np.uint16)),
+        ('plot', 'war'): (doc_ids, np.full(len(doc_ids), 10, dtype=np.uint16)),
+        ('title', 'war'): (doc_ids[::2], np.full(len(doc_ids[::2]), 30, dtype=np.uint16)),
+    })
+    words = ['robot', 'war']
+    word_zones = {'robot': {'plot'}, 'war': {'plot', 'title'}}
+
+    ranking = exhaustive(query_data, words, word_zones)
+    assert len(ranking) == 40
+    for k in range(1, 42):
+        top, total = score_top_k(query_data, words, word_zones, k)
+        assert total == 40
+        assert top == ranking[:k]
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_top_k_matches_exhaustive_ranking_on_random_ties(seed):
+    rng = np.random.default_rng(seed)
+    postings, word_zones = {}, {}
+    words = ['a', 'b', 'c']
+    for word in words:
+        word_zones[word] = {'plot', 'cast'}
+        for zone in word_zones[word]:
+            doc_ids = np.sort(rng.choice(np.arange(1, 300), size=120, replace=False))
+            # Few distinct impacts, so many films tie
+            postings[(zone, word)] = (doc_ids, rng.integers(1, 4, size=len(doc_ids)).astype(np.uint16))
+    query_data = Postings(postings)
+
+    ranking = exhaustive(query_data, words, word_zones)
+    for k in (1, 2, 5, 10, len(ranking), len(ranking) + 3):
+        top, total = score_top_k(query_data, words, word_zones, k)
+        assert total == len(ranking)
+        assert top == ranking[:k]
@@ -0,0 +1,176 @@
+"""
+Film title lookup for navigational queries (the query is just a film's title): an exact map
+from normalized title to docIDs, and a character trigram index for titles within a few edits.
+
+    python titleindex.py build bm25architecture/allfilms.jsonl titleindex
+    python titleindex.py match titleindex "the dark knigth"
+"""
+
+import os
+import sys
+import json
+import argparse
+import unicodedata
+from collections import defaultdict
+import numpy as np
+from docstore import TOKEN_RE
+
+TITLE_INDEX_FILE = 'titles.json'
+TITLE_INDEX_VERSION = 1
+GRAM_SIZE = 3
+
+# Where `python titleindex.py build ...` writes the index
+TITLE_INDEX_DIR = os.environ.get('FILMSEARCH_TITLE_INDEX_DIR', os.path.join(os.path.dirname(__file__), 'titleindex'))
+
+
+def normalize_title(text):
+    """Lowercase, accents removed, tokens joined by single spaces: "Amélie!" and "amelie" are one title."""
+    folded = ''.join(c for c in unicodedata.normalize('NFKD', text.lower()) if not unicodedata.combining(c))
+    return ' '.join(TOKEN_RE.findall(folded))
+
+
+def title_grams(normalized):
+    padded = f'^{normalized}$'
+    return {padded[i:i + GRAM_SIZE] for i in range(len(padded) - GRAM_SIZE + 1)}
+
+
+def max_edits(normalized):
+    """Typos tolerated for a query of this length; short queries must match exactly."""
+    if len(normalized) <= 5:
+        return 0
+    if len(normalized) <= 10:
+        return 1
+    return 2
+
+
+def edit_distance(a, b, limit):
+    """Levenshtein distance of a and b, or limit + 1 once it is certain to exceed limit."""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, start=1):
+        current = [i]
+        for j, cb in enumerate(b, start=1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+def build_title_index(input_file, directory, first_doc_id=1):
+    """Write the title index of a JSONL file; docIDs are line numbers starting at first_doc_id, like the index."""
+    keys = {}  # normalized title -> docIDs
+    with open(input_file, 'r') as f:
+        for doc_id, line in enumerate(f, start=first_doc_id):
+            try:
+                title = json.loads(line).get('title')
+            except json.JSONDecodeError:
+                print(f"Skipping line {doc_id}: invalid JSON")
+                continue
+            normalized = normalize_title(title or '')
+            if normalized:
+                keys.setdefault(normalized, []).append(doc_id)
+
+    titles = sorted(keys)
+    grams = defaultdict(list)
+    for position, normalized in enumerate(titles):
+        for gram in title_grams(normalized):
+            grams[gram].append(position)
+
+    os.makedirs(directory, exist_ok=True)
+    index = {
+        'version': TITLE_INDEX_VERSION,
+        'titles': titles,
+        'doc_ids': [keys[normalized] for normalized in titles],
+        'grams': grams
+    }
+    path = os.path.join(directory, TITLE_INDEX_FILE)
+    with open(path + '.tmp', 'w') as f_w:
+        json.dump(index, f_w, ensure_ascii=False, separators=(',', ':'))
+    os.replace(path + '.tmp', path)
+    return len(titles)
+
+
+class TitleIndex:
+    """In-memory title lookup; match() returns the docIDs of a title the query confidently names."""
+
+    def __init__(self, directory):
+        with open(os.path.join(directory, TITLE_INDEX_FILE), 'r') as f:
+            index = json.load(f)
+        if index['version'] != TITLE_INDEX_VERSION:
+            raise ValueError(f"Unsupported title index in {directory}: version {index['version']}")
+        self.titles = index['titles']
+        self.doc_ids = index['doc_ids']
+        # Trigram postings as arrays, so candidate counting is one bincount over a few postings
+        self.grams = {gram: np.array(positions, dtype=np.int32) for gram, positions in index['grams'].items()}
+        self.lengths = np.array([len(normalized) for normalized in self.titles], dtype=np.int32)
+        self.positions = {normalized: position for position, normalized in enumerate(self.titles)}
+
+    def __len__(self):
+        return len(self.titles)
+
+    def candidates(self, normalized, edits):
+        """Titles sharing enough trigrams to be within `edits` edits; each edit removes at most GRAM_SIZE trigrams."""
+        query_grams = title_grams(normalized)
+        postings = [self.grams[gram] for gram in query_grams if gram in self.grams]
+        if not postings:
+            return []
+        shared = np.bincount(np.concatenate(postings), minlength=len(self.titles))
+        needed = max(len(query_grams) - GRAM_SIZE * edits, 1)
+        close_length = np.abs(self.lengths - len(normalized)) <= edits
+        return np.flatnonzero((shared >= needed) & close_length).tolist()
+
+    def match(self, query):
+        """
+        DocIDs of the film(s) whose title the query is, exactly after normalization or within
+        max_edits() typos; [] unless one title is strictly closer than every other.
+        """
+        normalized = normalize_title(query)
+        if not normalized:
+            return []
+        position = self.positions.get(normalized)
+        if position is not None:
+            return list(self.doc_ids[position])
+        edits = max_edits(normalized)
+        if edits == 0:
+            return []
+        best, best_distance, tied = None, edits + 1, False
+        for position in self.candidates(normalized, edits):
+            distance = edit_distance(normalized, self.titles[position], min(best_distance, edits))
+            if distance < best_distance:
+                best, best_distance, tied = position, distance, False
+            elif distance == best_distance and distance <= edits:
+                tied = True
+        if best is None or tied:
+            return []
+        return list(self.doc_ids[best])
+
+
+def load_title_index(directory=TITLE_INDEX_DIR):
+    """The title index at `directory`, or None if it has not been built."""
+    if not os.path.exists(os.path.join(directory, TITLE_INDEX_FILE)):
+        return None
+    return TitleIndex(directory)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build or query the film title index.")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    build = commands.add_parser('build', help="build the index from allfilms.jsonl")
+    build.add_argument('input_file')
+    build.add_argument('directory', nargs='?', default=TITLE_INDEX_DIR)
+    build.add_argument('--first-doc-id', type=int, default=1)
+
+    match = commands.add_parser('match', help="print the docIDs a query confidently names")
+    match.add_argument('directory')
+    match.add_argument('query')
+
+    args = parser.parse_args()
+    if args.command == 'build':
+        count = build_title_index(args.input_file, args.directory, args.first_doc_id)
+        print(f"Indexed {count} distinct titles in {args.directory}")
+    else:
+        json.dump(TitleIndex(args.directory).match(args.query), sys.stdout)
+        sys.stdout.write('\n')
@@ -1,4 +1,4 @@
-from sentence_transformers import SentenceTransformer
+from sentenceencoder import MODEL_NAME, get_encoder
 
-# Load a small, fast SBERT model
-model = SentenceTransformer('all-MiniLM-L6-v2')
\ No newline at end of file
+# The shared sentence encoder (PyTorch, or the int8 ONNX export with ENCODER_BACKEND=onnx).
+# Call get_encoder() where it is needed: importing this module does not load the model.
@@ -0,0 +1,67 @@
+import os
+import numpy as np
+from embeddingstore import MANIFEST_FILE, EmbeddingStore, normalize_rows, write_embedding_store
+
+# zonedetailscreate.py writes the zone embedding store next to itself
+ZONE_EMBEDDINGS_DIR = os.environ.get(
+    'FILMSEARCH_ZONE_EMBEDDINGS_DIR', os.path.join(os.path.dirname(__file__), 'bm25architecture', 'zone_embeddings')
+)
+
+# Similarities are rounded like the original per-zone cosine_similarity calls, so ties rank the same
+SIMILARITY_DECIMALS = 4
+
+
+def cosine_similarity(vector1, vector2):
+    """Cosine similarity of two vectors, rounded like the zone matrix similarities; 0 if either is all zeros."""
+    vector1 = np.asarray(vector1, dtype=np.float64).ravel()
+    vector2 = np.asarray(vector2, dtype=np.float64).ravel()
+    norms = np.linalg.norm(vector1) * np.linalg.norm(vector2)
+    return round(float(vector1 @ vector2 / norms), SIMILARITY_DECIMALS) if norms else 0.0
+
+
+def write_zone_matrix(directory, zone_names, vectors, model_name):
+    """Store zone embeddings as a row-normalized embedding store keyed by zone name."""
+    write_embedding_store(directory, zone_names, vectors, model_name)
+
+
+class ZoneMatrix:
+    """Pre-normalized zone embeddings: cosine similarity to every zone is one matrix-vector product."""
+
+    def __init__(self, directory):
+        store = EmbeddingStore(directory)
+        if not store.normalized:
+            raise ValueError(f"Zone embeddings in {directory} are not normalized.")
+        self.model_name = store.model_name
+        # A few hundred zones: read the whole matrix once rather than paging it per query
+        self.matrix = np.array(store.vectors)
+        self.zone_names = store.ids
+        self.rows = store.rows
+
+    def similarities(self, query_vector, zones=None):
+        """
+        {zone: cosine similarity to query_vector} for `zones` (every zone by default), in the
+        order given. Zones without an embedding are left out.
+        """
+        query = normalize_rows(np.asarray(query_vector, dtype=np.float32).reshape(1, -1))[0]
+        if np.isnan(query).any():
+            raise ValueError("The query vector contains NaN values.")
+        if len(query) != self.matrix.shape[1]:
+            raise ValueError(f"Query vector has {len(query)} dimensions, the zone embeddings ({self.model_name}) have {self.matrix.shape[1]}.")
+        if zones is None:
+            zones, scores = self.zone_names, self.matrix @ query
+        else:
+            zones = [zone for zone in zones if zone in self.rows]
+            scores = self.matrix[[self.rows[zone] for zone in zones]] @ query
+        return dict(zip(zones, np.round(scores.astype(np.float64), SIMILARITY_DECIMALS).tolist()))
+
+    def top_k_zones(self, query_vector, k, zones=None):
+        """The k zones most similar to query_vector as [(zone, similarity)], best first; ties keep input order."""
+        similarities = self.similarities(query_vector, zones)
+        return sorted(similarities.items(), key=lambda item: item[1], reverse=True)[:k]
+
+
+def load_zone_matrix(directory=ZONE_EMBEDDINGS_DIR):
+    """The zone embedding matrix in `directory`, or None if zonedetailscreate.py has not written it."""
+    if not os.path.exists(os.path.join(directory, MANIFEST_FILE)):
+        return None
+    return ZoneMatrix(directory)
@@ -22,6 +22,8 @@ export const unstructuredinfoEndpoint = process.env.UNSTRUCTUREDINFO_QUERY
 
 //search engine fastapi endpoint
 export const searchapiEndpoint = process.env.SEARCH_ENDPOINT
+export const searchpageEndpoint = process.env.SEARCH_PAGE_ENDPOINT
+export const filmsEndpoint = process.env.FILMS_ENDPOINT
 
 //film chat fastapi endpoint
 export const filmchatEndpoint = process.env.FILMCHAT_ENDPOINT
@@ -1,22 +1,33 @@
-import axios from "axios";
 import { getfilmobject } from "./filmdetailscontroller.js";  // Import the getfilmobject function
+import { filmsEndpoint } from "../config.js";
+import axios from "axios";
 
-// Searchengine function that manages pagination
-export const getlistoffilmobjects = async (pagefilmidobject, pagenumber) => {
+// Get the film objects for the film ids of one page
+export const getlistoffilmobjects = async (pagefilmlist) => {
 
     let pagefilmobjectlist = []
-    console.log(pagenumber)
-    console.log(pagefilmidobject)
-    const formattedPageNumber = String(pagenumber)
-    //first get the filmlist to iterate over based on page number
-    const pagefilmlist = pagefilmidobject[formattedPageNumber]
+    console.log(pagefilmlist)
 
-    //iterate through the filmlist and get the object for each of them and put it into a big list
     try {
+        //get the whole page from the search API's document store in one request, if it is configured
+        if (filmsEndpoint) {
+            try {
+                const response = await axios.post(filmsEndpoint, {
+                    ids: pagefilmlist
+                });
+                pagefilmobjectlist = response.data.films
+            } catch (error) {
+                console.error("Films request failed, falling back to get_film_object:", error.message);
+                pagefilmobjectlist = []
+            }
+        }
+
+        //iterate through the filmlist and get the object for each film the document store did not return
         for (let film in pagefilmlist) {
-            //get the filmobject
-            const movieobject = await getfilmobject(pagefilmlist[film])
-            pagefilmobjectlist.push(movieobject)
+            if (!pagefilmobjectlist[film]) {
+                //get the filmobject
+                pagefilmobjectlist[film] = await getfilmobject(pagefilmlist[film])
+            }
         }
 
         return pagefilmobjectlist
@@ -1,59 +1,42 @@
-import { searchapiEndpoint, encodeEndpoint } from "../config.js";
+import { searchapiEndpoint, searchpageEndpoint } from "../config.js";
 import axios from "axios";
-import { getfilmobject } from "./filmdetailscontroller.js";  // Import the getfilmobject function
 
-// Searchengine function that manages pagination
-export const searchengine = async (query) => {
-    // Step 1: Retrieve the query vector using the encode endpoint
-    const vec_response = await axios.post(encodeEndpoint, {
-        sentence: query
-    });
-    const query_vector = vec_response.data;
-
-    const pagefilmidobject = {}
-
-    const no_films_perpage = 18
+const no_films_perpage = 18
 
+// Searchengine function: the search API keeps the ranked list and returns the first page of film ids with a cursor for the rest.
+// Pages come with result cards (the fields a card shows plus a highlighted snippet) when the search API has a document store
+export const searchengine = async (query) => {
     try {
-        // Step 2: Send the query and vector to the search API to get all film IDs
+        // Send the query to the search API
         const response = await axios.post(searchapiEndpoint, {
             query: query,
-            vector: query_vector
+            page_size: no_films_perpage
         });
-        const film_ids = response.data.results;  // Retrieve all film IDs from the search API
-
-        const no_of_films = film_ids.length
 
+        // films is only present when the search API has a document store
+        return {filmids: response.data.results, films: response.data.films, cursor: response.data.cursor, noofpages: response.data.pages}
 
-        let no_of_pages = 1
-
-        //a code to get the number of pages
-        if (no_of_films < no_films_perpage || no_of_films == no_films_perpage) {
-            no_of_pages = 1
-        }
+    } catch (error) {
+        console.error("Search request failed:", error);
+        throw error;
+    }
+}
 
-        else {
-            const extrafilms = no_of_films%no_films_perpage
-            no_of_pages = ((no_of_films - extrafilms) / no_films_perpage) + 1
-        }
+// Get the film ids of one page of an earlier search from its cursor; null if the search API no longer has the result set
+export const searchpage = async (cursor, pagenumber) => {
+    try {
+        const response = await axios.post(searchpageEndpoint, {
+            cursor: cursor,
+            page: Number(pagenumber)
+        });
 
-        // Step 3: Create a dictionary with page number as key and a list of filmids as the value
-        for (let page = 0; page < no_of_pages; page++) {
-            const extrafilms = no_of_films%no_films_perpage
-            const startfilm = (page)*no_films_perpage
-            const endfilm = (page)*no_films_perpage + no_films_perpage - 1
-            const pagenumber = page+1
-            if (pagenumber != no_of_pages) {
-                pagefilmidobject[pagenumber] = film_ids.slice(startfilm, endfilm + 1)
-            }
-            else{
-                pagefilmidobject[pagenumber] = film_ids.slice(startfilm, startfilm + extrafilms + 1)
-            }
-        }
-        return {filmobject:pagefilmidobject, noofpages:no_of_pages}
+        return {filmids: response.data.results, films: response.data.films, noofpages: response.data.pages}
 
     } catch (error) {
-        console.error("Search request failed:", error);
+        if (error.response && error.response.status === 404) {
+            return null
+        }
+        console.error("Search page request failed:", error);
         throw error;
     }
 }
@@ -4,7 +4,7 @@ import { port, supabaseUrl, supabaseKey, clientUrl, sessionSecret } from "./conf
 import { createClient } from "@supabase/supabase-js";
 import cors from 'cors';
 import bodyParser from 'body-parser';
-import { searchengine } from "./controller/searchcontroller.js";
+import { searchengine, searchpage } from "./controller/searchcontroller.js";
 import { getlistoffilmobjects } from "./controller/pageresultscontroller.js";
 import { filmchatengine } from "./controller/filmchatcontroller.js";
 
@@ -67,6 +67,20 @@ app.listen(port, () => {
     console.log(`We are live on port: ${port}`)
 })
 
+// Film cards of one page: the ones the search API returned, the full film object for any it could not
+const filmcards = async (searchResult) => {
+    const films = searchResult.films
+    if (!films) {
+        return await getlistoffilmobjects(searchResult.filmids)
+    }
+    const missing = searchResult.filmids.filter((filmid, index) => !films[index])
+    if (missing.length > 0) {
+        const missingobjects = await getlistoffilmobjects(missing)
+        return films.map((film) => film || missingobjects.shift())
+    }
+    return films
+}
+
 //an endpoint to catch the query from the client side and give the list of films back, handled appropriately for multiple sessions
 app.post('/api/userquery', async (req, res) => {
     req.setTimeout(300000); // 5 minutes
@@ -78,20 +92,21 @@ app.post('/api/userquery', async (req, res) => {
         const { query } = req.body;
         console.log(`User query: ${query}`);
         const searchResult = await searchengine(query);
-        req.session.film_list = searchResult;
-        const filmobjects = searchResult.filmobject
-        filmList = await getlistoffilmobjects(searchResult.filmobject, 1); // Get film objects for the first page
+        // The ranked list stays with the search API; only its cursor is kept
+        const cursor = searchResult.cursor
+        req.session.search_cursor = cursor;
+        filmList = await filmcards(searchResult); // Get film cards for the first page
         noofpages = searchResult.noofpages;
 
-        // Send both film list and the number of pages to the frontend
-        res.json({ filmList, noofpages,  filmobjects});
+        // Send the film list, the number of pages and the cursor for the other pages to the frontend
+        res.json({ filmList, noofpages, cursor });
     } catch (err) {
         console.error(err);
         res.status(500).json({ error: "An error occurred while processing your request." });
     }
 });
 
-//an endpoint which will take the page number and the filmobjectidlist and return a list of filmobjects for that page
+//an endpoint which will take the page number and the search cursor and return a list of filmobjects for that page
 app.post('/api/pagequery', async (req, res) => {
     req.setTimeout(300000); // 5 minutes
     try {
@@ -99,8 +114,13 @@ app.post('/api/pagequery', async (req, res) => {
 
         // Retrieve film objects for the requested page number
         const pageNumber = req.body.pageNumber
-        const filmobjectlist = req.body.filmobjectlist
-        filmList = await getlistoffilmobjects(filmobjectlist, pageNumber);
+        const cursor = req.body.cursor || req.session.search_cursor
+        const pageResult = cursor ? await searchpage(cursor, pageNumber) : null;
+        if (!pageResult) {
+            // The search API has dropped this result set; the client has to search again
+            return res.status(410).json({ error: "These search results have expired, please search again." });
+        }
+        filmList = await filmcards(pageResult);
         // Send both film list and the number of pages to the frontend
         res.json({ filmList });
     } catch (err) {
@@ -109,6 +129,21 @@ app.post('/api/pagequery', async (req, res) => {
     }
 });
 
+//an endpoint which will take a film id and return the full film object, loaded when the user opens a film
+app.post('/api/filmdetails', async (req, res) => {
+    try {
+        const filmid = req.body.filmid
+        const [filmobject] = await getlistoffilmobjects([filmid]);
+        if (!filmobject) {
+            return res.status(404).json({ error: "Film not found." });
+        }
+        res.json(filmobject);
+    } catch (err) {
+        console.error(err);
+        res.status(500).json({ error: "An error occurred while processing your request." });
+    }
+});
+
 //an endpoint which will take the filmobject and user question within the film chat feature
 app.post('/api/filmchatquestion', async (req, res) => {
     req.setTimeout(300000); // 5 minutes